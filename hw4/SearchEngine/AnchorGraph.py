@@ -0,0 +1,90 @@
+# 锚文本反转：锚文本描述的是链接指向的页面，而不是链接所在的页面。
+# 读取索引中每个页面的出链（outlinks），按目标页面汇总去重后的入链锚文本和次数，
+# 写回目标页面的anchor_text（普通text字段）和inlinks（入链页面数）。
+
+from collections import Counter
+
+# 单条锚文本的最大长度，超过的部分截掉
+MAX_ANCHOR_LENGTH = 100
+# 同一锚文本在anchor_text中最多重复的次数：次数越多词频越高，但不会无限增长
+MAX_REPEAT = 5
+# 每个目标页面最多保留的不同锚文本数（按次数取前N个）
+MAX_TEXTS_PER_TARGET = 200
+# 这些锚文本不描述目标页面的内容
+IGNORED_ANCHORS = {"", "更多", "more", "更多>>", ">>", "详细", "详情", "点击这里", "click here", "here", "首页", "返回"}
+
+
+def normalize_anchor_text(text):
+    """合并空白并截断，忽略的锚文本返回空字符串"""
+    text = " ".join((text or "").split())[:MAX_ANCHOR_LENGTH]
+    return "" if text.lower() in IGNORED_ANCHORS else text
+
+
+def invert_anchors(pages, doc_id, known_ids=None, link_graph=None):
+    """反转链接图
+
+    pages为(url, outlinks)的可迭代对象，outlinks为[{"anchor_text", "target_url"}, ...]；
+    doc_id把URL转换为文档_id，known_ids不为None时只保留指向其中文档的链接；
+    link_graph（如PageRank.LinkGraphBuilder）不为None时同时把每个页面的出链加入其中。
+    返回({目标_id: Counter(锚文本 -> 使用该锚文本链接过来的页面数)}, {目标_id: 入链页面数})，
+    同一页面对同一目标的同一锚文本只计一次，页面指向自身的链接不计。
+    """
+    inbound = {}
+    inlinks = Counter()
+    for url, outlinks in pages:
+        source_id = doc_id(url)
+        seen = set()
+        targets = set()
+        for anchor in outlinks or ():
+            try:
+                target_id = doc_id(anchor["target_url"])
+            except (KeyError, ValueError):
+                continue
+            if target_id == source_id or (known_ids is not None and target_id not in known_ids):
+                continue
+            targets.add(target_id)
+            text = normalize_anchor_text(anchor.get("anchor_text"))
+            if text and (target_id, text) not in seen:
+                seen.add((target_id, text))
+                inbound.setdefault(target_id, Counter())[text] += 1
+        inlinks.update(targets)
+        if link_graph is not None:
+            link_graph.add(source_id, targets)
+    return inbound, inlinks
+
+
+def anchor_fields(counts, inlink_count):
+    """目标页面的anchor_text和inlinks字段"""
+    anchor_text = []
+    for text, count in counts.most_common(MAX_TEXTS_PER_TARGET) if counts else ():
+        anchor_text.extend([text] * min(count, MAX_REPEAT))
+    return {"anchor_text": anchor_text, "inlinks": inlink_count}
+
+
+def anchor_update_actions(index, inbound, inlinks, previous_ids=(), extra_fields=None):
+    """生成部分更新动作：有入链的页面写入新的锚文本，之前有入链、现在没有的页面清空
+
+    extra_fields为{_id: {字段: 值}}时一并写入（如PageRank），每个文档只生成一个更新动作
+    """
+    extra_fields = extra_fields or {}
+    for target_id, inlink_count in inlinks.items():
+        doc = anchor_fields(inbound.get(target_id), inlink_count)
+        doc.update(extra_fields.get(target_id, ()))
+        yield {"_op_type": "update", "_index": index, "_id": target_id, "doc": doc}
+    cleared = set()
+    for target_id in previous_ids:
+        if target_id not in inlinks:
+            cleared.add(target_id)
+            doc = {"anchor_text": [], "inlinks": 0}
+            doc.update(extra_fields.get(target_id, ()))
+            yield {"_op_type": "update", "_index": index, "_id": target_id, "doc": doc}
+    for target_id, fields in extra_fields.items():
+        if target_id not in inlinks and target_id not in cleared:
+            yield {"_op_type": "update", "_index": index, "_id": target_id, "doc": dict(fields)}
+
+
+if __name__ == "__main__":
+    # 单独运行时更新当前索引（别名web_pages）的入链锚文本和PageRank，Index.py建索引时会自动调用
+    import Index
+
+    Index.update_link_features(Index.index_name)
@@ -0,0 +1,245 @@
+import asyncio
+import aiohttp
+from urllib.parse import urlparse
+import time
+from datetime import datetime
+from queue import Empty
+from concurrent.futures import ThreadPoolExecutor
+
+from WebCrawler import WebCrawler, HEADERS
+from RateControl import parse_retry_after
+from Frontier import PriorityFrontier
+from PageStore import PageStore
+
+
+def timing_trace_config(metrics):
+    """aiohttp请求跟踪：DNS解析和建立连接（含DNS解析）的耗时计入对应阶段"""
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_dns_start(session, ctx, params):
+        ctx.dns_start = time.perf_counter()
+
+    async def on_dns_end(session, ctx, params):
+        metrics.observe("dns", time.perf_counter() - ctx.dns_start)
+
+    async def on_connect_start(session, ctx, params):
+        ctx.connect_start = time.perf_counter()
+
+    async def on_connect_end(session, ctx, params):
+        metrics.observe("connect", time.perf_counter() - ctx.connect_start)
+
+    trace_config.on_dns_resolvehost_start.append(on_dns_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_end)
+    trace_config.on_connection_create_start.append(on_connect_start)
+    trace_config.on_connection_create_end.append(on_connect_end)
+    return trace_config
+
+
+class AsyncWebCrawler(WebCrawler):
+    """基于asyncio的爬虫，同时保持数百个请求在途，礼貌延时按主机而不是按线程计算"""
+
+    def __init__(self, start_url, max_pages, save_dir, max_concurrency=200, parse_threads=4,
+                 state_db=None, resume=False, seen_urls=None, recrawl=False, manifest_format="csv",
+                 page_store=None, parse_processes=0, metrics_port=None, metrics_snapshot=None,
+                 frontier=None, allowed_domains=None, crawl_delay=0.5, max_host_concurrency=16,
+                 seed_sitemaps=False, max_page_bytes=10 * 1024 * 1024, oversize_policy="truncate"):
+        # 解析和写文件仍在线程池中完成，max_workers即该线程池大小
+        super().__init__(start_url, max_pages, save_dir, max_workers=parse_threads,
+                         state_db=state_db, resume=resume, seen_urls=seen_urls, recrawl=recrawl,
+                         manifest_format=manifest_format, page_store=page_store,
+                         parse_processes=parse_processes, metrics_port=metrics_port,
+                         metrics_snapshot=metrics_snapshot, frontier=frontier,
+                         allowed_domains=allowed_domains, crawl_delay=crawl_delay,
+                         max_host_concurrency=max_host_concurrency, seed_sitemaps=seed_sitemaps,
+                         max_page_bytes=max_page_bytes, oversize_policy=oversize_policy)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.metrics.register_gauge("in_flight", lambda: self.in_flight)
+
+    def crawl(self):
+        """主爬取方法 - 使用asyncio事件循环"""
+        self.logger.info(f"开始异步爬取，目标URL: {self.start_url}")
+        self.logger.info(f"最大页面数: {self.max_pages}")
+        self.logger.info(f"存储目录: {self.save_dir}")
+        self.logger.info(f"最大并发请求数: {self.max_concurrency}")
+
+        start_time = datetime.now()
+        print(f"开始爬取 - {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
+
+        self.start_metrics()
+        self.start_parse_stage()
+        try:
+            asyncio.run(self.crawl_async())
+        except KeyboardInterrupt:
+            print("\n用户中断爬取，正在停止...")
+            self.stop_event.set()
+
+        self.stop_parse_stage()
+        self.save_state()
+        self.close()
+        self.report_summary(start_time)
+
+    async def crawl_async(self):
+        """启动并发协程并监控爬取进度"""
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(sock_connect=3, sock_read=8)
+
+        try:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=HEADERS,
+                                             trace_configs=[timing_trace_config(self.metrics)]) as session:
+                tasks = [
+                    asyncio.create_task(self.async_worker(session, loop, executor))
+                    for _ in range(self.max_concurrency)
+                ]
+
+                # 监控爬取进度
+                while not self.stop_event.is_set():
+                    print(f"\r已爬取: {self.crawled_count} | 待爬取: {self.to_visit_queue.qsize()} | 在途: {self.in_flight}", end="")
+                    self.maybe_checkpoint()
+
+                    # 检查是否达到终止条件：队列为空且没有正在处理或等待解析的URL
+                    if self.crawled_count >= self.max_pages or (
+                        self.to_visit_queue.empty() and self.in_flight == 0 and self.parse_pending == 0
+                        and not self.seeding()
+                    ):
+                        self.stop_event.set()
+                        break
+
+                    await asyncio.sleep(1)
+
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            executor.shutdown(wait=True)
+
+    async def async_worker(self, session, loop, executor):
+        """协程工作函数，循环从队列中取URL处理"""
+        while not self.stop_event.is_set():
+            try:
+                current_url = self.to_visit_queue.get_nowait()
+            except Empty:
+                await asyncio.sleep(0.1)
+                continue
+
+            # 取出URL与计数之间没有await，监控循环不会看到“队列空且无在途”的中间状态
+            self.in_flight += 1
+            try:
+                await self.fetch_url(session, loop, executor, current_url)
+            except Exception as e:
+                self.logger.error(f"工作协程异常: {str(e)}")
+            finally:
+                self.in_flight -= 1
+                self.finish_url(current_url)
+                self.to_visit_queue.task_done()
+                if self.state:
+                    self.state.mark_done(current_url)
+
+    async def fetch_url(self, session, loop, executor, current_url):
+        """按主机限速下载单个URL并交给线程池保存和提取链接"""
+        # 域名检查
+        if not self.is_valid_domain(current_url):
+            self.logger.info(f"跳过非目标域名URL: {current_url}")
+            return
+
+        self.logger.info(f"处理URL: {current_url}")
+
+        if self.sitemap_seeder:
+            self.sitemap_seeder.add_host(current_url)
+        page_meta = self.get_page_meta(current_url)
+
+        # 按主机自适应限速：等待该主机的请求名额，拿到名额后到请求结束之间出错都会释放
+        host = urlparse(current_url).netloc.lower()
+        connect_timeout, read_timeout = self.rate_limiter.timeout(host)
+        while True:
+            delay = self.rate_limiter.try_acquire(host)
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        ttfb = None
+        try:
+            start = time.perf_counter()
+            async with session.get(current_url, headers=self.request_headers(page_meta), allow_redirects=True,
+                                   timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)) as response:
+                ttfb = time.perf_counter() - start
+                self.metrics.observe("ttfb", ttfb)
+                status = response.status
+                resp_headers = response.headers
+                encoding = response.charset
+
+                # 先看响应头和开头的字节，只有HTML页面才读取完整的响应体
+                raw_content = None
+                collector = self.open_body(current_url, status, resp_headers)
+                if collector:
+                    with self.metrics.timer("download"):
+                        while True:
+                            chunk = await response.content.read(65536)
+                            if not chunk or not collector.feed(chunk):
+                                break
+                    raw_content = self.close_body(current_url, collector)
+            self.metrics.record_request(host, error=status >= 400)
+            self.rate_limiter.release(host, status, ttfb, retry_after=parse_retry_after(resp_headers.get("Retry-After")))
+
+        except asyncio.TimeoutError:
+            self.logger.warning(f"请求超时: {current_url}")
+            self.record_fetch_error(host, "timeouts")
+            self.rate_limiter.release(host, timed_out=True)
+            return
+        except aiohttp.TooManyRedirects:
+            self.logger.warning(f"重定向过多: {current_url}")
+            self.record_fetch_error(host, "redirect_errors")
+            self.rate_limiter.release(host)
+            return
+        except aiohttp.ClientError as e:
+            self.logger.error(f"请求异常: {current_url} - {str(e)}")
+            self.record_fetch_error(host, "request_errors")
+            self.rate_limiter.release(host)
+            return
+        except BaseException:
+            self.rate_limiter.release(host)
+            raise
+
+        # 解析HTML和写文件会阻塞事件循环，放到线程池中执行
+        await loop.run_in_executor(
+            executor, self.handle_response,
+            current_url, status, resp_headers, raw_content, encoding, page_meta
+        )
+
+
+if __name__ == "__main__":
+    start_url = "https://www.nankai.edu.cn/"
+    max_pages = 101000
+    save_dir = "d:/SearchEngine/PagesData"
+    max_concurrency = 200  # 最大并发请求数
+    state_db = "d:/SearchEngine/crawl_state.db"  # 爬取状态，用于断点续爬
+    recrawl = False  # 设为True时对已爬取的网站做增量重爬
+    page_store_dir = None  # 设为目录（如"d:/SearchEngine/PageStore"）时页面写入分段压缩存储
+    parse_processes = 4  # 链接解析进程数
+    metrics_port = 9108  # 指标服务端口，http://127.0.0.1:9108/metrics
+    metrics_snapshot = "d:/SearchEngine/crawl_metrics.json"  # 定期写出的JSON指标快照
+    frontier = PriorityFrontier("opic")  # 按链接重要性排序并按主机轮转
+    seed_sitemaps = True  # 从robots.txt声明的sitemap补充待爬取URL
+
+    print("=" * 70)
+    print("南开大学网站异步爬虫 - 仅用于学术研究")
+    print(f"开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"最大并发请求数: {max_concurrency}")
+    print("=" * 70)
+
+    page_store = PageStore(page_store_dir) if page_store_dir else None
+    crawler = AsyncWebCrawler(start_url, max_pages, save_dir, max_concurrency, state_db=state_db,
+                              resume=not recrawl, recrawl=recrawl, page_store=page_store,
+                              parse_processes=parse_processes, metrics_port=metrics_port,
+                              metrics_snapshot=metrics_snapshot, frontier=frontier,
+                              seed_sitemaps=seed_sitemaps)
+
+    try:
+        crawler.crawl()
+    except KeyboardInterrupt:
+        print("\n用户中断爬取，正在保存进度...")
+    finally:
+        # crawl()结束前已保存进度并关闭页面存储，这里只输出统计
+        print(f"已爬取页面数: {crawler.crawled_count}")
+        print(f"待爬取URL数: {crawler.to_visit_queue.qsize()}")
+        print(f"CSV文件位置: {crawler.csv_file}")
+        print("爬取结束!")
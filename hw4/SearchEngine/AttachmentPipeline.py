@@ -0,0 +1,481 @@
+# 附件全文处理：下载filepages.csv中的附件（有大小上限，可断点续传），
+# 在进程池中提取PDF/DOCX/XLSX的文本（每个文件单独限时），写入单独的ES索引attachments
+
+import hashlib
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse, unquote
+
+import requests
+
+from CrawlManifest import ManifestWriter, iter_manifest
+from RateControl import AdaptiveHostLimiter, parse_retry_after
+from WebCrawler import HEADERS
+
+try:
+    from pdfminer.high_level import extract_text as pdfminer_extract_text
+except ImportError:
+    pdfminer_extract_text = None
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+ATTACHMENT_INDEX = "attachments"
+
+attachment_index_settings = {
+    "settings": {
+        "number_of_shards": 1,
+        "number_of_replicas": 0
+    },
+    "mappings": {
+        "properties": {
+            "url": {"type": "keyword"},
+            "source_urls": {"type": "keyword"},
+            "filename": {"type": "text", "fields": {"raw": {"type": "keyword"}}},
+            "extension": {"type": "keyword"},
+            "content": {"type": "text"},
+            "size": {"type": "long"},
+            "status": {"type": "keyword"},
+        }
+    },
+}
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+S_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+# ---------- 文本提取（在子进程中执行） ----------
+
+def extract_pdf_text(path):
+    if pdfminer_extract_text is not None:
+        return pdfminer_extract_text(path)
+    if pypdf is not None:
+        reader = pypdf.PdfReader(path)
+        return "\n".join(page.extract_text() or "" for page in reader.pages)
+    raise ImportError("提取PDF文本需要安装pdfminer.six或pypdf")
+
+
+def extract_docx_text(path):
+    """直接解析docx中的word/document.xml，按段落取出文本"""
+    paragraphs = []
+    with zipfile.ZipFile(path) as archive:
+        with archive.open("word/document.xml") as xml_file:
+            parts = []
+            for _, elem in ET.iterparse(xml_file, events=("end",)):
+                if elem.tag == W_NS + "t" and elem.text:
+                    parts.append(elem.text)
+                elif elem.tag == W_NS + "tab":
+                    parts.append("\t")
+                elif elem.tag == W_NS + "p":
+                    if parts:
+                        paragraphs.append("".join(parts))
+                    parts = []
+                    elem.clear()
+    return "\n".join(paragraphs)
+
+
+def extract_xlsx_text(path):
+    """直接解析xlsx中的共享字符串和各工作表，每行单元格以制表符分隔"""
+    lines = []
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+        shared = []
+        if "xl/sharedStrings.xml" in names:
+            with archive.open("xl/sharedStrings.xml") as xml_file:
+                for _, elem in ET.iterparse(xml_file, events=("end",)):
+                    if elem.tag == S_NS + "si":
+                        shared.append("".join(t.text or "" for t in elem.iter(S_NS + "t")))
+                        elem.clear()
+
+        sheets = sorted(n for n in names if n.startswith("xl/worksheets/sheet") and n.endswith(".xml"))
+        for sheet in sheets:
+            with archive.open(sheet) as xml_file:
+                for _, elem in ET.iterparse(xml_file, events=("end",)):
+                    if elem.tag != S_NS + "row":
+                        continue
+                    cells = []
+                    for cell in elem.iter(S_NS + "c"):
+                        cell_type = cell.get("t")
+                        if cell_type == "inlineStr":
+                            cells.append("".join(t.text or "" for t in cell.iter(S_NS + "t")))
+                            continue
+                        value = cell.find(S_NS + "v")
+                        if value is None or value.text is None:
+                            continue
+                        if cell_type == "s":
+                            index = int(value.text)
+                            cells.append(shared[index] if index < len(shared) else "")
+                        else:
+                            cells.append(value.text)
+                    if cells:
+                        lines.append("\t".join(cells))
+                    elem.clear()
+    return "\n".join(lines)
+
+
+EXTRACTORS = {
+    ".pdf": extract_pdf_text,
+    ".docx": extract_docx_text,
+    ".xlsx": extract_xlsx_text,
+}
+
+
+def extract_attachment_text(task):
+    """进程池任务：task为(url, 文件路径, 最大字符数)，返回提取的文本"""
+    url, path, max_chars = task
+    extractor = EXTRACTORS[os.path.splitext(path)[1].lower()]
+    text = extractor(path) or ""
+    # 合并多余的空白
+    text = "\n".join(line.strip() for line in text.splitlines() if line.strip())
+    return text[:max_chars]
+
+
+# ---------- 每个任务单独限时的进程池 ----------
+
+def _timeout_pool_worker(func, conn):
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        try:
+            conn.send((True, func(task)))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+
+class TimeoutPool:
+    """每个任务单独计时的进程池
+
+    multiprocessing.Pool无法中止单个任务，遇到损坏或特别大的PDF时整个池会被拖住；
+    这里每个子进程一次只执行一个任务，超过timeout秒就终止该子进程并换一个新的。
+    """
+
+    def __init__(self, func, processes=None, timeout=60):
+        self.func = func
+        self.processes = processes or os.cpu_count() or 1
+        self.timeout = timeout
+
+    def start_worker(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_timeout_pool_worker, args=(self.func, child_conn), daemon=True)
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def stop_worker(self, worker, kill=False):
+        process, conn = worker
+        if kill:
+            process.terminate()
+        else:
+            try:
+                conn.send(None)
+            except OSError:
+                process.terminate()
+        process.join()
+        conn.close()
+
+    def imap_unordered(self, tasks):
+        """依次返回(task, 是否成功, 结果或错误信息)，超时的任务错误信息为"timeout\""""
+        tasks = iter(tasks)
+        idle = [self.start_worker() for _ in range(self.processes)]
+        busy = {}  # conn -> (worker, task, deadline)
+        exhausted = False
+        try:
+            while True:
+                while idle and not exhausted:
+                    try:
+                        task = next(tasks)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    worker = idle.pop()
+                    worker[1].send(task)
+                    busy[worker[1]] = (worker, task, time.monotonic() + self.timeout)
+                if not busy:
+                    break
+
+                wait_time = max(0.0, min(deadline for _, _, deadline in busy.values()) - time.monotonic())
+                for conn in multiprocessing.connection.wait(list(busy), timeout=wait_time):
+                    worker, task, _ = busy.pop(conn)
+                    try:
+                        ok, result = conn.recv()
+                    except EOFError:
+                        # 子进程崩溃（如解析库段错误）
+                        self.stop_worker(worker, kill=True)
+                        worker = self.start_worker()
+                        ok, result = False, "worker crashed"
+                    idle.append(worker)
+                    yield task, ok, result
+
+                now = time.monotonic()
+                for conn, (worker, task, deadline) in list(busy.items()):
+                    if deadline <= now:
+                        del busy[conn]
+                        self.stop_worker(worker, kill=True)
+                        idle.append(self.start_worker())
+                        yield task, False, "timeout"
+        finally:
+            for worker in idle:
+                self.stop_worker(worker)
+            for worker, _, _ in busy.values():
+                self.stop_worker(worker, kill=True)
+
+
+# ---------- 下载 ----------
+
+class AttachmentDownloader:
+    """附件下载：超过max_bytes放弃，未下载完的部分保存为.part文件，下次用Range请求续传"""
+
+    def __init__(self, save_dir, max_bytes=50 * 1024 * 1024, crawl_delay=0.5, logger=None):
+        self.save_dir = os.path.normpath(save_dir)
+        self.max_bytes = max_bytes
+        self.logger = logger or logging.getLogger("AttachmentPipeline")
+        self.session = requests.Session()
+        self.rate_limiter = AdaptiveHostLimiter(initial_delay=crawl_delay, min_delay=min(crawl_delay, 0.1))
+        os.makedirs(self.save_dir, exist_ok=True)
+
+    def local_path(self, url):
+        ext = os.path.splitext(urlparse(url).path)[1].lower()
+        return os.path.join(self.save_dir, hashlib.sha1(url.encode("utf-8")).hexdigest()[:20] + ext)
+
+    def download(self, url):
+        """下载附件，返回(状态, 文件路径, 字节数)，状态为"done"表示文件完整"""
+        path = self.local_path(url)
+        if os.path.exists(path):
+            return "done", path, os.path.getsize(path)
+
+        part_path = path + ".part"
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = dict(HEADERS)
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+
+        host = urlparse(url).netloc.lower()
+        self.rate_limiter.acquire(host)
+        try:
+            response = self.session.get(url, headers=headers, stream=True, timeout=self.rate_limiter.timeout(host))
+        except requests.exceptions.Timeout:
+            self.rate_limiter.release(host, timed_out=True)
+            self.logger.warning(f"下载超时: {url}")
+            return "timeout", None, offset
+        except requests.exceptions.RequestException as e:
+            self.rate_limiter.release(host)
+            self.logger.error(f"下载失败: {url} - {str(e)}")
+            return "error", None, offset
+        self.rate_limiter.release(host, response.status_code, response.elapsed.total_seconds(),
+                                  retry_after=parse_retry_after(response.headers.get("Retry-After")))
+
+        with response:
+            if response.status_code == 416 and offset:
+                # .part已经是完整文件
+                os.replace(part_path, path)
+                return "done", path, offset
+            if response.status_code == 206 and offset:
+                mode = "ab"
+            elif response.status_code == 200:
+                # 服务器不支持Range时从头下载
+                mode, offset = "wb", 0
+            else:
+                self.logger.warning(f"HTTP错误 {response.status_code}: {url}")
+                return f"http_{response.status_code}", None, offset
+
+            if "text/html" in response.headers.get("Content-Type", ""):
+                # 链接指向的是网页（如登录页或下载页），不是附件本身
+                return "not_attachment", None, 0
+            try:
+                remaining = int(response.headers.get("Content-Length"))
+            except (TypeError, ValueError):
+                remaining = None
+            if remaining is not None and offset + remaining > self.max_bytes:
+                self.logger.info(f"附件超过 {self.max_bytes} 字节，跳过: {url}")
+                return "too_large", None, offset + remaining
+
+            try:
+                with open(part_path, mode) as file:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        file.write(chunk)
+                        offset += len(chunk)
+                        if offset > self.max_bytes:
+                            break
+            except requests.exceptions.RequestException as e:
+                # 保留.part文件，下次续传
+                self.logger.warning(f"下载中断: {url} - {str(e)}")
+                return "partial", None, offset
+
+        if offset > self.max_bytes:
+            os.remove(part_path)
+            self.logger.info(f"附件超过 {self.max_bytes} 字节，跳过: {url}")
+            return "too_large", None, offset
+        os.replace(part_path, path)
+        return "done", path, offset
+
+
+# ---------- 流水线 ----------
+
+class AttachmentPipeline:
+    """下载附件、提取文本并写入ES索引attachments
+
+    处理结果追加记录在attachments.csv（URL, Filename, Size, Status）中，
+    重新运行时跳过已索引的附件，未下载完的附件续传。
+    """
+
+    def __init__(self, filepages_csv, save_dir, es=None, index_name=ATTACHMENT_INDEX,
+                 max_bytes=50 * 1024 * 1024, download_workers=8, extract_processes=None,
+                 extract_timeout=60, max_text_chars=1000000, crawl_delay=0.5):
+        self.filepages_csv = filepages_csv
+        self.save_dir = os.path.normpath(save_dir)
+        self.es = es
+        self.index_name = index_name
+        self.download_workers = download_workers
+        self.extract_processes = extract_processes
+        self.extract_timeout = extract_timeout
+        self.max_text_chars = max_text_chars
+
+        os.makedirs(self.save_dir, exist_ok=True)
+        log_file = os.path.join(self.save_dir, "attachments.log")
+        logging.basicConfig(
+            filename=log_file,
+            level=logging.INFO,
+            format='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s'
+        )
+        self.logger = logging.getLogger("AttachmentPipeline")
+        self.downloader = AttachmentDownloader(os.path.join(self.save_dir, "files"), max_bytes, crawl_delay, self.logger)
+        self.status_csv = os.path.join(self.save_dir, "attachments.csv")
+
+    def load_attachments(self):
+        """从filepages.csv读取附件URL及引用它的页面"""
+        attachments = {}
+        for row in iter_manifest(self.filepages_csv):
+            sources = attachments.setdefault(row["Attachment_URL"], [])
+            if row["Source_URL"] not in sources:
+                sources.append(row["Source_URL"])
+        return attachments
+
+    def load_status(self):
+        """读取上次运行的结果，同一URL以最后一行为准"""
+        status = {}
+        if os.path.exists(self.status_csv):
+            for row in iter_manifest(self.status_csv):
+                status[row["URL"]] = row["Status"]
+        return status
+
+    def create_index(self):
+        if not self.es.indices.exists(index=self.index_name):
+            self.es.indices.create(index=self.index_name, body=attachment_index_settings)
+
+    def download_all(self, urls, manifest):
+        """并发下载，返回{url: (状态, 文件路径, 字节数)}"""
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            for url, result in zip(urls, executor.map(self.downloader.download, urls)):
+                results[url] = result
+                status, path, size = result
+                manifest.write([url, path or "", size, status])
+                if len(results) % 100 == 0:
+                    print(f"\r已下载: {len(results)}/{len(urls)}", end="")
+        return results
+
+    def generate_actions(self, attachments, downloads, pending):
+        """提取文本并生成ES批量写入的动作；不支持提取的格式只按文件名索引
+
+        pending记录每个动作的{_id: (url, 状态)}，ES确认写入后再写入attachments.csv
+        """
+        tasks = []
+        for url, (status, path, size) in downloads.items():
+            if status == "done" and os.path.splitext(path)[1].lower() in EXTRACTORS:
+                tasks.append((url, path, self.max_text_chars))
+
+        def action(url, content, status):
+            size = downloads[url][2]
+            doc_id = hashlib.sha1(url.encode("utf-8")).hexdigest()
+            pending[doc_id] = (url, status)
+            filename = unquote(urlparse(url).path.rsplit("/", 1)[-1])
+            return {
+                "_index": self.index_name,
+                "_id": doc_id,
+                "_source": {
+                    "url": url,
+                    "source_urls": attachments.get(url, []),
+                    "filename": filename,
+                    "extension": os.path.splitext(filename)[1].lower(),
+                    "content": content,
+                    "size": size,
+                    "status": status,
+                },
+            }
+
+        extracted = set()
+        pool = TimeoutPool(extract_attachment_text, self.extract_processes, self.extract_timeout)
+        for (url, path, _), ok, result in pool.imap_unordered(tasks):
+            extracted.add(url)
+            if ok:
+                yield action(url, result, "indexed")
+            else:
+                self.logger.warning(f"提取文本失败: {url} - {result}")
+                yield action(url, "", "indexed_no_text")
+
+        for url in downloads:
+            if url not in extracted:
+                yield action(url, "", "indexed_no_text")
+
+    def run(self):
+        from elasticsearch import helpers
+
+        start_time = datetime.now()
+        print(f"开始处理附件 - {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
+        attachments = self.load_attachments()
+        previous = self.load_status()
+        urls = [url for url in attachments if not previous.get(url, "").startswith("indexed")]
+        self.logger.info(f"附件总数: {len(attachments)}，待处理: {len(urls)}")
+        print(f"附件总数: {len(attachments)}，待处理: {len(urls)}")
+
+        self.create_index()
+        manifest = ManifestWriter(self.status_csv, ["URL", "Filename", "Size", "Status"], logger=self.logger)
+        try:
+            downloads = self.download_all(urls, manifest)
+            # 只索引下载完成或因格式、大小无法下载正文的附件，其余下次重试
+            indexable = {url: r for url, r in downloads.items() if r[0] in ("done", "too_large")}
+            print(f"\n下载完成: {len(indexable)}/{len(urls)}，开始提取文本并写入索引")
+            # 按ES返回的逐条结果记录状态：写入失败或中途崩溃的附件不会被标记为indexed，下次运行时重试
+            pending = {}
+            success, failed = 0, 0
+            for ok, item in helpers.streaming_bulk(
+                self.es, self.generate_actions(attachments, indexable, pending),
+                chunk_size=50, max_retries=3, request_timeout=120, raise_on_error=False, raise_on_exception=False,
+            ):
+                result = next(iter(item.values()))
+                url, status = pending.pop(result["_id"])
+                path, size = indexable[url][1], indexable[url][2]
+                if ok:
+                    success += 1
+                    manifest.write([url, path or "", size, status])
+                else:
+                    failed += 1
+                    self.logger.error(f"写入索引失败: {url} - {result.get('error')}")
+                    manifest.write([url, path or "", size, "index_failed"])
+            self.logger.info(f"写入索引: {success}，失败: {failed}")
+        finally:
+            manifest.close()
+
+        elapsed_time = (datetime.now() - start_time).total_seconds()
+        print(f"附件处理完成! 写入索引: {success}，失败: {failed}，耗时: {elapsed_time:.2f}秒")
+
+
+if __name__ == "__main__":
+    from elasticsearch import Elasticsearch
+
+    filepages_csv = "D:\\SearchEngine\\filepages.csv"
+    save_dir = "D:\\SearchEngine\\Attachments"
+
+    es = Elasticsearch([{"host": "localhost", "port": 9200, "scheme": "http"}])
+    pipeline = AttachmentPipeline(filepages_csv, save_dir, es=es, extract_timeout=60)
+    pipeline.run()
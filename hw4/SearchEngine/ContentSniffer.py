@@ -0,0 +1,123 @@
+import re
+
+# 常见二进制格式的文件头，Content-Type写错（如把PDF标成text/html）时据此识别
+MAGIC_SIGNATURES = (
+    (b"%PDF-", "application/pdf"),
+    (b"PK\x03\x04", "application/zip"),  # 包括docx/xlsx/pptx
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "application/msword"),  # doc/xls/ppt
+    (b"Rar!\x1a\x07", "application/x-rar-compressed"),
+    (b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed"),
+    (b"\x1f\x8b", "application/gzip"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"ID3", "audio/mpeg"),
+    (b"\x1a\x45\xdf\xa3", "video/webm"),
+    (b"FLV\x01", "video/x-flv"),
+    (b"MZ", "application/x-msdownload"),
+)
+
+HTML_PATTERN = re.compile(rb"<!doctype\s+html|<html|<head|<body|<title|<meta|<div|<a\s|<p>|<table|<script", re.IGNORECASE)
+
+# 这些Content-Type不可信，需要看内容才能判断
+AMBIGUOUS_TYPES = ("", "application/octet-stream", "text/plain", "application/x-download", "binary/octet-stream")
+
+BOMS = (b"\xef\xbb\xbf", b"\xff\xfe", b"\xfe\xff")
+
+
+def media_type(content_type):
+    return (content_type or "").split(";", 1)[0].strip().lower()
+
+
+def sniff_content_type(head):
+    """根据响应体开头的字节判断类型，返回MIME类型，无法判断时返回None"""
+    for magic, mime in MAGIC_SIGNATURES:
+        if head.startswith(magic):
+            return mime
+    # ISO BMFF（mp4/mov）的ftyp盒子在第4字节
+    if head[4:8] == b"ftyp":
+        return "video/mp4"
+    text = head
+    for bom in BOMS:
+        if text.startswith(bom):
+            text = text[len(bom):]
+            break
+    if HTML_PATTERN.search(text[:1024]):
+        return "text/html"
+    return None
+
+
+def may_be_html(content_type):
+    """只看响应头：明确是HTML或类型不可信时返回True，明确是其他类型（如application/pdf）时返回False"""
+    mime = media_type(content_type)
+    return mime in ("text/html", "application/xhtml+xml") or mime in AMBIGUOUS_TYPES
+
+
+def content_length(headers):
+    try:
+        return int(headers.get("Content-Length"))
+    except (TypeError, ValueError):
+        return None
+
+
+class BodyCollector:
+    """边下载边判断的响应体收集器
+
+    收到前sniff_bytes个字节后根据文件头判断是否为HTML，不是则放弃下载；
+    超过max_bytes时policy为"truncate"保留前max_bytes个字节，为"skip"时放弃整个页面。
+    feed返回False时调用方应停止读取并关闭连接，最后调用finish取得页面内容（放弃时为None），
+    放弃原因见reason（"non_html"或"too_large"）。
+    """
+
+    def __init__(self, content_type, max_bytes, policy="truncate", sniff_bytes=512):
+        if policy not in ("truncate", "skip"):
+            raise ValueError(f"未知的超限处理方式: {policy}")
+        self.content_type = content_type
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.sniff_bytes = sniff_bytes
+        self.chunks = []
+        self.size = 0
+        self.checked = False
+        self.truncated = False
+        self.reason = None
+
+    def check_head(self):
+        self.checked = True
+        head = b"".join(self.chunks)[:self.sniff_bytes]
+        sniffed = sniff_content_type(head)
+        mime = media_type(self.content_type)
+        if sniffed is not None and sniffed != "text/html":
+            # 头部声称是HTML但内容是二进制文件
+            self.reason = "non_html"
+        elif mime in AMBIGUOUS_TYPES and sniffed != "text/html":
+            self.reason = "non_html"
+        return self.reason is None
+
+    def feed(self, chunk):
+        """加入一块数据，返回是否需要继续读取"""
+        if not chunk:
+            return True
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        if not self.checked and self.size >= self.sniff_bytes and not self.check_head():
+            return False
+        if self.size > self.max_bytes:
+            if self.policy == "skip":
+                self.reason = "too_large"
+                return False
+            self.truncated = True
+            return False
+        return True
+
+    def finish(self):
+        """返回收集到的页面内容，放弃时返回None"""
+        if not self.checked and self.reason is None:
+            self.check_head()
+        if self.reason is not None:
+            self.chunks = []
+            return None
+        body = b"".join(self.chunks)
+        self.chunks = []
+        return body[:self.max_bytes] if self.truncated else body
@@ -0,0 +1,441 @@
+# 爬虫基准测试：在本地启动一个按参数生成的网站，用各个爬虫爬取并统计
+# 页面速率、CPU时间、峰值内存和锁等待时间，便于在改动爬取热路径后对比性能
+
+import gzip
+import json
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from queue import Empty
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+LOCAL_HOST = "127.0.0.1"
+
+ATTACHMENT_TYPES = {
+    ".pdf": "application/pdf",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+FILLER_TEXT = "南开大学新闻网讯 学校召开学术委员会会议 研究部署本年度重点工作 "
+
+
+class SyntheticSite:
+    """按参数生成的网站图，同样的参数和seed总是生成同样的网站
+
+    页面为/p/<i>.html，每页有fan_out个指向其他页面的链接（另有一个指向下一页的链接保证全部可达），
+    按non_html_rate把部分链接换成图片，按attachments_per_page附加附件链接；
+    error_rate比例的页面返回5xx/404，redirect_rate比例的页面先302跳转到/r/<i>.html。
+    每个请求按latency分布（"fixed"、"uniform"或"lognormal"，均值latency_ms毫秒）延迟后返回。
+    sitemap为True时robots.txt声明sitemap索引，索引下每个gzip压缩的sitemap列出sitemap_size个页面。
+    """
+
+    def __init__(self, num_pages=1000, fan_out=10, page_bytes=20000, latency="lognormal",
+                 latency_ms=20.0, error_rate=0.01, redirect_rate=0.02, non_html_rate=0.05,
+                 attachments_per_page=1, sitemap=False, sitemap_size=1000, seed=0):
+        self.num_pages = num_pages
+        self.fan_out = fan_out
+        self.page_bytes = page_bytes
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.redirect_rate = redirect_rate
+        self.non_html_rate = non_html_rate
+        self.attachments_per_page = attachments_per_page
+        self.sitemap = sitemap
+        self.sitemap_size = sitemap_size
+        self.seed = seed
+        self.filler = (FILLER_TEXT * (page_bytes // len(FILLER_TEXT.encode("utf-8")) + 1))
+
+    def page_random(self, i):
+        return random.Random(self.seed * 1000003 + i)
+
+    def page_kind(self, i):
+        """页面类型："ok"、"error"或"redirect"，起始页总是正常页面"""
+        if i == 0:
+            return "ok"
+        r = self.page_random(i).random()
+        if r < self.error_rate:
+            return "error"
+        if r < self.error_rate + self.redirect_rate:
+            return "redirect"
+        return "ok"
+
+    def delay(self, rng):
+        mean = self.latency_ms / 1000.0
+        if self.latency == "fixed":
+            return mean
+        if self.latency == "uniform":
+            return rng.uniform(0, 2 * mean)
+        # 对数正态分布，长尾接近真实网站
+        sigma = 1.0
+        return rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma) if mean > 0 else 0.0
+
+    def render_page(self, i):
+        rng = self.page_random(i)
+        rng.random()  # 与page_kind使用的随机数错开
+        links = [f"/p/{(i + 1) % self.num_pages}.html"]
+        for _ in range(self.fan_out):
+            if rng.random() < self.non_html_rate:
+                links.append(f"/img/{rng.randrange(self.num_pages)}.jpg")
+            else:
+                links.append(f"/p/{rng.randrange(self.num_pages)}.html")
+        for k in range(self.attachments_per_page):
+            ext = rng.choice(list(ATTACHMENT_TYPES))
+            links.append(f"/files/{i}-{k}{ext}")
+
+        anchors = "\n".join(f'<li><a href="{href}">链接 {n}</a></li>' for n, href in enumerate(links))
+        text_size = max(0, self.page_bytes - len(anchors.encode("utf-8")) - 200)
+        body = self.filler[:text_size // 3]
+        return (
+            "<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\">"
+            f"<title>测试页面 {i}</title></head><body>\n"
+            f"<h1>测试页面 {i}</h1>\n<p>{body}</p>\n<ul>\n{anchors}\n</ul>\n"
+            "</body></html>\n"
+        ).encode("utf-8")
+
+    def render_sitemap_index(self, base):
+        count = (self.num_pages + self.sitemap_size - 1) // self.sitemap_size
+        entries = "".join(f"<sitemap><loc>{base}/sitemap-{k}.xml.gz</loc></sitemap>" for k in range(count))
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+                f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</sitemapindex>').encode("utf-8")
+
+    def render_sitemap(self, base, k):
+        pages = range(k * self.sitemap_size, min(self.num_pages, (k + 1) * self.sitemap_size))
+        entries = "".join(f"<url><loc>{base}/p/{i}.html</loc></url>" for i in pages)
+        return gzip.compress(('<?xml version="1.0" encoding="UTF-8"?>'
+                              f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>').encode("utf-8"))
+
+
+def make_handler(site):
+    class SiteHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_body(self, status, content_type, body, extra_headers=()):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in extra_headers:
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            rng = random.Random()
+            time.sleep(site.delay(rng))
+            path = self.path.split("?", 1)[0]
+
+            if path.startswith("/files/"):
+                ext = os.path.splitext(path)[1]
+                self.send_body(200, ATTACHMENT_TYPES.get(ext, "application/octet-stream"), b"%PDF-1.4\n" + b"0" * 2048)
+                return
+            if path.startswith("/img/"):
+                self.send_body(200, "image/jpeg", b"\xff\xd8\xff\xe0" + b"\x00" * 4096)
+                return
+            if site.sitemap and path == "/robots.txt":
+                self.send_body(200, "text/plain", b"User-agent: *\nSitemap: /sitemap_index.xml\n")
+                return
+            base = f"http://{self.headers.get('Host', LOCAL_HOST)}"
+            if site.sitemap and path == "/sitemap_index.xml":
+                self.send_body(200, "application/xml", site.render_sitemap_index(base))
+                return
+            if site.sitemap and path.startswith("/sitemap-"):
+                try:
+                    k = int(path[len("/sitemap-"):].split(".")[0])
+                except ValueError:
+                    k = -1
+                if k >= 0:
+                    self.send_body(200, "application/x-gzip", site.render_sitemap(base, k))
+                    return
+
+            try:
+                i = int(path.rsplit("/", 1)[-1].split(".")[0]) if path not in ("", "/") else 0
+            except ValueError:
+                self.send_body(404, "text/html; charset=utf-8", b"not found")
+                return
+            if not 0 <= i < site.num_pages:
+                self.send_body(404, "text/html; charset=utf-8", b"not found")
+                return
+
+            kind = site.page_kind(i)
+            if kind == "error":
+                status = site.page_random(i).choice((404, 500, 503))
+                self.send_body(status, "text/html; charset=utf-8", b"error")
+            elif kind == "redirect" and path.startswith("/p/"):
+                self.send_body(302, "text/html; charset=utf-8", b"", [("Location", f"/r/{i}.html")])
+            else:
+                self.send_body(200, "text/html; charset=utf-8", site.render_page(i))
+
+    return SiteHandler
+
+
+def start_site_server(site, port=0):
+    """在后台线程中启动本地网站，返回server（server.server_port为实际端口）"""
+    server = ThreadingHTTPServer((LOCAL_HOST, port), make_handler(site))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="SyntheticSite", daemon=True).start()
+    return server
+
+
+class TimedLock:
+    """记录等待时间的锁，基准测试时替换爬虫中的锁以统计锁争用"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_time = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self.lock.acquire(False):
+            self.acquisitions += 1
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self.lock.acquire(True, timeout)
+        if acquired:
+            # 持有锁时更新统计，不需要额外同步
+            self.acquisitions += 1
+            self.contended += 1
+            self.wait_time += time.perf_counter() - start
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def locked(self):
+        return self.lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def instrument_locks(crawler):
+    """把爬虫、去重集合、状态存储和页面存储的锁替换为TimedLock，返回{名称: 锁列表}"""
+    locks = {"crawler": [TimedLock()]}
+    crawler.lock = locks["crawler"][0]
+    seen_urls = getattr(crawler, "seen_urls", None)
+    if seen_urls is not None and hasattr(seen_urls, "locks"):
+        seen_urls.locks = [TimedLock() for _ in seen_urls.locks]
+        locks["seen_urls"] = seen_urls.locks
+    for name in ("state", "page_store"):
+        obj = getattr(crawler, name, None)
+        if obj is not None:
+            obj.lock = TimedLock()
+            locks[name] = [obj.lock]
+    return locks
+
+
+def lock_report(locks):
+    return {
+        name: {
+            "acquisitions": sum(lock.acquisitions for lock in group),
+            "contended": sum(lock.contended for lock in group),
+            "wait_seconds": sum(lock.wait_time for lock in group),
+        }
+        for name, group in locks.items()
+    }
+
+
+def peak_rss_mb():
+    """本进程的峰值常驻内存（MB），无法获取时返回None"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux单位为KB，macOS为字节
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    return None
+
+
+def children_cpu_seconds():
+    """已结束的子进程（如解析进程池）的CPU时间"""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def build_crawler(kind, base_url, work_dir, options):
+    """按kind创建爬虫："threaded"、"async"或"file"（FileCrawler读取threaded结果中的webpages.csv）"""
+    if kind == "file":
+        from FileCrawler import WebCrawler as FileWebCrawler
+        crawler = FileWebCrawler(options["webpages_csv"], os.path.join(work_dir, "files"),
+                                 max_workers=options.get("max_workers", 10))
+        crawler.crawl_delay = options.get("crawl_delay", 0.0)
+        return crawler
+
+    from WebCrawler import WebCrawler
+    from Frontier import PriorityFrontier
+    common = dict(
+        parse_processes=options.get("parse_processes", 0),
+        seed_sitemaps=options.get("seed_sitemaps", False),
+        max_host_concurrency=options.get("max_host_concurrency", 16),
+        allowed_domains=(LOCAL_HOST,),
+        crawl_delay=options.get("crawl_delay", 0.0),
+    )
+    if options.get("frontier"):
+        common["frontier"] = PriorityFrontier(options["frontier"])
+    save_dir = os.path.join(work_dir, "pages")
+    max_pages = options.get("max_pages", 100000)
+    if kind == "async":
+        from AsyncCrawler import AsyncWebCrawler
+        return AsyncWebCrawler(base_url, max_pages, save_dir,
+                               max_concurrency=options.get("max_concurrency", 200), **common)
+    return WebCrawler(base_url, max_pages, save_dir, options.get("max_workers", 10), **common)
+
+
+def run_crawler(kind, base_url, work_dir, options, result_queue):
+    """在子进程中运行一次爬取，峰值内存和CPU时间只包含本次爬取"""
+    crawler = build_crawler(kind, base_url, work_dir, options)
+    locks = instrument_locks(crawler)
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    crawler.crawl()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start + children_cpu_seconds()
+
+    pages = getattr(crawler, "crawled_count", None)
+    if pages is None:
+        pages = len(crawler.visited_urls)
+    result_queue.put({
+        "kind": kind,
+        "pages": pages,
+        "elapsed_seconds": elapsed,
+        "pages_per_sec": pages / elapsed if elapsed > 0 else 0.0,
+        "cpu_seconds": cpu,
+        "cpu_per_page_ms": cpu / pages * 1000 if pages else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "locks": lock_report(locks),
+    })
+
+
+def run_benchmark(scenarios, site=None, work_dir="benchmark_output"):
+    """依次运行scenarios中的每个场景，返回结果列表
+
+    scenarios为[(名称, kind, options)]；"file"场景使用之前最近一次threaded/async场景生成的webpages.csv。
+    """
+    site = site or SyntheticSite()
+    server = start_site_server(site)
+    base_url = f"http://{LOCAL_HOST}:{server.server_port}/p/0.html"
+    results = []
+    last_csv = None
+    try:
+        for name, kind, options in scenarios:
+            scenario_dir = os.path.join(work_dir, name)
+            shutil.rmtree(scenario_dir, ignore_errors=True)
+            os.makedirs(scenario_dir)
+            options = dict(options)
+            if kind == "file":
+                if last_csv is None:
+                    print(f"跳过 {name}: 需要先运行threaded或async场景")
+                    continue
+                options["webpages_csv"] = last_csv
+
+            result_queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=run_crawler, args=(kind, base_url, scenario_dir, options, result_queue))
+            process.start()
+            result = None
+            while result is None:
+                try:
+                    result = result_queue.get(timeout=1)
+                except Empty:
+                    if not process.is_alive():
+                        break
+            process.join()
+            if result is None:
+                print(f"场景 {name} 运行失败，退出码: {process.exitcode}")
+                continue
+            result["name"] = name
+            results.append(result)
+            if kind != "file":
+                last_csv = os.path.join(scenario_dir, "webpages.csv")
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def print_results(results, baseline=None, tolerance=0.1):
+    """打印结果表；给出baseline时对比页面速率，下降超过tolerance的场景标记为回退，返回回退场景名列表"""
+    baseline = {r["name"]: r for r in baseline or []}
+    regressions = []
+    print(f"\n{'场景':<20}{'页面数':>8}{'页/秒':>10}{'CPU(秒)':>10}{'CPU/页(ms)':>12}{'峰值内存(MB)':>14}{'锁等待(秒)':>12}")
+    for r in results:
+        lock_wait = sum(l["wait_seconds"] for l in r["locks"].values())
+        rss = f"{r['peak_rss_mb']:.1f}" if r["peak_rss_mb"] is not None else "-"
+        line = (f"{r['name']:<20}{r['pages']:>8}{r['pages_per_sec']:>10.1f}{r['cpu_seconds']:>10.2f}"
+                f"{r['cpu_per_page_ms']:>12.2f}{rss:>14}{lock_wait:>12.3f}")
+        base = baseline.get(r["name"])
+        if base and base["pages_per_sec"] > 0:
+            change = r["pages_per_sec"] / base["pages_per_sec"] - 1
+            line += f"  {change:+.1%}"
+            if change < -tolerance:
+                line += " 回退!"
+                regressions.append(r["name"])
+        print(line)
+    return regressions
+
+
+if __name__ == "__main__":
+    work_dir = "d:/SearchEngine/benchmark"
+    results_file = os.path.join(work_dir, "results.json")
+    baseline_file = os.path.join(work_dir, "baseline.json")  # 存在时与之对比
+
+    site = SyntheticSite(
+        num_pages=2000,
+        fan_out=10,
+        page_bytes=20000,
+        latency="lognormal",
+        latency_ms=20,
+        error_rate=0.01,
+        redirect_rate=0.02,
+        non_html_rate=0.05,
+        attachments_per_page=1,
+        sitemap=True,
+    )
+    scenarios = [
+        ("threaded", "threaded", {"max_workers": 10}),
+        ("threaded-parse4", "threaded", {"max_workers": 10, "parse_processes": 4}),
+        ("async", "async", {"max_concurrency": 200, "parse_processes": 4}),
+        ("async-opic", "async", {"max_concurrency": 200, "parse_processes": 4, "frontier": "opic"}),
+        ("async-sitemap", "async", {"max_concurrency": 200, "parse_processes": 4, "seed_sitemaps": True}),
+        ("file", "file", {"max_workers": 10}),
+    ]
+
+    os.makedirs(work_dir, exist_ok=True)
+    results = run_benchmark(scenarios, site, work_dir)
+    baseline = None
+    if os.path.exists(baseline_file):
+        with open(baseline_file, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+    regressions = print_results(results, baseline)
+    with open(results_file, "w", encoding="utf-8") as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存至: {results_file}")
+    if regressions:
+        print(f"性能回退: {', '.join(regressions)}")
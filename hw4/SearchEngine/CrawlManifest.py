@@ -0,0 +1,157 @@
+import csv
+import io
+import json
+import os
+import threading
+import time
+from array import array
+from queue import Queue, Empty
+
+# 队列中的控制消息
+_STOP = object()
+
+
+class ManifestWriter:
+    """单写线程的爬取清单（webpages.csv、filepages.csv等）
+
+    工作线程调用write只是把记录放入队列，由专门的写线程批量写入文件，
+    记录数达到batch_size或距上次写入超过flush_interval时刷新，checkpoint时fsync。
+
+    fmt为"csv"时与原来的CSV格式完全相同；为"jsonl"时每行一个JSON对象，
+    并在path + ".idx"中按记录顺序保存每条记录的字节偏移（8字节小端无符号整数），
+    可用read_manifest_record随机读取第n条记录。
+
+    before_write在每批记录写入文件之前由写线程调用，用于先刷新记录所引用的数据
+    （如分段页面存储），读取清单的程序（如StreamIndexer）看到记录时数据已经可读。
+    """
+
+    def __init__(self, path, header, fmt="csv", batch_size=500, flush_interval=1.0, max_queue=100000,
+                 logger=None, before_write=None):
+        self.path = path
+        self.before_write = before_write
+        self.logger = logger
+        self.header = list(header)
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = Queue(maxsize=max_queue)
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="ManifestWriter", daemon=True)
+        self.thread.start()
+
+    def write(self, row):
+        """追加一条记录（按header顺序排列的列表）"""
+        self.queue.put(row)
+
+    def checkpoint(self):
+        """写入队列中已有的记录并fsync，返回时数据已落盘"""
+        if self.closed:
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def close(self):
+        """写入剩余记录并停止写线程"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(_STOP)
+        self.thread.join()
+
+    def open_files(self):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        if self.fmt == "jsonl":
+            data_file = open(self.path, "ab")
+            index_file = open(self.path + ".idx", "ab")
+            return data_file, index_file
+        data_file = open(self.path, "a", newline="", encoding="utf-8")
+        if new_file:
+            csv.writer(data_file).writerow(self.header)
+        return data_file, None
+
+    def write_batch(self, data_file, index_file, batch):
+        if self.fmt == "jsonl":
+            offsets = array("Q")
+            buf = io.BytesIO()
+            base = data_file.tell()
+            for row in batch:
+                offsets.append(base + buf.tell())
+                buf.write(json.dumps(dict(zip(self.header, row)), ensure_ascii=False).encode("utf-8"))
+                buf.write(b"\n")
+            data_file.write(buf.getvalue())
+            index_file.write(offsets.tobytes())
+        else:
+            csv.writer(data_file).writerows(batch)
+
+    def sync(self, data_file, index_file):
+        for f in (data_file, index_file):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def run(self):
+        """写线程主循环"""
+        data_file, index_file = self.open_files()
+        batch = []
+        last_flush = time.monotonic()
+        try:
+            while True:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except Empty:
+                    item = None
+
+                if isinstance(item, list):
+                    batch.append(item)
+                    if len(batch) < self.batch_size:
+                        continue
+
+                # 达到批量阈值、超时、checkpoint或停止时写入
+                if batch:
+                    try:
+                        if self.before_write:
+                            self.before_write()
+                        self.write_batch(data_file, index_file, batch)
+                    except Exception as e:
+                        if self.logger:
+                            self.logger.error(f"写入{self.path}时出错: {str(e)}")
+                    batch = []
+                for f in (data_file, index_file):
+                    if f is not None:
+                        f.flush()
+                last_flush = time.monotonic()
+
+                if isinstance(item, threading.Event):
+                    self.sync(data_file, index_file)
+                    item.set()
+                elif item is _STOP:
+                    self.sync(data_file, index_file)
+                    break
+        finally:
+            data_file.close()
+            if index_file is not None:
+                index_file.close()
+
+
+def iter_manifest(path):
+    """按顺序读取清单中的记录（dict），兼容CSV和JSONL两种格式"""
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, "r", encoding="utf-8") as file:
+            yield from csv.DictReader(file)
+
+
+def read_manifest_record(path, n):
+    """根据偏移索引随机读取JSONL清单中的第n条记录"""
+    with open(path + ".idx", "rb") as index_file:
+        index_file.seek(n * 8)
+        offset = int.from_bytes(index_file.read(8), "little")
+    with open(path, "rb") as file:
+        file.seek(offset)
+        return json.loads(file.readline())
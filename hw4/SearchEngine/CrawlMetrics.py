@@ -0,0 +1,319 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 延迟直方图的桶上界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 爬取各阶段
+STAGES = ("dns", "connect", "ttfb", "download", "parse", "save")
+
+
+class Histogram:
+    """固定桶的延迟直方图，格式与Prometheus histogram一致"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为+Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        """按桶估计分位数（取所在桶的上界）"""
+        with self.lock:
+            counts, total = list(self.counts), self.count
+        if total == 0:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        for bound, c in zip(self.buckets + (float("inf"),), counts):
+            cumulative += c
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def cumulative_counts(self):
+        with self.lock:
+            counts = list(self.counts)
+        result, cumulative = [], 0
+        for c in counts:
+            cumulative += c
+            result.append(cumulative)
+        return result
+
+
+class CrawlMetrics:
+    """爬虫运行指标：计数器、各阶段延迟直方图、队列深度、按主机的错误率和页面速率
+
+    可以通过start_http_server以Prometheus文本格式暴露（/metrics），
+    也可以通过start_snapshot_writer定期写出JSON快照。
+    """
+
+    def __init__(self, prefix="crawler"):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = defaultdict(int)
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.host_requests = defaultdict(int)
+        self.host_errors = defaultdict(int)
+        self.gauges = {}
+        self.start_time = time.monotonic()
+        self.last_rate_time = self.start_time
+        self.last_rate_pages = 0
+        self.server = None
+        self.snapshot_thread = None
+        self.stop_event = threading.Event()
+
+    def inc(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def observe(self, stage, seconds):
+        self.histograms[stage].observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def record_request(self, host, error=False):
+        """记录一次对host的请求及是否出错"""
+        with self.lock:
+            self.host_requests[host] += 1
+            if error:
+                self.host_errors[host] += 1
+
+    def register_gauge(self, name, func):
+        """注册按需读取的指标，如队列深度"""
+        self.gauges[name] = func
+
+    def read_gauges(self):
+        values = {}
+        for name, func in self.gauges.items():
+            try:
+                values[name] = func()
+            except Exception:
+                continue
+        return values
+
+    def snapshot(self):
+        """返回当前指标的dict"""
+        now = time.monotonic()
+        with self.lock:
+            counters = dict(self.counters)
+            hosts = {
+                host: {
+                    "requests": n,
+                    "errors": self.host_errors.get(host, 0),
+                    "error_rate": self.host_errors.get(host, 0) / n,
+                }
+                for host, n in self.host_requests.items()
+            }
+            pages = counters.get("pages_crawled", 0)
+            interval = now - self.last_rate_time
+            recent_rate = (pages - self.last_rate_pages) / interval if interval > 0 else 0.0
+            self.last_rate_time, self.last_rate_pages = now, pages
+
+        elapsed = now - self.start_time
+        return {
+            "time": time.time(),
+            "elapsed_seconds": elapsed,
+            "pages_per_sec": pages / elapsed if elapsed > 0 else 0.0,
+            "recent_pages_per_sec": recent_rate,
+            "counters": counters,
+            "gauges": self.read_gauges(),
+            "latency": {
+                stage: {
+                    "count": h.count,
+                    "sum": h.sum,
+                    "p50": h.quantile(0.5),
+                    "p95": h.quantile(0.95),
+                    "p99": h.quantile(0.99),
+                }
+                for stage, h in self.histograms.items()
+            },
+            "hosts": hosts,
+        }
+
+    def prometheus_text(self):
+        """以Prometheus文本格式输出全部指标"""
+        p = self.prefix
+        lines = []
+        with self.lock:
+            counters = dict(self.counters)
+            host_requests = dict(self.host_requests)
+            host_errors = dict(self.host_errors)
+
+        for name, value in sorted(counters.items()):
+            lines.append(f"# TYPE {p}_{name}_total counter")
+            lines.append(f"{p}_{name}_total {value}")
+
+        for name, value in sorted(self.read_gauges().items()):
+            lines.append(f"# TYPE {p}_{name} gauge")
+            lines.append(f"{p}_{name} {value}")
+
+        elapsed = time.monotonic() - self.start_time
+        lines.append(f"# TYPE {p}_pages_per_second gauge")
+        lines.append(f"{p}_pages_per_second {counters.get('pages_crawled', 0) / elapsed if elapsed > 0 else 0.0}")
+
+        lines.append(f"# TYPE {p}_stage_latency_seconds histogram")
+        for stage, h in self.histograms.items():
+            cumulative = h.cumulative_counts()
+            for bound, c in zip(h.buckets, cumulative):
+                lines.append(f'{p}_stage_latency_seconds_bucket{{stage="{stage}",le="{bound}"}} {c}')
+            lines.append(f'{p}_stage_latency_seconds_bucket{{stage="{stage}",le="+Inf"}} {cumulative[-1]}')
+            lines.append(f'{p}_stage_latency_seconds_sum{{stage="{stage}"}} {h.sum}')
+            lines.append(f'{p}_stage_latency_seconds_count{{stage="{stage}"}} {h.count}')
+
+        lines.append(f"# TYPE {p}_host_requests_total counter")
+        for host, n in sorted(host_requests.items()):
+            lines.append(f'{p}_host_requests_total{{host="{host}"}} {n}')
+        lines.append(f"# TYPE {p}_host_errors_total counter")
+        for host, n in sorted(host_errors.items()):
+            lines.append(f'{p}_host_errors_total{{host="{host}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def start_http_server(self, port, host="127.0.0.1"):
+        """在后台线程中启动HTTP服务：/metrics为Prometheus文本，/metrics.json为JSON快照"""
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics.json"):
+                    body = json.dumps(metrics.snapshot(), ensure_ascii=False).encode("utf-8")
+                    content_type = "application/json; charset=utf-8"
+                elif self.path.startswith("/metrics"):
+                    body = metrics.prometheus_text().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True).start()
+        return self.server
+
+    def start_snapshot_writer(self, path, interval=10.0):
+        """在后台线程中每隔interval秒把JSON快照写入path（先写临时文件再替换）"""
+
+        def run():
+            while not self.stop_event.wait(interval):
+                self.write_snapshot(path)
+            self.write_snapshot(path)
+
+        self.snapshot_thread = threading.Thread(target=run, name="MetricsSnapshot", daemon=True)
+        self.snapshot_thread.start()
+
+    def write_snapshot(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.snapshot(), file, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def stop(self):
+        """停止HTTP服务和快照线程（快照线程退出前会写出最后一次快照）"""
+        self.stop_event.set()
+        if self.snapshot_thread:
+            self.snapshot_thread.join()
+            self.snapshot_thread = None
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def mount_timing_adapter(session, metrics, pool_maxsize=10):
+    """为requests会话挂载计时适配器，新建连接时DNS解析计入dns阶段，TCP/TLS握手计入connect阶段"""
+    import socket
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+    from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+    from urllib3.util.connection import allowed_gai_family, create_connection
+
+    class TimedConnectionMixin:
+        dns_time = 0.0
+
+        def _new_conn(self):
+            # 先单独解析域名并计时，再依次尝试解析出的地址（与urllib3的create_connection相同）
+            start = time.perf_counter()
+            try:
+                addresses = socket.getaddrinfo(
+                    self._dns_host.strip("[]"), self.port, allowed_gai_family(), socket.SOCK_STREAM
+                )
+            except socket.gaierror as e:
+                raise NameResolutionError(self.host, self, e) from e
+            finally:
+                self.dns_time = time.perf_counter() - start
+                metrics.observe("dns", self.dns_time)
+            error = None
+            for *_, sockaddr in addresses:
+                try:
+                    return create_connection(
+                        sockaddr[:2], self.timeout,
+                        source_address=self.source_address, socket_options=self.socket_options,
+                    )
+                except socket.timeout:
+                    error = ConnectTimeoutError(
+                        self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})"
+                    )
+                except OSError as e:
+                    error = NewConnectionError(self, f"Failed to establish a new connection: {e}")
+            raise error
+
+        def connect(self):
+            self.dns_time = 0.0
+            start = time.perf_counter()
+            try:
+                super().connect()
+            finally:
+                metrics.observe("connect", time.perf_counter() - start - self.dns_time)
+
+    class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+        pass
+
+    class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+        pass
+
+    class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+
+    class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = TimedHTTPSConnection
+
+    class TimedHTTPAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": TimedHTTPConnectionPool,
+                "https": TimedHTTPSConnectionPool,
+            }
+
+    adapter = TimedHTTPAdapter(pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return adapter
@@ -0,0 +1,134 @@
+import sqlite3
+import threading
+import time
+
+# URL状态
+PENDING = 0
+VISITED = 1
+DONE = 2  # 已处理但未保存（非HTML、HTTP错误等）
+
+
+class CrawlStateStore:
+    """基于SQLite的爬取状态存储，记录已发现URL及其状态，用于断点续爬
+
+    工作线程只把变更追加到内存缓冲区，由监控循环定期调用checkpoint批量写入，
+    因此数据库写操作不会出现在爬取的热路径上。
+    """
+
+    def __init__(self, db_path, checkpoint_interval=5.0):
+        self.db_path = db_path
+        self.checkpoint_interval = checkpoint_interval
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # id保留发现顺序，恢复时按原FIFO顺序重新入队
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "id INTEGER PRIMARY KEY, url TEXT NOT NULL UNIQUE, status INTEGER NOT NULL)"
+        )
+        # 每个已保存页面的缓存验证器和内容摘要，用于增量重爬
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, digest TEXT, filename TEXT)"
+        )
+        self.conn.commit()
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.new_urls = []
+        self.visited = []
+        self.done = []
+        self.pages = []
+        self.last_checkpoint = time.monotonic()
+
+    def add_pending(self, url):
+        """记录新发现的待爬取URL"""
+        with self.lock:
+            self.new_urls.append(url)
+
+    def mark_visited(self, url):
+        """记录已爬取完成的URL"""
+        with self.lock:
+            self.visited.append(url)
+
+    def mark_done(self, url):
+        """记录已处理完毕的URL，已标记为已爬取的URL状态不变"""
+        with self.lock:
+            self.done.append(url)
+
+    def record_page(self, url, etag, last_modified, digest, filename):
+        """记录页面的ETag、Last-Modified、内容摘要和保存位置"""
+        with self.lock:
+            self.pages.append((url, etag, last_modified, digest, filename))
+
+    def get_page(self, url):
+        """查询页面上次保存时的记录，不存在时返回None"""
+        # 每个线程使用独立的只读连接，WAL模式下读操作互不阻塞
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.db_path)
+        row = conn.execute(
+            "SELECT etag, last_modified, digest, filename FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "digest": row[2], "filename": row[3]}
+
+    def known_pages(self):
+        """返回所有保存过的页面URL"""
+        return [row[0] for row in self.conn.execute("SELECT url FROM pages")]
+
+    def reset_frontier(self):
+        """清空URL状态以开始新一轮重爬，页面记录保留"""
+        self.checkpoint()
+        with self.conn:
+            self.conn.execute("DELETE FROM urls")
+
+    def checkpoint_due(self):
+        """距上次写入是否已超过checkpoint_interval"""
+        return time.monotonic() - self.last_checkpoint >= self.checkpoint_interval
+
+    def checkpoint(self):
+        """将缓冲区中的变更批量写入数据库"""
+        with self.lock:
+            new_urls, self.new_urls = self.new_urls, []
+            visited, self.visited = self.visited, []
+            done, self.done = self.done, []
+            pages, self.pages = self.pages, []
+
+        if new_urls or visited or done or pages:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO urls (url, status) VALUES (?, ?)",
+                    ((url, PENDING) for url in new_urls),
+                )
+                self.conn.executemany(
+                    "INSERT INTO urls (url, status) VALUES (?, ?) "
+                    "ON CONFLICT(url) DO UPDATE SET status = excluded.status",
+                    ((url, VISITED) for url in visited),
+                )
+                self.conn.executemany(
+                    "UPDATE urls SET status = ? WHERE url = ? AND status = ?",
+                    ((DONE, url, PENDING) for url in done),
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO pages (url, etag, last_modified, digest, filename) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    pages,
+                )
+        self.last_checkpoint = time.monotonic()
+
+    def load(self):
+        """读取保存的状态，返回(已爬取URL列表, 按发现顺序排列的待爬取URL列表, 已处理未保存URL列表)"""
+        visited = [row[0] for row in self.conn.execute(
+            "SELECT url FROM urls WHERE status = ?", (VISITED,))]
+        pending = [row[0] for row in self.conn.execute(
+            "SELECT url FROM urls WHERE status = ? ORDER BY id", (PENDING,))]
+        done = [row[0] for row in self.conn.execute(
+            "SELECT url FROM urls WHERE status = ?", (DONE,))]
+        return visited, pending, done
+
+    def close(self):
+        """写入剩余变更并关闭数据库"""
+        self.checkpoint()
+        self.conn.close()
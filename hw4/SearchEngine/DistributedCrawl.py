@@ -0,0 +1,369 @@
+# 按主机分片的分布式爬取：N个爬虫进程各自负责一部分主机（crc32(主机) % N），
+# 各有自己的待爬取队列、去重集合和状态库；发现的其他分片的链接成批发给协调者，由协调者转发给所属分片。
+# 同一主机只由一个分片访问，按主机的限速在分片内仍然成立。
+
+import os
+import threading
+import zlib
+from datetime import datetime
+from multiprocessing import Process
+from multiprocessing.connection import Listener, Client
+from urllib.parse import urlparse
+
+from CrawlManifest import ManifestWriter, iter_manifest
+from Frontier import PriorityFrontier
+from PageStore import PageStore
+from SeenSet import ShardedSeenSet
+from WebCrawler import WebCrawler
+
+
+def shard_of(url, num_shards):
+    """URL所属的分片：按主机名的crc32取模，同一主机的URL总在同一分片"""
+    host = urlparse(url).netloc.lower()
+    return zlib.crc32(host.encode("utf-8")) % num_shards
+
+
+class ShardCrawler(WebCrawler):
+    """分布式爬取中的一个分片
+
+    只爬取属于本分片的主机；其他分片的链接先在本地按URL去重，再攒成批通过连接发给协调者，
+    每组链接带上来源页面和本地待爬取队列给出的初始分数依据（深度等），所属分片按它计分。
+    是否结束由协调者判断：本分片定期报告是否空闲（队列、解析阶段、待发送链接都为空）
+    以及已处理的转入批次数，所有分片都空闲且没有在途批次时协调者通知全部分片停止。
+    """
+
+    def __init__(self, shard_id, num_shards, conn, *args, batch_size=500, flush_interval=0.5, **kwargs):
+        # 这些属性在父类初始化（加入种子URL）之前就会用到
+        self.shard_id = shard_id
+        self.num_shards = num_shards
+        self.conn = conn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.send_lock = threading.Lock()
+        self.outbox_lock = threading.Lock()
+        self.outbox = []  # [(来源页面, 初始分数依据, [URL])]
+        self.outbox_count = 0
+        self.forwarded = ShardedSeenSet()
+        self.received_batches = 0
+        self.forwarded_count = 0
+        super().__init__(*args, **kwargs)
+        self.metrics.register_gauge("outbox_size", lambda: self.outbox_count)
+
+    def owns(self, url):
+        return shard_of(url, self.num_shards) == self.shard_id
+
+    def seed_url(self, url):
+        # 起始URL不属于本分片时由所属分片负责
+        if self.owns(url):
+            super().seed_url(url)
+
+    def enqueue_links(self, links, base_url=None):
+        local, remote = [], []
+        for url in links:
+            (local if self.owns(url) else remote).append(url)
+        if remote:
+            self.forward_links(remote, base_url)
+        return super().enqueue_links(local, base_url)
+
+    def forward_links(self, links, base_url=None):
+        """其他分片的链接放入待发送列表，本分片已转发过的URL不再重复发送
+
+        初始分数依据要在本地观察base_url的链接之前取得，之后base_url在本地队列中的记录就被释放了。
+        """
+        links = [url for url in links if self.forwarded.add(url)]
+        if not links:
+            return
+        prior = self.to_visit_queue.link_prior(base_url)
+        with self.outbox_lock:
+            self.outbox.append((base_url, prior, links))
+            self.outbox_count += len(links)
+            full = self.outbox_count >= self.batch_size
+        if full:
+            self.flush_outbox()
+
+    def flush_outbox(self):
+        with self.outbox_lock:
+            batch, self.outbox = self.outbox, []
+            count, self.outbox_count = self.outbox_count, 0
+        if batch:
+            self.send(("links", batch))
+            self.forwarded_count += count
+
+    def send(self, message):
+        with self.send_lock:
+            try:
+                self.conn.send(message)
+            except OSError:
+                # 协调者已退出
+                self.stop_event.set()
+
+    def is_idle(self):
+        """本分片当前没有待爬取、正在爬取或等待解析的URL"""
+        return (
+            self.parse_pending == 0 and self.to_visit_queue.unfinished_tasks == 0
+            and not self.seeding()
+        )
+
+    def report_loop(self):
+        """定期发送积攒的链接和本分片的状态"""
+        while not self.stop_event.is_set():
+            # 先读已处理的批次数再判断是否空闲：计入的批次中的链接此时已经在队列中
+            received = self.received_batches
+            idle = self.is_idle()
+            self.flush_outbox()
+            self.send(("status", idle, self.crawled_count, received))
+            self.stop_event.wait(self.flush_interval)
+
+    def receive_loop(self):
+        """接收其他分片转来的链接和停止通知"""
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                self.stop_event.set()
+                break
+            if message[0] == "links":
+                # 来源页面在其他分片，不在本地观察这些链接，按发送方给出的依据计分
+                for base_url, prior, links in message[1]:
+                    super().enqueue_links(links, base_url, prior)
+                self.received_batches += 1
+            elif message[0] == "stop":
+                self.stop_event.set()
+                break
+
+    def should_stop(self):
+        return self.stop_event.is_set()
+
+    def crawl(self):
+        threading.Thread(target=self.receive_loop, name="ShardReceiver", daemon=True).start()
+        threading.Thread(target=self.report_loop, name="ShardReporter", daemon=True).start()
+        super().crawl()
+        self.logger.info(f"分片 {self.shard_id} 转发链接: {self.forwarded_count}，转入批次: {self.received_batches}")
+
+
+def run_shard(shard_id, num_shards, address, authkey, start_url, max_pages, work_dir, options):
+    """分片进程入口：连接协调者并在work_dir/shard-<id>下爬取"""
+    shard_dir = os.path.join(work_dir, f"shard-{shard_id}")
+    os.makedirs(shard_dir, exist_ok=True)
+    options = dict(options)
+    frontier = options.pop("frontier", None)
+    if frontier:
+        options["frontier"] = PriorityFrontier(frontier)
+    if options.pop("page_store", False):
+        options["page_store"] = PageStore(os.path.join(shard_dir, "PageStore"))
+    if options.get("metrics_port"):
+        options["metrics_port"] += shard_id
+    if options.get("metrics_snapshot"):
+        root, ext = os.path.splitext(options["metrics_snapshot"])
+        options["metrics_snapshot"] = f"{root}-{shard_id}{ext}"
+    options.setdefault("state_db", os.path.join(shard_dir, "crawl_state.db"))
+
+    conn = Client(address, authkey=authkey)
+    conn.send(("hello", shard_id))
+    crawler = ShardCrawler(shard_id, num_shards, conn, start_url, max_pages,
+                           os.path.join(shard_dir, "PagesData"), **options)
+    try:
+        crawler.crawl()
+    finally:
+        crawler.send(("done", crawler.crawled_count))
+        conn.close()
+
+
+class CrawlCoordinator:
+    """分片之间的链接转发和结束判断，监听本机端口，各分片进程通过multiprocessing.connection连接"""
+
+    def __init__(self, num_shards, max_pages, address=("127.0.0.1", 0), authkey=b"nankai-crawler"):
+        self.num_shards = num_shards
+        self.max_pages = max_pages
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.authkey = authkey
+        self.lock = threading.Lock()
+        self.conns = {}
+        self.send_locks = [threading.Lock() for _ in range(num_shards)]
+        self.idle = [False] * num_shards
+        self.crawled = [0] * num_shards
+        self.delivered = [0] * num_shards  # 发给各分片的批次数
+        self.processed = [0] * num_shards  # 各分片报告已处理的批次数
+        self.finished = [False] * num_shards
+        self.routed_links = 0
+        self.stopping = False
+        self.done_event = threading.Event()
+        self.thread = threading.Thread(target=self.accept_loop, name="CoordinatorAccept", daemon=True)
+        self.thread.start()
+
+    def accept_loop(self):
+        for _ in range(self.num_shards):
+            conn = self.listener.accept()
+            message = conn.recv()
+            shard_id = message[1]
+            with self.lock:
+                self.conns[shard_id] = conn
+            threading.Thread(target=self.serve, args=(shard_id, conn), name=f"Shard-{shard_id}", daemon=True).start()
+
+    def send(self, shard_id, message):
+        conn = self.conns.get(shard_id)
+        if conn is None:
+            return False
+        with self.send_locks[shard_id]:
+            try:
+                conn.send(message)
+                return True
+            except OSError:
+                return False
+
+    def route(self, groups):
+        """把每组链接按所属分片拆分后转发，保留各组的来源页面和初始分数依据"""
+        batches = {}
+        for base_url, prior, links in groups:
+            split = {}
+            for url in links:
+                split.setdefault(shard_of(url, self.num_shards), []).append(url)
+            for shard_id, urls in split.items():
+                batches.setdefault(shard_id, []).append((base_url, prior, urls))
+        for shard_id, batch in batches.items():
+            with self.lock:
+                if self.stopping or self.finished[shard_id]:
+                    continue
+                # 先计数再发送，避免目标分片报告的已处理数超过发送数
+                self.delivered[shard_id] += 1
+                self.routed_links += sum(len(urls) for _, _, urls in batch)
+            if not self.send(shard_id, ("links", batch)):
+                with self.lock:
+                    self.delivered[shard_id] -= 1
+
+    def serve(self, shard_id, conn):
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = message[0]
+            if kind == "links":
+                self.route(message[1])
+            elif kind == "status":
+                _, idle, crawled, processed = message
+                with self.lock:
+                    self.idle[shard_id] = idle
+                    self.crawled[shard_id] = crawled
+                    self.processed[shard_id] = processed
+                self.check_finished()
+            elif kind == "done":
+                with self.lock:
+                    self.crawled[shard_id] = message[1]
+                break
+        with self.lock:
+            self.finished[shard_id] = True
+            if all(self.finished):
+                self.done_event.set()
+        # 分片异常退出时其余分片也无法再收到它的链接，这里同样检查是否可以结束
+        self.check_finished()
+
+    def check_finished(self):
+        """达到页面数上限，或全部分片空闲且没有在途批次时通知所有分片停止"""
+        with self.lock:
+            if self.stopping or len(self.conns) < self.num_shards:
+                return
+            active = [i for i in range(self.num_shards) if not self.finished[i]]
+            quiet = all(self.idle[i] and self.processed[i] == self.delivered[i] for i in active)
+            if sum(self.crawled) < self.max_pages and not quiet:
+                return
+            self.stopping = True
+        for shard_id in range(self.num_shards):
+            self.send(shard_id, ("stop",))
+
+    def total_crawled(self):
+        with self.lock:
+            return sum(self.crawled)
+
+    def close(self):
+        self.listener.close()
+        for conn in self.conns.values():
+            conn.close()
+
+
+class DistributedCrawl:
+    """在本机启动协调者和num_shards个分片进程，结束后把各分片的webpages.csv合并到work_dir下
+
+    options为传给各分片WebCrawler的参数（max_workers、parse_processes、crawl_delay等），
+    其中frontier为评分方式名称（如"opic"），page_store为True时各分片使用自己的分段存储，
+    metrics_port为第一个分片的端口，其余分片依次加1。
+    """
+
+    def __init__(self, start_url, max_pages, work_dir, num_shards=4, **options):
+        self.start_url = start_url
+        self.max_pages = max_pages
+        self.work_dir = os.path.normpath(work_dir)
+        self.num_shards = num_shards
+        self.options = options
+        self.manifest_format = options.get("manifest_format", "csv")
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def run(self):
+        start_time = datetime.now()
+        print(f"开始分布式爬取 - {start_time.strftime('%Y-%m-%d %H:%M:%S')}，分片数: {self.num_shards}")
+        coordinator = CrawlCoordinator(self.num_shards, self.max_pages)
+        processes = [
+            Process(
+                target=run_shard,
+                args=(i, self.num_shards, coordinator.address, coordinator.authkey, self.start_url,
+                      self.max_pages, self.work_dir, self.options),
+                name=f"CrawlShard-{i}",
+            )
+            for i in range(self.num_shards)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            while not coordinator.done_event.wait(1):
+                print(f"\r已爬取: {coordinator.total_crawled()} | 转发链接: {coordinator.routed_links}", end="")
+                if not any(process.is_alive() for process in processes):
+                    break
+        except KeyboardInterrupt:
+            print("\n用户中断爬取，正在停止...")
+            for shard_id in range(self.num_shards):
+                coordinator.send(shard_id, ("stop",))
+        for process in processes:
+            process.join()
+        coordinator.close()
+
+        merged = self.merge_manifests()
+        elapsed_time = (datetime.now() - start_time).total_seconds()
+        crawled = coordinator.total_crawled()
+        print(f"\n分布式爬取完成! 总共爬取页面: {crawled}")
+        print(f"耗时: {elapsed_time:.2f}秒")
+        print(f"平均速度: {crawled / elapsed_time:.2f}页/秒")
+        print(f"CSV文件位置: {merged}")
+        return crawled
+
+    def merge_manifests(self):
+        """把各分片的爬取清单合并为work_dir下的一个文件（重新生成，不追加）"""
+        path = os.path.join(self.work_dir, f"webpages.{self.manifest_format}")
+        for stale in (path, path + ".idx"):
+            if os.path.exists(stale):
+                os.remove(stale)
+        writer = ManifestWriter(path, ["URL", "Filename", "CrawlTime"], fmt=self.manifest_format)
+        try:
+            for shard_id in range(self.num_shards):
+                shard_manifest = os.path.join(self.work_dir, f"shard-{shard_id}", f"webpages.{self.manifest_format}")
+                if not os.path.exists(shard_manifest):
+                    continue
+                for row in iter_manifest(shard_manifest):
+                    writer.write([row["URL"], row["Filename"], row["CrawlTime"]])
+        finally:
+            writer.close()
+        return path
+
+
+if __name__ == "__main__":
+    start_url = "https://www.nankai.edu.cn/"
+    max_pages = 101000
+    work_dir = "d:/SearchEngine/Distributed"  # 各分片的数据在work_dir/shard-<id>下
+    num_shards = 4  # 分片进程数
+
+    crawl = DistributedCrawl(
+        start_url, max_pages, work_dir, num_shards,
+        max_workers=10, parse_processes=2, frontier="opic", seed_sitemaps=True,
+        resume=True, metrics_port=9108,
+    )
+    crawl.run()
@@ -10,11 +10,56 @@ import re
 import threading
 from queue import Queue, Empty
 from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
 import logging
 
+from CrawlManifest import ManifestWriter, iter_manifest
+from PageStore import read_page_bytes
+
 # 支持的附件格式
 ATTACHMENT_EXTENSIONS = ('.pdf', '.doc', '.docx', '.xls', '.xlsx')
 
+
+def find_attachment_links(html, base_url):
+    """从HTML中找出附件链接，返回规范化后的附件URL列表"""
+    soup = BeautifulSoup(html, "lxml")
+    attachment_urls = []
+
+    for link in soup.find_all("a", href=True):
+        href = link.get("href", "").strip()
+
+        # 过滤无效链接
+        if not href or href.startswith(('javascript:', 'mailto:', 'tel:', '#', 'data:')):
+            continue
+
+        # 处理相对路径
+        try:
+            absolute_url = urljoin(base_url, href)
+            parsed_url = urlparse(absolute_url)
+
+            # 规范化URL
+            normalized_url = parsed_url._replace(fragment="").geturl()
+
+            # 检查是否为附件链接
+            if any(normalized_url.lower().endswith(ext) for ext in ATTACHMENT_EXTENSIONS):
+                attachment_urls.append(normalized_url)
+
+        except ValueError:
+            continue
+
+    return attachment_urls
+
+
+def extract_attachment_links_from_page(task):
+    """进程池任务：读取已保存的页面并提取附件链接，返回(页面URL, 附件URL列表或None)"""
+    url, ref = task
+    try:
+        # 爬虫保存页面时统一使用utf-8编码
+        html = read_page_bytes(ref).decode("utf-8", errors="replace")
+        return url, find_attachment_links(html, url)
+    except Exception:
+        return url, None
+
 class WebCrawler:
     def __init__(self, csv_path, save_dir, max_workers=5):
         self.csv_path = csv_path
@@ -34,12 +79,12 @@ class WebCrawler:
         # filepages.csv文件路径
         self.filepages_csv = os.path.join(self.save_dir, "filepages.csv")
 
-        # 初始化filepages.csv文件
-        self.init_filepages_csv()
-
         # 配置日志
         self.configure_logging()
 
+        # 初始化filepages.csv文件
+        self.init_filepages_csv()
+
         # 从webpages.csv中读取URL并添加到待访问队列
         self.load_urls_from_csv()
 
@@ -56,13 +101,10 @@ class WebCrawler:
         self.logger = logging.getLogger("WebCrawler")
 
     def init_filepages_csv(self):
-        """初始化filepages.csv文件"""
-        file_exists = os.path.exists(self.filepages_csv)
-
-        with open(self.filepages_csv, mode="a", newline="", encoding="utf-8") as file:
-            writer = csv.writer(file)
-            if not file_exists:
-                writer.writerow(["Source_URL", "Attachment_URL"])
+        """初始化filepages.csv文件，记录由单独的写线程批量写入"""
+        self.manifest = ManifestWriter(
+            self.filepages_csv, ["Source_URL", "Attachment_URL"], logger=self.logger
+        )
 
     def load_urls_from_csv(self):
         """从webpages.csv中读取URL并添加到待访问队列"""
@@ -114,6 +156,8 @@ class WebCrawler:
             print("\n用户中断爬取，正在停止...")
             self.stop_event.set()
 
+        self.manifest.close()
+
         end_time = datetime.now()
         elapsed_time = (end_time - start_time).total_seconds()
 
@@ -208,69 +252,119 @@ class WebCrawler:
     def extract_attachment_links(self, html, base_url):
         """从HTML中提取附件链接并保存到filepages.csv"""
         try:
-            soup = BeautifulSoup(html, "lxml")
-            base_parsed = urlparse(base_url)
-
             self.logger.debug(f"开始从 {base_url} 提取附件链接")
 
-            for link in soup.find_all("a", href=True):
-                href = link.get("href", "").strip()
+            for attachment_url in find_attachment_links(html, base_url):
+                # 保存附件链接到filepages.csv（由写线程批量写入，不需要加锁）
+                self.write_to_filepages_csv(base_url, attachment_url)
+                self.logger.debug(f"发现附件链接: {attachment_url}")
 
-                # 过滤无效链接
-                if not href or href.startswith(('javascript:', 'mailto:', 'tel:', '#', 'data:')):
-                    continue
+            self.logger.info(f"成功从 {base_url} 提取附件链接")
 
-                # 处理相对路径
-                try:
-                    absolute_url = urljoin(base_url, href)
-                    parsed_url = urlparse(absolute_url)
+        except Exception as e:
+            self.logger.error(f"提取附件链接时出错: {str(e)}")
 
-                    # 规范化URL
-                    normalized_url = parsed_url._replace(fragment="").geturl()
+    def write_to_filepages_csv(self, source_url, attachment_url):
+        """将附件链接记录放入filepages.csv写线程的队列"""
+        self.manifest.write([source_url, attachment_url])
 
-                    # 检查是否为附件链接
-                    if any(normalized_url.lower().endswith(ext) for ext in ATTACHMENT_EXTENSIONS):
-                        # 保存附件链接到filepages.csv
-                        with self.lock:
-                            self.write_to_filepages_csv(base_url, normalized_url)
-                        self.logger.debug(f"发现附件链接: {normalized_url}")
 
-                except ValueError:
-                    continue
+class OfflineAttachmentExtractor:
+    """离线附件链接提取：直接读取主爬虫已保存的页面，用进程池解析，不发出任何网络请求"""
 
-            self.logger.info(f"成功从 {base_url} 提取附件链接")
+    def __init__(self, csv_path, save_dir, processes=None, chunksize=64):
+        self.csv_path = csv_path
+        self.save_dir = os.path.normpath(save_dir)
+        self.processes = processes
+        self.chunksize = chunksize
 
-        except Exception as e:
-            self.logger.error(f"提取附件链接时出错: {str(e)}")
+        os.makedirs(self.save_dir, exist_ok=True)
+        self.filepages_csv = os.path.join(self.save_dir, "filepages.csv")
 
-    def write_to_filepages_csv(self, source_url, attachment_url):
-        """将附件链接记录写入filepages.csv文件"""
+        log_file = os.path.join(self.save_dir, "filecrawler.log")
+        logging.basicConfig(
+            filename=log_file,
+            level=logging.INFO,
+            format='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s'
+        )
+        self.logger = logging.getLogger("OfflineAttachmentExtractor")
+
+    def load_pages(self):
+        """从webpages.csv读取(URL, 保存位置)，同一URL只保留最后一行"""
+        pages = {}
+        for row in iter_manifest(self.csv_path):
+            pages[row["URL"]] = row["Filename"]
+        return list(pages.items())
+
+    def run(self):
+        """提取全部附件链接并重新生成filepages.csv"""
+        start_time = datetime.now()
+        print(f"开始离线提取 - {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
+
+        pages = self.load_pages()
+        self.logger.info(f"从 {self.csv_path} 加载 {len(pages)} 个页面")
+
+        # 重新生成附件目录：先写临时文件，全部完成后再替换，中途失败时保留原来的filepages.csv
+        tmp_path = self.filepages_csv + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        manifest = ManifestWriter(tmp_path, ["Source_URL", "Attachment_URL"], logger=self.logger)
+
+        processed = 0
+        attachment_count = 0
+        completed = False
         try:
-            with open(self.filepages_csv, mode="a", newline="", encoding="utf-8") as file:
-                writer = csv.writer(file)
-                writer.writerow([source_url, attachment_url])
-        except Exception as e:
-            self.logger.error(f"写入filepages.csv时出错: {str(e)}")
+            with Pool(self.processes) as pool:
+                results = pool.imap_unordered(extract_attachment_links_from_page, pages, chunksize=self.chunksize)
+                for url, attachment_urls in results:
+                    processed += 1
+                    if attachment_urls is None:
+                        self.logger.error(f"读取或解析页面失败: {url}")
+                    else:
+                        for attachment_url in attachment_urls:
+                            manifest.write([url, attachment_url])
+                        attachment_count += len(attachment_urls)
+                    if processed % 1000 == 0:
+                        print(f"\r已处理: {processed}/{len(pages)} | 附件链接: {attachment_count}", end="")
+            manifest.checkpoint()
+            completed = True
+        finally:
+            manifest.close()
+            if completed:
+                os.replace(tmp_path, self.filepages_csv)
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        elapsed_time = (datetime.now() - start_time).total_seconds()
+        self.logger.info(f"离线提取完成! 页面: {processed}，附件链接: {attachment_count}，耗时: {elapsed_time:.2f}秒")
+        print(f"\n离线提取完成! 页面: {processed}，附件链接: {attachment_count}")
+        print(f"耗时: {elapsed_time:.2f}秒")
+        print(f"filepages.csv文件位置: {self.filepages_csv}")
 
 
 if __name__ == "__main__":
     csv_path = "D:\\SearchEngine\\webpages.csv"
     save_dir = "D:\\SearchEngine"
     max_workers = 10  # 设置工作线程数
+    offline = True  # 从主爬虫已保存的页面中离线提取，不重新下载
 
-    # 添加版权声明
-    print("=" * 70)
-    print("南开大学网站附件链接爬虫 - 仅用于学术研究")
-    print(f"开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"工作线程数: {max_workers}")
-    print("=" * 70)
+    if offline:
+        OfflineAttachmentExtractor(csv_path, save_dir).run()
+    else:
+        # 添加版权声明
+        print("=" * 70)
+        print("南开大学网站附件链接爬虫 - 仅用于学术研究")
+        print(f"开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"工作线程数: {max_workers}")
+        print("=" * 70)
 
-    crawler = WebCrawler(csv_path, save_dir, max_workers)
+        crawler = WebCrawler(csv_path, save_dir, max_workers)
 
-    try:
-        crawler.crawl()
-    except KeyboardInterrupt:
-        print("\n用户中断爬取，正在保存进度...")
-    finally:
-        print(f"filepages.csv文件位置: {crawler.filepages_csv}")
-        print("爬取结束!")
\ No newline at end of file
+        try:
+            crawler.crawl()
+        except KeyboardInterrupt:
+            print("\n用户中断爬取，正在保存进度...")
+        finally:
+            crawler.manifest.close()
+            print(f"filepages.csv文件位置: {crawler.filepages_csv}")
+            print("爬取结束!")
\ No newline at end of file
@@ -0,0 +1,265 @@
+import heapq
+import threading
+import time
+from collections import deque
+from itertools import count
+from queue import Queue, Empty
+from urllib.parse import urlparse
+
+
+class FIFOFrontier(Queue):
+    """先进先出的待爬取队列（原来的行为），接口与PriorityFrontier相同"""
+
+    def put(self, url, block=True, timeout=None, parent=None, prior=None):
+        super().put(url, block, timeout)
+
+    def link_prior(self, parent):
+        return 0
+
+    def observe_links(self, parent, links):
+        pass
+
+    def done(self, url):
+        pass
+
+
+class FIFOScorer:
+    """所有URL分数相同，按发现顺序出队；配合按主机轮转即为纯粹的主机轮询"""
+
+    def on_discover(self, url, parent, prior=None):
+        pass
+
+    def link_prior(self, parent):
+        return 0
+
+    def on_dequeue(self, url):
+        pass
+
+    def on_links(self, parent, links):
+        return []
+
+    def on_done(self, url):
+        pass
+
+    def score(self, url):
+        return 0.0
+
+
+class DepthScorer:
+    """广度优先：离起始页面的链接深度越小越优先"""
+
+    def __init__(self):
+        self.depth = {}  # 待爬取URL的深度
+        self.active = {}  # 已出队、尚未提取链接的URL的深度
+
+    def on_discover(self, url, parent, prior=None):
+        if prior is not None:
+            self.depth[url] = prior
+            return
+        parent_depth = self.active.get(parent)
+        self.depth[url] = 0 if parent_depth is None else parent_depth + 1
+
+    def link_prior(self, parent):
+        """parent的出链的深度；parent为None（如sitemap中的URL）时视为种子页面的出链"""
+        return self.active.get(parent, 0) + 1
+
+    def on_dequeue(self, url):
+        self.active[url] = self.depth.pop(url, 0)
+
+    def on_links(self, parent, links):
+        self.active.pop(parent, None)
+        return []
+
+    def on_done(self, url):
+        self.active.pop(url, None)
+
+    def score(self, url):
+        return -self.depth.get(url, 0)
+
+
+class OPICScorer:
+    """在线页面重要性估计（OPIC）
+
+    种子页面初始有initial_cash的现金，页面被爬取后把现金平分给它的所有出链
+    （包括已经在队列中的URL），待爬取页面按累计现金排序，被越多重要页面链接的页面越早被爬取。
+    """
+
+    def __init__(self, initial_cash=1.0):
+        self.initial_cash = initial_cash
+        self.cash = {}  # 待爬取URL的现金
+        self.active = {}  # 已出队、尚未分配现金的URL
+
+    def on_discover(self, url, parent, prior=None):
+        if prior is None:
+            prior = 0.0 if parent else self.initial_cash
+        self.cash.setdefault(url, prior)
+
+    def link_prior(self, parent):
+        """不是从本地页面发现的链接（sitemap、其他分片转来的）没有现金，只能从之后爬取的页面得到现金"""
+        return 0.0
+
+    def on_dequeue(self, url):
+        self.active[url] = self.cash.pop(url, self.initial_cash)
+
+    def on_links(self, parent, links):
+        """把parent的现金平分给出链，返回分数发生变化的待爬取URL"""
+        cash = self.active.pop(parent, self.initial_cash)
+        if not links:
+            return []
+        share = cash / len(links)
+        credited = []
+        for url in links:
+            # 只给待爬取的页面记账，已爬取的页面不再排队
+            if url in self.cash:
+                self.cash[url] += share
+                credited.append(url)
+        return credited
+
+    def on_done(self, url):
+        """URL处理结束但没有提取到链接（请求失败、非HTML等），不再保留它的现金"""
+        self.active.pop(url, None)
+
+    def score(self, url):
+        return self.cash.get(url, 0.0)
+
+
+FRONTIER_SCORERS = {
+    "fifo": FIFOScorer,
+    "depth": DepthScorer,
+    "opic": OPICScorer,
+}
+
+
+class PriorityFrontier:
+    """按分数排序的待爬取队列，接口与queue.Queue相同（put/get/get_nowait/task_done/qsize/empty）
+
+    scorer可选"fifo"、"depth"、"opic"或自定义评分对象；fair_hosts为True时按主机轮转出队，
+    每个主机内部再按分数从高到低，避免某个子站点的日历、归档等大量页面占满爬取配额。
+    URL的分数上升到入堆时的rescore_ratio倍以上才重新入堆，旧条目出堆时跳过。
+    """
+
+    def __init__(self, scorer="opic", fair_hosts=True, rescore_ratio=1.25, **scorer_kwargs):
+        self.scorer = FRONTIER_SCORERS[scorer](**scorer_kwargs) if isinstance(scorer, str) else scorer
+        self.fair_hosts = fair_hosts
+        self.rescore_ratio = rescore_ratio
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.all_tasks_done = threading.Condition(self.mutex)
+        self.unfinished_tasks = 0
+        self.heaps = {}  # 主机 -> [(-分数, 序号, url)]
+        self.hosts = deque()  # 有待爬取URL的主机，按轮转顺序
+        self.pending = {}  # url -> 入堆时的分数
+        self.seq = count()
+
+    def host_key(self, url):
+        if not self.fair_hosts:
+            return ""
+        try:
+            return (urlparse(url).hostname or "").lower()
+        except ValueError:
+            return ""
+
+    def push(self, url, score):
+        host = self.host_key(url)
+        heap = self.heaps.get(host)
+        if heap is None:
+            heap = self.heaps[host] = []
+            self.hosts.append(host)
+        heapq.heappush(heap, (-score, next(self.seq), url))
+        self.pending[url] = score
+
+    def pop(self):
+        while self.hosts:
+            host = self.hosts.popleft()
+            heap = self.heaps[host]
+            url = None
+            while heap:
+                neg_score, _, candidate = heapq.heappop(heap)
+                if self.pending.get(candidate) == -neg_score:
+                    url = candidate
+                    break
+            if heap:
+                self.hosts.append(host)
+            else:
+                del self.heaps[host]
+            if url is not None:
+                del self.pending[url]
+                self.scorer.on_dequeue(url)
+                return url
+        raise Empty
+
+    def put(self, url, block=True, timeout=None, parent=None, prior=None):
+        """加入URL，parent为发现该链接的页面（种子URL为None）
+
+        prior为link_prior返回的初始分数依据，用于不在本地提取链接的URL（sitemap、其他分片转来的链接）。
+        """
+        with self.not_empty:
+            if url in self.pending:
+                return
+            self.scorer.on_discover(url, parent, prior)
+            self.push(url, self.scorer.score(url))
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def link_prior(self, parent):
+        """parent（为None时表示没有父页面）的出链的初始分数依据，在parent的链接被观察之前调用"""
+        with self.mutex:
+            return self.scorer.link_prior(parent)
+
+    def observe_links(self, parent, links):
+        """页面的全部出链（包括已去重的），用于更新链接重要性"""
+        with self.mutex:
+            for url in self.scorer.on_links(parent, links):
+                old_score = self.pending.get(url)
+                if old_score is None:
+                    continue
+                score = self.scorer.score(url)
+                if score > old_score and (old_score <= 0 or score >= old_score * self.rescore_ratio):
+                    self.push(url, score)
+
+    def done(self, url):
+        """出队的URL处理结束（包括失败），释放评分对象为它保留的记录"""
+        with self.mutex:
+            self.scorer.on_done(url)
+
+    def get(self, block=True, timeout=None):
+        with self.not_empty:
+            if not block:
+                if not self.pending:
+                    raise Empty
+            elif timeout is None:
+                while not self.pending:
+                    self.not_empty.wait()
+            else:
+                endtime = time.monotonic() + timeout
+                while not self.pending:
+                    remaining = endtime - time.monotonic()
+                    if remaining <= 0:
+                        raise Empty
+                    self.not_empty.wait(remaining)
+            return self.pop()
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def task_done(self):
+        with self.all_tasks_done:
+            unfinished = self.unfinished_tasks - 1
+            if unfinished < 0:
+                raise ValueError("task_done() called too many times")
+            self.unfinished_tasks = unfinished
+            if unfinished == 0:
+                self.all_tasks_done.notify_all()
+
+    def join(self):
+        with self.all_tasks_done:
+            while self.unfinished_tasks:
+                self.all_tasks_done.wait()
+
+    def qsize(self):
+        with self.mutex:
+            return len(self.pending)
+
+    def empty(self):
+        with self.mutex:
+            return not self.pending
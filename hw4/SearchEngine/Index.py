@@ -1,131 +1,708 @@
 # 这个文件用于从webpages.csv文件中读取一个每一个html文件并解析title, content, anchor,
 # 并将数据存入索引web_pages中
 
-import csv
 from elasticsearch import Elasticsearch, helpers
 from bs4 import BeautifulSoup
+from datetime import datetime
 
 # Initialize Elasticsearch client
 es = Elasticsearch([{"host": "localhost", "port": 9200, "scheme": "http"}])
 
+# 中文分词：默认用内置的cjk_bigram把相邻汉字切成二元组；
+# 安装了IK分词插件（analysis-ik）时改用IK词典分词，索引时ik_max_word、查询时ik_smart
+BIGRAM_ANALYZER = {
+    "type": "custom",
+    "tokenizer": "standard",
+    "filter": ["cjk_width", "lowercase", "cjk_bigram"],
+}
+IK_ANALYZERS = {
+    "text_zh": {"type": "custom", "tokenizer": "ik_max_word", "filter": ["lowercase"]},
+    "text_zh_search": {"type": "custom", "tokenizer": "ik_smart", "filter": ["lowercase"]},
+}
+zh_text = {"type": "text", "analyzer": "text_zh", "search_analyzer": "text_zh_search"}
+
 # Define the index settings and mappings
 index_settings = {
     "settings": {
         "number_of_shards": 1,
-        "number_of_replicas": 0
+        "number_of_replicas": 0,
+        "analysis": {
+            "analyzer": {
+                "text_zh": BIGRAM_ANALYZER,
+                "text_zh_search": BIGRAM_ANALYZER,
+            }
+        },
     },
     "mappings": {
         "properties": {
             "url": {"type": "keyword"},
-            "title": {"type": "text"},
-            "content": {"type": "text"},
-            "anchors": {
-                "type": "nested",
-                "properties": {
-                    "anchor_text": {"type": "text"},
-                    "target_url": {"type": "keyword"},
-                },
-            },
+            "content_hash": {"type": "keyword"},
+            "title": zh_text,
+            "content": zh_text,
+            # 页面的出链，只保存不索引，由AnchorGraph汇总为目标页面的anchor_text
+            "outlinks": {"type": "object", "enabled": False},
+            # 指向本页面的链接的锚文本（AnchorGraph写入）和入链页面数
+            "anchor_text": zh_text,
+            "inlinks": {"type": "integer"},
+            # 静态质量分（PageRank，平均值为1），查询时用rank_feature查询加分
+            "pagerank": {"type": "rank_feature"},
         }
     },
 }
 
-# Create the index
+# 批量导入期间不刷新，导入完成后恢复为refresh_interval
+bulk_load_settings = {"refresh_interval": "-1"}
+refresh_interval = "1s"
+
+# 搜索使用的别名，实际数据在带时间戳的索引中（如web_pages-20250101120000），
+# 全量重建时先写入新索引再原子地切换别名，搜索不会看到写了一半的索引
 index_name = "web_pages"
-if es.indices.exists(index=index_name):
-    es.indices.delete(index=index_name)
-es.indices.create(index=index_name, body=index_settings)
+
+
+def has_ik_plugin():
+    """ES节点是否安装了IK分词插件"""
+    try:
+        plugins = es.cat.plugins(format="json")
+    except Exception:
+        return False
+    return any(plugin.get("component") == "analysis-ik" for plugin in plugins)
+
+
+def create_index(bulk_load=True):
+    """创建一个新的带时间戳的索引，返回索引名；bulk_load为True时先关闭刷新，导入后调用finish_bulk_load"""
+    new_index = f"{index_name}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    settings = dict(index_settings["settings"])
+    if has_ik_plugin():
+        settings["analysis"] = {"analyzer": IK_ANALYZERS}
+    if bulk_load:
+        settings.update(bulk_load_settings)
+    es.indices.create(index=new_index, body={"settings": settings, "mappings": index_settings["mappings"]})
+    return new_index
+
+
+def finish_bulk_load(index):
+    """恢复刷新，并把分段合并为一个（之后只有增量更新，合并后查询更快、占用空间更小）"""
+    es.indices.put_settings(index=index, body={"refresh_interval": refresh_interval})
+    es.indices.refresh(index=index)
+    print(f"Force merging {index}...")
+    es.indices.forcemerge(index=index, max_num_segments=1, request_timeout=3600)
+    stats = es.indices.stats(index=index, metric="store")
+    size = next(iter(stats["indices"].values()))["total"]["store"]["size_in_bytes"]
+    print(f"Index size: {size / 1024 / 1024:.1f} MB")
+
+
+def swap_alias(new_index):
+    """把别名index_name原子地切换到new_index，并删除旧索引"""
+    old_indices = []
+    actions = [{"add": {"index": new_index, "alias": index_name}}]
+    if es.indices.exists_alias(name=index_name):
+        old_indices = [name for name in es.indices.get_alias(name=index_name) if name != new_index]
+        actions = [{"remove": {"index": name, "alias": index_name}} for name in old_indices] + actions
+    elif es.indices.exists(index=index_name):
+        # 旧版本直接创建的同名索引，在同一操作中删除
+        actions.append({"remove_index": {"index": index_name}})
+    es.indices.update_aliases(body={"actions": actions})
+    for name in old_indices:
+        es.indices.delete(index=name)
 
 
 import os
-from urllib.parse import urljoin, quote, urlparse
+import re
+import codecs
+from urllib.parse import urljoin, urlparse
 import chardet
 
 
+BOM_ENCODINGS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_-]+)""", re.IGNORECASE)
+# 网页中声明的中文编码按其超集解码，避免个别生僻字解码失败
+ENCODING_ALIASES = {"gb2312": "gb18030", "gbk": "gb18030", "x-gbk": "gb18030", "big5": "big5hkscs"}
+
+
+def normalize_encoding(name):
+    """返回Python可用的编码名，无法识别时返回None"""
+    if not name:
+        return None
+    name = name.decode("ascii", errors="ignore") if isinstance(name, bytes) else name
+    name = ENCODING_ALIASES.get(name.strip().lower(), name.strip().lower())
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+def is_utf8(sample):
+    """sample能否按UTF-8解码（末尾被截断的多字节字符不算错误）"""
+    try:
+        sample.decode("utf-8")
+        return True
+    except UnicodeDecodeError as e:
+        return e.reason == "unexpected end of data" and e.start >= len(sample) - 3
+
+
+def detect_encoding(raw_data, sample_size=64 * 1024):
+    """依次根据BOM、UTF-8合法性、<meta charset>判断编码，都不能确定时只对开头sample_size字节做统计检测
+
+    爬虫保存页面时已转为UTF-8，但页面中的<meta charset>仍是原网站的声明（如gb2312），
+    所以先检查是否为合法的UTF-8，再看meta声明。
+    """
+    for bom, encoding in BOM_ENCODINGS:
+        if raw_data.startswith(bom):
+            return encoding
+    sample = raw_data[:sample_size]
+    if is_utf8(sample):
+        return "utf-8"
+    match = META_CHARSET.search(sample[:4096])
+    if match:
+        encoding = normalize_encoding(match.group(1))
+        if encoding and encoding != "utf-8":
+            return encoding
+    return normalize_encoding(chardet.detect(sample)["encoding"]) or "utf-8"
+
+
+def clean_text(text):
+    """连续的空白合并为一个空格（不能全部去掉，否则英文单词会连在一起，汉字二元组也会跨越词语边界）"""
+    return " ".join(text.split())
+
+
 # Function to extract data from HTML
-def extract_data_from_html(url, html_path):
-    with open(html_path, "rb") as file:
-        raw_data = file.read()
-        result = chardet.detect(raw_data)
-        encoding = result["encoding"]
-
-    with open(
-        html_path.replace("\\", "/"), "r", encoding=encoding, errors="ignore"
-    ) as file:
-        soup = BeautifulSoup(file, "lxml")
-        title = (
-            soup.title.string.strip().replace("\n", "").replace(" ", "")
-            if soup.title and soup.title.string
-            else ""
-        )
-        content = ",".join(
-            [
-                line.strip().replace("\n", "").replace(" ", "")
-                for line in soup.get_text().splitlines()
-                if line.strip()
-            ]
-        )
-        anchors = []
-        for a in soup.find_all("a"):
-            anchor_text = a.get_text().strip().replace("\n", "").replace(" ", "")
-            try:
-                href = a.get("href", "")
-                if not urlparse(href).netloc:
-                    target_url = urljoin(url, quote(href))
-                else:
-                    target_url = href
-                anchors.append({"anchor_text": anchor_text, "target_url": target_url})
-            except ValueError as e:
-                print(f"Skipping invalid URL {href}: {e}")
-        return title, content, anchors
+def extract_data_from_html(url, raw_data):
+    encoding = detect_encoding(raw_data)
 
+    soup = BeautifulSoup(raw_data.decode(encoding, errors="ignore"), "lxml")
+    title = (
+        clean_text(soup.title.string)
+        if soup.title and soup.title.string
+        else ""
+    )
+    content = ",".join(
+        [
+            clean_text(line)
+            for line in soup.get_text().splitlines()
+            if line.strip()
+        ]
+    )
+    anchors = []
+    for a in soup.find_all("a"):
+        anchor_text = clean_text(a.get_text())
+        try:
+            href = a.get("href", "").strip()
+            # 与爬虫相同的方式补全链接（不再quote，否则查询串中的?会被编码，与爬取的URL对不上）
+            target_url = urlparse(urljoin(url, href))._replace(fragment="").geturl()
+            anchors.append({"anchor_text": anchor_text, "target_url": target_url})
+        except ValueError as e:
+            print(f"Skipping invalid URL {href}: {e}")
+    return title, content, anchors
 
-# Read the CSV file and index the documents
-csv_file_path = "D:\\SearchEngine\\webpages.csv"
-actions = []
-i = 1
+
+from lxml import etree
+
+# 超过max_file_size的页面用流式解析，提取的content和anchors（锚文本加目标URL）总字节数不超过下面的上限
+max_content_bytes = 2 * 1024 * 1024  # 2 MB
+max_anchor_bytes = 1 * 1024 * 1024  # 1 MB
+stream_chunk_size = 1024 * 1024
+# 流式解析时不提取这些标签中的文本
+STREAM_IGNORED_TAGS = {"script", "style", "noscript"}
+# 标题、单条锚文本的最大字符数
+MAX_TITLE_LENGTH = 1000
+MAX_ANCHOR_TEXT_LENGTH = 1000
+
+
+class StreamingExtractor:
+    """lxml解析器的target：只接收开始标签、结束标签和文本事件，不建文档树，内存占用与页面大小无关
+
+    提取结果的格式与extract_data_from_html相同（content按原文的行用逗号连接），
+    但不包含script、style中的文本；某个字段达到上限后不再收集该字段。
+    """
+
+    def __init__(self, url, max_content_bytes=max_content_bytes, max_anchor_bytes=max_anchor_bytes):
+        self.url = url
+        self.max_content_bytes = max_content_bytes
+        self.max_anchor_bytes = max_anchor_bytes
+        self.ignored_depth = 0
+        self.title = None
+        self.title_parts = None  # 在<title>中时收集文本
+        self.lines = []
+        self.line = []
+        self.line_length = 0
+        self.content_size = 0
+        self.content_full = False
+        self.anchors = []
+        self.anchor = None  # 正在读取的<a>：(href, 文本片段)
+        self.anchor_size = 0
+        self.anchors_full = False
+
+    def start(self, tag, attrib):
+        if tag in STREAM_IGNORED_TAGS:
+            self.ignored_depth += 1
+        elif tag == "title" and self.title is None:
+            self.title_parts = []
+        elif tag == "a":
+            self.end_anchor()
+            if not self.anchors_full:
+                self.anchor = (attrib.get("href", ""), [])
+
+    def end(self, tag):
+        if tag in STREAM_IGNORED_TAGS:
+            self.ignored_depth = max(self.ignored_depth - 1, 0)
+        elif tag == "title":
+            self.end_title()
+        elif tag == "a":
+            self.end_anchor()
+
+    def data(self, text):
+        if self.ignored_depth:
+            return
+        if self.title_parts is not None and sum(map(len, self.title_parts)) < MAX_TITLE_LENGTH:
+            self.title_parts.append(text)
+        if self.anchor is not None and sum(map(len, self.anchor[1])) < MAX_ANCHOR_TEXT_LENGTH:
+            self.anchor[1].append(text)
+        if self.content_full:
+            return
+        for i, part in enumerate(text.split("\n")):
+            if i:
+                self.end_line()
+            self.line.append(part)
+            self.line_length += len(part)
+            # 没有换行的超长文本（如压缩过的页面）分段处理
+            if self.line_length > self.max_content_bytes:
+                self.end_line()
+
+    def comment(self, text):
+        pass
+
+    def end_line(self):
+        line = clean_text("".join(self.line))
+        self.line = []
+        self.line_length = 0
+        if not line or self.content_full:
+            return
+        encoded = line.encode("utf-8")
+        remaining = self.max_content_bytes - self.content_size
+        if len(encoded) + 1 > remaining:
+            # 截断到上限，不截断在多字节字符中间
+            line = encoded[:max(remaining - 1, 0)].decode("utf-8", errors="ignore")
+            self.content_full = True
+        if line:
+            self.lines.append(line)
+            self.content_size += len(line.encode("utf-8")) + 1
+
+    def end_title(self):
+        if self.title_parts is not None:
+            self.title = clean_text("".join(self.title_parts))[:MAX_TITLE_LENGTH]
+            self.title_parts = None
+
+    def end_anchor(self):
+        if self.anchor is None:
+            return
+        href, parts = self.anchor
+        self.anchor = None
+        anchor_text = clean_text("".join(parts))[:MAX_ANCHOR_TEXT_LENGTH]
+        try:
+            target_url = urlparse(urljoin(self.url, href.strip()))._replace(fragment="").geturl()
+        except ValueError as e:
+            print(f"Skipping invalid URL {href}: {e}")
+            return
+        size = len(anchor_text.encode("utf-8")) + len(target_url.encode("utf-8"))
+        if self.anchor_size + size > self.max_anchor_bytes:
+            self.anchors_full = True
+            return
+        self.anchors.append({"anchor_text": anchor_text, "target_url": target_url})
+        self.anchor_size += size
+
+    def close(self):
+        self.end_anchor()
+        self.end_title()
+        self.end_line()
+        return self.title or "", ",".join(self.lines), self.anchors
+
+
+def extract_data_streaming(url, chunks, max_content_bytes=max_content_bytes, max_anchor_bytes=max_anchor_bytes):
+    """流式解析页面（chunks为页面原始内容的字节块），返回值同extract_data_from_html
+
+    编码根据开头64KB判断，逐块转为UTF-8后交给lxml的增量HTML解析器
+    （指定解析器编码为UTF-8，否则lxml会按页面中<meta charset>的声明重新解码）
+    """
+    extractor = StreamingExtractor(url, max_content_bytes, max_anchor_bytes)
+    parser = etree.HTMLParser(target=extractor, encoding="utf-8", huge_tree=True, no_network=True)
+    head = b""
+    decoder = None
+    for chunk in chunks:
+        if decoder is None:
+            head += chunk
+            if len(head) < 64 * 1024:
+                continue
+            decoder = codecs.getincrementaldecoder(detect_encoding(head))(errors="ignore")
+            chunk, head = head, b""
+        text = decoder.decode(chunk)
+        if text:
+            parser.feed(text.encode("utf-8"))
+    if decoder is None:
+        decoder = codecs.getincrementaldecoder(detect_encoding(head))(errors="ignore")
+    text = decoder.decode(head, final=True)
+    if text:
+        parser.feed(text.encode("utf-8"))
+    return parser.close()
+
+
+from CrawlManifest import iter_manifest
+from PageStore import iter_page_bytes
+from ParseCache import ParseCache
+from AnchorGraph import invert_anchors, anchor_update_actions
+from PageRank import LinkGraphBuilder, pagerank, pagerank_features
+import time
+import hashlib
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from elasticsearch.helpers import BulkIndexError
+
+
+# 超过这个大小的页面不读入内存、不建BeautifulSoup文档树，改用extract_data_streaming流式解析
 max_file_size = 10 * 1024 * 1024  # 10 MB
+# 可重试的失败：ES过载（429）、服务端错误和网络异常（状态码为"N/A"）
+RETRY_STATUS = (429, 500, 502, 503, 504, "N/A")
 
-with open(csv_file_path, "r", encoding="utf-8") as csvfile:
-    reader = csv.DictReader(csvfile)
-    i = 0
-    for row in reader:
-        url = row["URL"]
-        html_path = row["Filename"]
 
-        # Check file size
-        if os.path.getsize(html_path) > max_file_size:
-            print(f"Skipping {html_path} due to large file size.")
-            continue
+def load_rows(csv_file_path):
+    """读取爬取清单，返回{url: 页面路径}
+
+    增量重爬会为变化的页面追加新行，同一URL只保留最后一行
+    """
+    rows = {}
+    for row in iter_manifest(csv_file_path):
+        rows[row["URL"]] = row["Filename"]
+    return rows
 
-        title, content, anchors = extract_data_from_html(url, html_path)
 
-        action = {
-            "_index": index_name,
-            "_source": {
-                "url": url,
-                "title": title,
-                "content": content,
-                "anchors": anchors,
-            },
+def url_id(url):
+    """文档_id：规范化URL（协议和主机名小写、去掉默认端口和fragment）的sha1"""
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc.lower()
+    if (scheme, netloc.rpartition(":")[2]) in (("http", "80"), ("https", "443")):
+        netloc = netloc.rpartition(":")[0]
+    normalized = parsed._replace(scheme=scheme, netloc=netloc, path=parsed.path or "/", fragment="").geturl()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+# 解析结果缓存的版本，修改extract_data_from_html的提取逻辑后需要加1
+PARSER_VERSION = 3
+# 解析进程中只读打开的解析结果缓存
+worker_cache = None
+
+
+def init_parse_worker(cache_dir):
+    """解析进程的初始化函数"""
+    global worker_cache
+    if cache_dir:
+        worker_cache = ParseCache(cache_dir, PARSER_VERSION, readonly=True)
+
+
+def cache_key(url, content_hash):
+    """解析结果与页面内容和URL都有关（相对链接按URL解析），缓存键包含两者"""
+    return f"{content_hash}-{url_id(url)[:16]}"
+
+
+def parse_page(task):
+    """解析进程中执行：读取页面并提取title、content和anchors
+
+    返回(url, 内容哈希, (title, content, anchors), 是否来自缓存)，内容哈希与已索引的相同时第三项为None；
+    超过max_file_size的页面先流式计算哈希，需要解析时再流式读取一遍，内存占用不随页面大小增长；
+    页面文件不存在或分段记录不完整（如爬虫还没有刷新分段存储）时抛出异常，不会把空页面当作解析结果
+    """
+    url, html_path, indexed_hash = task
+    # html_path可以是文件路径，也可以是分段存储的引用
+    chunks = iter_page_bytes(html_path, stream_chunk_size)
+    raw_data = bytearray()
+    for chunk in chunks:
+        raw_data += chunk
+        if len(raw_data) > max_file_size:
+            break
+    large = len(raw_data) > max_file_size
+
+    hasher = hashlib.sha1(raw_data)
+    if large:
+        raw_data = None
+        for chunk in chunks:
+            hasher.update(chunk)
+    chunks.close()
+    content_hash = hasher.hexdigest()
+    if content_hash == indexed_hash:
+        return url, content_hash, None, False
+    if worker_cache is not None:
+        cached = worker_cache.get(cache_key(url, content_hash))
+        if cached is not None:
+            return url, content_hash, (cached["title"], cached["content"], cached["anchors"]), True
+    if large:
+        print(f"Streaming parse of large page {html_path}")
+        return url, content_hash, extract_data_streaming(url, iter_page_bytes(html_path, stream_chunk_size)), False
+    return url, content_hash, extract_data_from_html(url, bytes(raw_data)), False
+
+
+def iter_parsed(tasks, processes=None, window=None, ordered=False, cache_dir=None):
+    """用进程池并行解析页面，按完成顺序（ordered为True时按提交顺序）逐个返回结果
+
+    同时提交的页面不超过window个，写入ES较慢时解析结果不会在内存中堆积；
+    cache_dir为解析结果缓存目录，命中缓存的页面不再解析
+    """
+    processes = processes or os.cpu_count() or 1
+    window = window or processes * 4
+    tasks = iter(tasks)
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_parse_worker, initargs=(cache_dir,)) as pool:
+        futures = deque()
+        for task in itertools.islice(tasks, window):
+            futures.append(pool.submit(parse_page, task))
+        while futures:
+            if ordered:
+                done = [futures.popleft()]
+            else:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    futures.remove(future)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Failed to parse page: {e}")
+                    result = None
+                for task in itertools.islice(tasks, 1):
+                    futures.append(pool.submit(parse_page, task))
+                if result is not None:
+                    yield result
+
+
+def load_indexed_hashes():
+    """读取当前索引中每个文档的_id和内容哈希"""
+    hashes = {}
+    for hit in helpers.scan(es, index=index_name, query={"_source": ["content_hash"]}, size=1000):
+        hashes[hit["_id"]] = hit["_source"].get("content_hash")
+    return hashes
+
+
+def update_link_features(target_index):
+    """根据所有页面的出链计算链接特征：目标页面的入链锚文本（见AnchorGraph）和PageRank（见PageRank）"""
+    es.indices.refresh(index=target_index)
+    known_ids = set()
+    previous_ids = []
+    for hit in helpers.scan(es, index=target_index, query={"_source": ["inlinks"]}, size=1000):
+        known_ids.add(hit["_id"])
+        if hit["_source"].get("inlinks"):
+            previous_ids.append(hit["_id"])
+
+    pages = (
+        (hit["_source"]["url"], hit["_source"].get("outlinks"))
+        for hit in helpers.scan(es, index=target_index, query={"_source": ["url", "outlinks"]}, size=500)
+    )
+    link_graph = LinkGraphBuilder(known_ids)
+    inbound, inlinks = invert_anchors(pages, url_id, known_ids, link_graph)
+
+    start = time.perf_counter()
+    indptr, indices, nodes = link_graph.build()
+    ranks = pagerank_features(pagerank(indptr, indices))
+    print(f"PageRank: {len(nodes)} pages, {len(indices)} links, {time.perf_counter() - start:.1f}s")
+    extra_fields = {node: {"pagerank": float(rank)} for node, rank in zip(nodes, ranks)}
+
+    print(f"Updating anchor text of {len(inlinks)} documents and PageRank of {len(extra_fields)} documents...")
+    return index_documents(anchor_update_actions(target_index, inbound, inlinks, previous_ids, extra_fields))
+
+
+def generate_actions(rows, target_index=index_name, indexed_hashes=None, processes=None, stats=None,
+                     cache=None):
+    """并行解析页面并生成写入动作，不在内存中保留整个语料
+
+    indexed_hashes为{_id: 内容哈希}时只写入新增和内容变化的页面，并删除清单中已不存在的URL；
+    cache为ParseCache时优先使用缓存的解析结果，新解析的页面写入缓存
+    """
+    indexed_hashes = indexed_hashes or {}
+    stats = stats if stats is not None else {}
+    stats.setdefault("unchanged", 0)
+    stats.setdefault("deleted", 0)
+    stats.setdefault("cached", 0)
+    ids = {url: url_id(url) for url in rows}
+    tasks = ((url, html_path, indexed_hashes.get(ids[url])) for url, html_path in rows.items())
+    if cache is not None:
+        # 解析进程只能看到已写入文件的记录
+        cache.flush()
+
+    for url, content_hash, parsed, cached in iter_parsed(tasks, processes, cache_dir=cache and cache.cache_dir):
+        if parsed is None:
+            stats["unchanged"] += 1
+            continue
+        title, content, anchors = parsed
+        if cached:
+            stats["cached"] += 1
+        elif cache is not None:
+            cache.put(cache_key(url, content_hash), {"title": title, "content": content, "anchors": anchors})
+        source = {
+            "url": url,
+            "content_hash": content_hash,
+            "title": title,
+            "content": content,
+            "outlinks": anchors,
         }
+        if indexed_hashes:
+            # 增量更新时只替换页面自身的字段，保留AnchorGraph写入的anchor_text和inlinks
+            yield {"_op_type": "update", "_index": target_index, "_id": ids[url], "doc": source, "doc_as_upsert": True}
+        else:
+            yield {"_index": target_index, "_id": ids[url], "_source": source}
+
+    current = set(ids.values())
+    for doc_id in indexed_hashes:
+        if doc_id not in current:
+            stats["deleted"] += 1
+            yield {"_op_type": "delete", "_index": target_index, "_id": doc_id}
+
+
+class BulkProgress:
+    """批量写入的进度统计，每写完一批（chunk_size个文档）输出该批和累计的吞吐量"""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.start = self.batch_start = time.perf_counter()
+        self.success = 0
+        self.failed = 0
+        self.batch_count = 0
+
+    def record(self, ok):
+        if ok:
+            self.success += 1
+        else:
+            self.failed += 1
+        self.batch_count += 1
+        if self.batch_count >= self.batch_size:
+            self.report()
+
+    def report(self):
+        now = time.perf_counter()
+        batch_rate = self.batch_count / max(now - self.batch_start, 1e-9)
+        total_rate = (self.success + self.failed) / max(now - self.start, 1e-9)
+        print(f"Indexed {self.success} documents ({self.failed} failed) | "
+              f"batch: {batch_rate:.1f} docs/s | overall: {total_rate:.1f} docs/s")
+        self.batch_start = now
+        self.batch_count = 0
+
+
+def track_pending(actions, pending):
+    """记录已交给写入线程、还未得到结果的文档，用于失败重试"""
+    for action in actions:
+        pending[action["_id"]] = action
+        yield action
+
+
+def index_documents(actions, thread_count=4, chunk_size=500, max_chunk_bytes=10 * 1024 * 1024,
+                    max_retries=3, initial_backoff=2):
+    """边解析边写入：parallel_bulk多线程发送，每批不超过chunk_size个文档和max_chunk_bytes字节
+
+    可重试的失败文档在全部写完后用streaming_bulk重试（429时按指数退避），返回(成功数, 失败数)
+    """
+    pending = {}
+    retries = []
+    progress = BulkProgress(chunk_size)
+    results = helpers.parallel_bulk(
+        es, track_pending(actions, pending), thread_count=thread_count, chunk_size=chunk_size,
+        max_chunk_bytes=max_chunk_bytes, raise_on_error=False, raise_on_exception=False,
+        request_timeout=120,
+    )
+    for ok, item in results:
+        op_type, op_result = next(iter(item.items()))
+        action = pending.pop(op_result.get("_id"), None)
+        if not ok and op_type in ("delete", "update") and op_result.get("status") == 404:
+            # 要删除或更新锚文本的文档已经不存在
+            ok = True
+        if not ok:
+            if op_result.get("status") in RETRY_STATUS and action is not None:
+                retries.append(action)
+                continue
+            print(f"Failed to index {op_result.get('_id')}: {op_result.get('error')}")
+        progress.record(ok)
+
+    for attempt in range(max_retries):
+        if not retries:
+            break
+        print(f"Retrying {len(retries)} failed documents (attempt {attempt + 1})...")
+        time.sleep(initial_backoff * 2 ** attempt)
+        failed_actions, retries = retries, []
+        by_id = {action["_id"]: action for action in failed_actions}
+        try:
+            for ok, item in helpers.streaming_bulk(
+                es, failed_actions, chunk_size=chunk_size, max_chunk_bytes=max_chunk_bytes,
+                raise_on_error=False, raise_on_exception=False, max_retries=max_retries,
+                initial_backoff=initial_backoff, request_timeout=120,
+            ):
+                op_result = next(iter(item.values()))
+                if ok:
+                    progress.record(True)
+                elif op_result.get("status") in RETRY_STATUS:
+                    retries.append(by_id[op_result["_id"]])
+                else:
+                    print(f"Failed to index {op_result.get('_id')}: {op_result.get('error')}")
+                    progress.record(False)
+        except BulkIndexError as e:
+            print(f"Bulk retry error: {e}")
+            retries = failed_actions
+
+    for _ in retries:
+        progress.record(False)
+    if progress.batch_count:
+        progress.report()
+    return progress.success, progress.failed
+
+
+def rebuild_index(rows, max_failed_ratio=0.01, cache=None):
+    """全量重建：写入新索引，完成后切换别名；失败过多时保留原索引"""
+    new_index = create_index()
+    print(f"Rebuilding {len(rows)} documents into {new_index}...")
+    stats = {}
+    success, failed = index_documents(generate_actions(rows, new_index, stats=stats, cache=cache))
+    print(f"Parse cache hits: {stats['cached']}")
+    if success == 0 or failed > max_failed_ratio * (success + failed):
+        print(f"Too many failures ({failed}), keeping the current index.")
+        es.indices.delete(index=new_index)
+        return success, failed
+    update_link_features(new_index)
+    finish_bulk_load(new_index)
+    swap_alias(new_index)
+    return success, failed
+
+
+def update_index(rows, cache=None):
+    """增量更新：只写入新增或内容变化的页面，删除清单中已不存在的URL"""
+    indexed_hashes = load_indexed_hashes()
+    print(f"Updating index: {len(rows)} documents in manifest, {len(indexed_hashes)} indexed...")
+    stats = {}
+    success, failed = index_documents(generate_actions(rows, index_name, indexed_hashes, stats=stats, cache=cache))
+    print(f"Unchanged: {stats['unchanged']}, deleted: {stats['deleted']}, parse cache hits: {stats['cached']}")
+    if success:
+        update_link_features(index_name)
+    return success, failed
+
+
+def main():
+    # Read the CSV file and index the documents
+    # 爬虫使用JSONL格式清单时把路径改为webpages.jsonl即可
+    csv_file_path = "D:\\SearchEngine\\webpages.csv"
+    full_rebuild = False  # 设为True时全量重建索引，否则只更新变化的页面
+    # 解析结果缓存，修改映射或分词器后重建索引时不必重新解析HTML；设为None时不使用
+    parse_cache_dir = "D:\\SearchEngine\\ParseCache"
+
+    rows = load_rows(csv_file_path)
+    cache = ParseCache(parse_cache_dir, PARSER_VERSION) if parse_cache_dir else None
+    start = time.perf_counter()
+    try:
+        if full_rebuild or not es.indices.exists_alias(name=index_name):
+            success, failed = rebuild_index(rows, cache=cache)
+        else:
+            success, failed = update_index(rows, cache=cache)
+    finally:
+        if cache is not None:
+            cache.close()
+    print(f"Done! {success} indexed, {failed} failed, {time.perf_counter() - start:.1f}s")
+
 
-        # 打印所有获取到的数据
-        # print(f"URL: {url}")
-        # print(f"Title: {title}")
-        # print(f"Content: {content[:100]}...")  # Print only the first 100 characters of content for brevity
-        # print("Anchors:")
-        # for anchor in anchor_texts:
-        #     print(f"  Anchor Text: {anchor['anchor_text']}, Target URL: {anchor['target_url']}")
-
-        actions.append(action)
-        i += 1
-        # if i ==10:
-        #     break
-        if i % 100 == 0:
-            print(f"Processed {i} documents.")
-
-# Bulk index the documents
-print("Indexing...")
-helpers.bulk(es, actions, chunk_size=100, request_timeout=120)
-print("Done!")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -19,7 +19,8 @@ index_name = "web_pages"
 
 # 获取索引映射和设置
 try:
-    index_info = es.indices.get(index=index_name)[index_name]
+    # index_name可能是指向带时间戳索引的别名，结果以实际索引名为键
+    index_info = next(iter(es.indices.get(index=index_name).values()))
     
     # 创建报告文件
     with open(report_file, "w", encoding="utf-8") as f:
@@ -33,7 +34,7 @@ try:
         # 1. 索引整体结构
         f.write("1. 索引整体结构\n")
         f.write("="*60 + "\n")
-        f.write(f"索引状态: {es.indices.stats(index=index_name)['indices'][index_name]['health']}\n")
+        f.write(f"索引状态: {next(iter(es.indices.stats(index=index_name)['indices'].values()))['health']}\n")
         f.write(f"文档总数: {es.count(index=index_name)['count']}\n")
         f.write(f"主分片数: {index_info['settings']['index']['number_of_shards']}\n")
         f.write(f"副本分片数: {index_info['settings']['index']['number_of_replicas']}\n")
@@ -71,24 +72,20 @@ try:
             f.write(f"  - 分词器: 标准分词器 (standard)\n")
         f.write(f"  - 索引方式: 全文索引，支持复杂查询和相关性计算\n\n")
         
-        # 2.4 锚文本字段
-        anchors_field = properties['anchors']
-        f.write("锚文本字段 (nested类型):\n")
-        f.write(f"  - 存储方式: {anchors_field['type']}\n")
-        f.write(f"  - 结构: 嵌套对象，包含以下子字段:\n")
-        
-        # 锚文本子字段
-        anchor_props = anchors_field['properties']
-        f.write(f"    * 锚文本 (anchor_text):\n")
-        f.write(f"        - 类型: {anchor_props['anchor_text']['type']}\n")
-        if 'analyzer' in anchor_props['anchor_text']:
-            f.write(f"        - 分词器: {anchor_props['anchor_text']['analyzer']}\n")
+        # 2.4 入链锚文本字段
+        anchor_field = properties['anchor_text']
+        f.write("入链锚文本字段 (text类型):\n")
+        f.write(f"  - 存储方式: {anchor_field['type']}\n")
+        if 'analyzer' in anchor_field:
+            f.write(f"  - 分词器: {anchor_field['analyzer']}\n")
         else:
-            f.write(f"        - 分词器: 标准分词器 (standard)\n")
+            f.write(f"  - 分词器: 标准分词器 (standard)\n")
+        f.write(f"  - 内容: 其他页面指向本页面的链接的锚文本（由AnchorGraph汇总）\n\n")
         
-        f.write(f"    * 目标URL (target_url):\n")
-        f.write(f"        - 类型: {anchor_props['target_url']['type']}\n")
-        f.write(f"        - 索引方式: 精确值索引，不分词\n")
+        # 2.5 出链字段
+        f.write("出链字段 (outlinks):\n")
+        f.write(f"  - 存储方式: object，不建索引，只保存在_source中\n")
+        f.write(f"  - 结构: 锚文本 (anchor_text) 和目标URL (target_url)\n")
         f.write("\n")
         
         # 3. 文档示例展示
@@ -111,8 +108,12 @@ try:
             f.write(f"  - 内容摘要: {doc['content'][:100]}...\n")
             
             # 锚文本处理
-            f.write("  - 锚文本:\n")
-            for j, anchor in enumerate(doc['anchors'][:3]):  # 只显示前3个锚文本
+            f.write(f"  - 入链数: {doc.get('inlinks', 0)}\n")
+            f.write("  - 入链锚文本:\n")
+            for j, anchor_text in enumerate(doc.get('anchor_text', [])[:3]):  # 只显示前3个锚文本
+                f.write(f"      {j+1}. '{anchor_text[:30]}'\n")
+            f.write("  - 出链:\n")
+            for j, anchor in enumerate(doc.get('outlinks', [])[:3]):
                 f.write(f"      {j+1}. '{anchor['anchor_text'][:30]}' -> {anchor['target_url']}\n")
             
             f.write("\n")
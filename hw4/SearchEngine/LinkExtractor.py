@@ -0,0 +1,59 @@
+import html as htmllib
+import re
+from urllib.parse import urljoin, urlparse
+
+# <a ... href=...> 中的链接，支持双引号、单引号和不带引号三种写法
+HREF_PATTERN = re.compile(
+    r"""<a\s[^>]*?\bhref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""",
+    re.IGNORECASE,
+)
+BASE_PATTERN = re.compile(
+    r"""<base\s[^>]*?\bhref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""",
+    re.IGNORECASE,
+)
+# 注释和脚本中的<a href>不是真正的链接
+SKIP_PATTERN = re.compile(r"<!--.*?-->|<script\b.*?</script\s*>", re.IGNORECASE | re.DOTALL)
+
+INVALID_PREFIXES = ('javascript:', 'mailto:', 'tel:', '#', 'data:')
+
+
+def is_allowed_domain(url, allowed_domains):
+    """检查URL的域名是否为allowed_domains中某个域名或其子域名"""
+    try:
+        domain = (urlparse(url).hostname or "").lower()
+    except ValueError:
+        return False
+    return any(domain == d or domain.endswith("." + d) for d in allowed_domains)
+
+
+def extract_hrefs(html):
+    """逐个扫描<a>标签取出href，不构建DOM树"""
+    html = SKIP_PATTERN.sub("", html)
+    return [htmllib.unescape(m.group(1) or m.group(2) or m.group(3) or "").strip()
+            for m in HREF_PATTERN.finditer(html)]
+
+
+def parse_links(html, base_url, allowed_domains):
+    """提取页面中指向允许域名的链接，返回去掉fragment后的绝对URL列表（保持出现顺序并去重）
+
+    只依赖参数和标准库，可直接作为进程池任务。
+    """
+    base = BASE_PATTERN.search(html)
+    if base:
+        base_url = urljoin(base_url, htmllib.unescape(base.group(1) or base.group(2) or base.group(3) or ""))
+
+    links = []
+    seen = set()
+    for href in extract_hrefs(html):
+        # 过滤无效链接
+        if not href or href.startswith(INVALID_PREFIXES):
+            continue
+        try:
+            # 处理相对路径并规范化URL
+            normalized_url = urlparse(urljoin(base_url, href))._replace(fragment="").geturl()
+        except ValueError:
+            continue
+        if normalized_url not in seen and is_allowed_domain(normalized_url, allowed_domains):
+            seen.add(normalized_url)
+            links.append(normalized_url)
+    return links
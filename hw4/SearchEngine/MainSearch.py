@@ -1,5 +1,6 @@
 from flask import Flask, render_template, request, redirect, url_for, session, jsonify
 from Search import all_search
+from PageStore import PageStore, read_page_bytes, page_exists
 import os
 import json
 from collections import defaultdict
@@ -217,12 +218,20 @@ def suggest():
     
     return jsonify(all_suggestions)
 
+# 分段页面存储目录，爬虫使用PageStore时快照直接按URL随机读取
+PAGE_STORE_DIR = 'D:\\SearchEngine\\PageStore'
+page_store = PageStore(PAGE_STORE_DIR, readonly=True) if os.path.exists(PAGE_STORE_DIR) else None
+
 # 处理网页快照请求
 @app.route('/snapshot')
 def snapshot():
     if 'username' not in session:
         return redirect(url_for('login'))
     url = request.args.get('url')
+    if page_store:
+        ref = page_store.ref(url)
+        if ref:
+            return read_page_bytes(ref).decode('utf-8', errors='replace')
     # 根据URL查找对应的本地文件
     csv_file = 'D:\\SearchEngine\\webpages.csv'
     with open(csv_file, 'r', encoding='utf-8') as file:
@@ -230,10 +239,8 @@ def snapshot():
         for row in reader:
             if row['URL'] == url:
                 file_path = row['Filename']
-                if os.path.exists(file_path):
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        html_content = f.read()
-                    return html_content
+                if page_exists(file_path):
+                    return read_page_bytes(file_path).decode('utf-8', errors='replace')
     return "未找到网页快照。"
 
 if __name__ == '__main__':
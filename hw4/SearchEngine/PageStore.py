@@ -0,0 +1,344 @@
+import gzip
+import os
+import threading
+import zlib
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class GzipCodec:
+    ext = ".warc.gz"
+
+    def compress(self, data):
+        return gzip.compress(data, compresslevel=6)
+
+    def decompress(self, data):
+        return gzip.decompress(data)
+
+    def decompressobj(self):
+        return zlib.decompressobj(wbits=31)
+
+
+class ZstdCodec:
+    ext = ".warc.zst"
+
+    def __init__(self):
+        if zstandard is None:
+            raise ImportError("使用zstd压缩需要安装zstandard")
+        self.local = threading.local()
+
+    def compress(self, data):
+        # ZstdCompressor不能被多个线程同时使用
+        compressor = getattr(self.local, "compressor", None)
+        if compressor is None:
+            compressor = self.local.compressor = zstandard.ZstdCompressor(level=3)
+        return compressor.compress(data)
+
+    def decompress(self, data):
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    def decompressobj(self):
+        return zstandard.ZstdDecompressor().decompressobj()
+
+
+CODECS = {"gzip": GzipCodec, "zstd": ZstdCodec}
+
+
+def codec_for(path):
+    """根据分段文件扩展名选择解压方式"""
+    return ZstdCodec() if path.endswith(ZstdCodec.ext) else GzipCodec()
+
+
+def build_record(url, body):
+    """构造类似WARC的记录：头部 + 空行 + 页面内容"""
+    header = (
+        "WARC/1.0\r\n"
+        "WARC-Type: response\r\n"
+        f"WARC-Target-URI: {url}\r\n"
+        f"WARC-Date: {datetime.now().isoformat()}\r\n"
+        "Content-Type: text/html; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "\r\n"
+    )
+    return header.encode("utf-8") + body + b"\r\n\r\n"
+
+
+def parse_record(record):
+    """解析记录，返回(头部dict, 页面内容bytes)"""
+    head, _, rest = record.partition(b"\r\n\r\n")
+    headers = {}
+    for line in head.decode("utf-8", errors="replace").split("\r\n")[1:]:
+        key, _, value = line.partition(":")
+        headers[key.strip()] = value.strip()
+    length = int(headers.get("Content-Length", len(rest)))
+    return headers, rest[:length]
+
+
+def scan_segment(path, start=0, chunk_size=1 << 20):
+    """从start处顺序扫描分段文件，逐条返回(偏移, 压缩长度, 头部dict, 页面内容)"""
+    codec = codec_for(path)
+    with open(path, "rb") as file:
+        file.seek(start)
+        offset = start
+        data = file.read(chunk_size)
+        while data:
+            decomp = codec.decompressobj()
+            parts = []
+            consumed = 0
+            while True:
+                parts.append(decomp.decompress(data))
+                if decomp.eof:
+                    # 一条记录结束，剩余数据属于下一条记录
+                    rest = decomp.unused_data
+                    consumed += len(data) - len(rest)
+                    data = rest
+                    break
+                consumed += len(data)
+                data = file.read(chunk_size)
+                if not data:
+                    # 文件末尾不完整的记录（写入时崩溃）直接忽略
+                    return
+            headers, body = parse_record(b"".join(parts))
+            yield offset, consumed, headers, body
+            offset += consumed
+            if not data:
+                data = file.read(chunk_size)
+
+
+def is_store_ref(ref):
+    """判断CSV中的Filename是否为分段存储的引用（segment#offset:length）"""
+    path, sep, pos = ref.rpartition("#")
+    return bool(sep) and ":" in pos and pos.replace(":", "").isdigit()
+
+
+def parse_ref(ref):
+    path, _, pos = ref.rpartition("#")
+    offset, _, length = pos.partition(":")
+    return path, int(offset), int(length)
+
+
+def read_page_bytes(ref):
+    """读取页面原始内容，ref可以是普通文件路径，也可以是分段存储的引用；分段记录不完整时抛出EOFError"""
+    if not is_store_ref(ref):
+        with open(ref, "rb") as file:
+            return file.read()
+    path, offset, length = parse_ref(ref)
+    with open(path, "rb") as file:
+        file.seek(offset)
+        data = file.read(length)
+    if len(data) < length:
+        # 记录还没有写入磁盘（写入方未刷新）或分段文件被截断
+        raise EOFError(f"页面记录不完整: {ref}（读到{len(data)}/{length}字节）")
+    headers, body = parse_record(codec_for(path).decompress(data))
+    if len(body) < int(headers.get("Content-Length", len(body))):
+        raise EOFError(f"页面记录不完整: {ref}")
+    return body
+
+
+def iter_page_bytes(ref, chunk_size=1 << 20):
+    """逐块读取页面原始内容，不把整个页面读入内存（用于很大的页面），ref同read_page_bytes
+
+    分段记录没有完整写入磁盘时抛出EOFError，不会把不完整的页面当作完整页面返回
+    """
+    if not is_store_ref(ref):
+        with open(ref, "rb") as file:
+            while True:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+    path, offset, length = parse_ref(ref)
+    decomp = codec_for(path).decompressobj()
+    head = b""
+    remaining = None  # 页面内容还剩的字节数，读完记录头之前为None
+    with open(path, "rb") as file:
+        file.seek(offset)
+        while length > 0:
+            # 压缩数据每次少读一些，解压后的块不会太大
+            data = file.read(min(chunk_size // 16 or 1, length))
+            if not data:
+                raise EOFError(f"页面记录不完整: {ref}（还有{length}字节未读到）")
+            length -= len(data)
+            body = decomp.decompress(data)
+            if remaining is None:
+                head += body
+                if b"\r\n\r\n" not in head:
+                    continue
+                headers, body = parse_record(head)
+                head = b""
+                remaining = int(headers["Content-Length"])
+            body = body[:remaining]
+            remaining -= len(body)
+            if body:
+                yield body
+            if remaining <= 0:
+                return
+    # 压缩数据读完了页面内容还不完整
+    raise EOFError(f"页面记录不完整: {ref}")
+
+
+def page_exists(ref):
+    """页面是否仍可读取"""
+    if is_store_ref(ref):
+        return os.path.exists(parse_ref(ref)[0])
+    return os.path.exists(ref)
+
+
+class PageStore:
+    """分段压缩页面存储，代替每个页面一个.html文件
+
+    页面逐条压缩后追加到大的分段文件（segment-00000.warc.gz等，每条记录是独立的gzip/zstd帧），
+    写满segment_size后切换到新分段；index.tsv按URL记录所在分段、偏移和压缩长度，
+    打开时载入内存，随机读取为O(1)，同时可以按分段顺序流式读取全部页面。
+    readonly为True时只读（如网页快照服务），不做崩溃恢复也不打开写文件。
+    """
+
+    def __init__(self, store_dir, compression="gzip", segment_size=1 << 30, readonly=False):
+        self.store_dir = os.path.normpath(store_dir)
+        self.readonly = readonly
+        self.codec = CODECS[compression]()
+        self.segment_size = segment_size
+        self.lock = threading.Lock()
+        self.closed = False
+        self.index = {}  # url -> (分段文件名, 偏移, 压缩长度)
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        self.index_path = os.path.join(self.store_dir, "index.tsv")
+        self.load_index()
+        self.index_file = None
+        self.segment_file = None
+        if not readonly:
+            self.index_file = open(self.index_path, "a", encoding="utf-8")
+            self.segment_id = len(self.segment_names())
+            self.open_segment()
+
+    def segment_names(self):
+        return sorted(
+            name for name in os.listdir(self.store_dir)
+            if name.startswith("segment-") and name.endswith((GzipCodec.ext, ZstdCodec.ext))
+        )
+
+    def load_index(self):
+        """载入索引，并从分段文件中补齐崩溃前未写入索引的记录"""
+        ends = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as file:
+                for line in file:
+                    parts = line.rstrip("\n").rsplit("\t", 3)
+                    if len(parts) != 4:
+                        continue
+                    url, name, offset, length = parts[0], parts[1], int(parts[2]), int(parts[3])
+                    self.index[url] = (name, offset, length)
+                    ends[name] = max(ends.get(name, 0), offset + length)
+        if self.readonly:
+            return
+
+        recovered = []
+        for name in self.segment_names():
+            path = os.path.join(self.store_dir, name)
+            end = ends.get(name, 0)
+            if os.path.getsize(path) > end:
+                try:
+                    for offset, length, headers, _ in scan_segment(path, end):
+                        url = headers.get("WARC-Target-URI", "")
+                        self.index[url] = (name, offset, length)
+                        recovered.append((url, name, offset, length))
+                        end = offset + length
+                except (OSError, EOFError, zlib.error, ValueError):
+                    pass
+                # 截掉崩溃时写了一半的记录，后续追加的记录才能被顺序扫描
+                if os.path.getsize(path) > end:
+                    with open(path, "r+b") as file:
+                        file.truncate(end)
+        if recovered:
+            with open(self.index_path, "a", encoding="utf-8") as file:
+                for url, name, offset, length in recovered:
+                    file.write(f"{url}\t{name}\t{offset}\t{length}\n")
+
+    def open_segment(self):
+        names = self.segment_names()
+        # 继续写入最后一个未写满且压缩格式相同的分段
+        if names and names[-1].endswith(self.codec.ext):
+            last = os.path.join(self.store_dir, names[-1])
+            if os.path.getsize(last) < self.segment_size:
+                self.segment_id = len(names) - 1
+        self.segment_name = f"segment-{self.segment_id:05d}{self.codec.ext}"
+        self.segment_path = os.path.join(self.store_dir, self.segment_name)
+        self.segment_file = open(self.segment_path, "ab")
+
+    def put(self, url, body):
+        """保存页面（str或bytes），返回可写入CSV的引用"""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        # 压缩在锁外完成，锁内只做追加写
+        data = self.codec.compress(build_record(url, body))
+        with self.lock:
+            if self.segment_file.tell() >= self.segment_size:
+                self.segment_file.close()
+                self.segment_id += 1
+                self.open_segment()
+            offset = self.segment_file.tell()
+            self.segment_file.write(data)
+            self.index_file.write(f"{url}\t{self.segment_name}\t{offset}\t{len(data)}\n")
+            self.index[url] = (self.segment_name, offset, len(data))
+        return f"{self.segment_path}#{offset}:{len(data)}"
+
+    def ref(self, url):
+        """返回URL最新一条记录的引用，不存在时返回None"""
+        entry = self.index.get(url)
+        if entry is None:
+            return None
+        name, offset, length = entry
+        return f"{os.path.join(self.store_dir, name)}#{offset}:{length}"
+
+    def get(self, url):
+        """随机读取URL最新保存的页面内容"""
+        ref = self.ref(url)
+        if ref is None:
+            return None
+        self.flush()
+        return read_page_bytes(ref)
+
+    def iter_latest(self):
+        """按分段和偏移顺序流式读取每个URL最新的页面，返回(url, 页面内容)"""
+        self.flush()
+        entries = sorted(self.index.items(), key=lambda item: item[1])
+        current_name, file = None, None
+        try:
+            for url, (name, offset, length) in entries:
+                if name != current_name:
+                    if file:
+                        file.close()
+                    current_name = name
+                    file = open(os.path.join(self.store_dir, name), "rb")
+                    codec = codec_for(name)
+                file.seek(offset)
+                yield url, parse_record(codec.decompress(file.read(length)))[1]
+        finally:
+            if file:
+                file.close()
+
+    def flush(self, sync=False):
+        """刷新分段和索引文件，sync为True时fsync；关闭后调用不做任何事"""
+        if self.readonly:
+            return
+        with self.lock:
+            if self.closed:
+                return
+            for f in (self.segment_file, self.index_file):
+                f.flush()
+                if sync:
+                    os.fsync(f.fileno())
+
+    def close(self):
+        if self.readonly or self.closed:
+            return
+        self.flush(sync=True)
+        with self.lock:
+            self.closed = True
+            self.segment_file.close()
+            self.index_file.close()
@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+import zlib
+
+
+class ParseCache:
+    """页面解析结果缓存，修改索引映射或分词器后重建索引时不必重新解析HTML
+
+    每条记录是zlib压缩的JSON（title、content、anchors），追加写入cache.dat；
+    cache.idx按行记录"键 偏移 长度"，第一行为解析器版本，版本与version不同时清空缓存
+    （提取逻辑修改后需要增加版本号）。键由调用方决定，一般为页面内容哈希加URL。
+    readonly为True时只读（解析进程中使用），只能看到打开时已有的记录。
+    """
+
+    def __init__(self, cache_dir, version=1, readonly=False):
+        self.cache_dir = os.path.normpath(cache_dir)
+        self.version = str(version)
+        self.readonly = readonly
+        self.lock = threading.Lock()
+        self.index = {}  # 键 -> (偏移, 长度)
+        self.data_path = os.path.join(self.cache_dir, "cache.dat")
+        self.index_path = os.path.join(self.cache_dir, "cache.idx")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.load_index()
+        self.data_file = open(self.data_path, "rb" if readonly else "a+b")
+        self.index_file = None if readonly else open(self.index_path, "a", encoding="utf-8")
+
+    def load_index(self):
+        """载入索引；版本不同时清空缓存，数据文件末尾没有索引的部分（写入时崩溃）截掉"""
+        valid = False
+        end = 0
+        if os.path.exists(self.index_path) and os.path.exists(self.data_path):
+            data_size = os.path.getsize(self.data_path)
+            with open(self.index_path, "r", encoding="utf-8") as file:
+                valid = file.readline().strip() == f"#version {self.version}"
+                for line in file if valid else ():
+                    parts = line.split()
+                    if len(parts) != 3:
+                        continue
+                    key, offset, length = parts[0], int(parts[1]), int(parts[2])
+                    if offset + length <= data_size:
+                        self.index[key] = (offset, length)
+                        end = max(end, offset + length)
+        if self.readonly:
+            return
+        if not valid:
+            self.index = {}
+            with open(self.index_path, "w", encoding="utf-8") as file:
+                file.write(f"#version {self.version}\n")
+        with open(self.data_path, "ab") as file:
+            file.truncate(end)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, key):
+        """返回缓存的解析结果（dict），不存在时返回None"""
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        offset, length = entry
+        with self.lock:
+            if not self.readonly:
+                self.data_file.flush()
+            self.data_file.seek(offset)
+            data = self.data_file.read(length)
+        return json.loads(zlib.decompress(data))
+
+    def put(self, key, value):
+        """保存解析结果（可JSON序列化的dict）"""
+        data = zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with self.lock:
+            self.data_file.seek(0, os.SEEK_END)
+            offset = self.data_file.tell()
+            self.data_file.write(data)
+            self.index_file.write(f"{key} {offset} {len(data)}\n")
+            self.index[key] = (offset, len(data))
+
+    def flush(self):
+        if self.readonly:
+            return
+        with self.lock:
+            self.data_file.flush()
+            self.index_file.flush()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.data_file.close()
+            if self.index_file:
+                self.index_file.close()
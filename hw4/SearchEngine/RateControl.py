@@ -0,0 +1,128 @@
+import threading
+import time
+
+
+class HostState:
+    """单个主机的限速状态"""
+
+    __slots__ = ("delay", "concurrency", "in_flight", "next_slot", "latency", "errors")
+
+    def __init__(self, delay, concurrency):
+        self.delay = delay
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.next_slot = 0.0
+        self.latency = None  # 响应时间的指数移动平均
+        self.errors = 0
+
+
+class AdaptiveHostLimiter:
+    """按主机自适应的并发数和请求间隔（AIMD）
+
+    请求成功且响应时间不超过target_latency时加性增加：并发数每次加1/并发数，间隔减少delay_step；
+    遇到429/503、超时或响应时间明显变慢时乘性减少：并发数减半、间隔加倍，
+    有Retry-After时在该时间之前不再请求这个主机。
+    线程和协程都可以使用：try_acquire不阻塞，返回需要等待的秒数，为0时表示已占用一个请求名额，
+    请求结束后必须调用release。
+    """
+
+    def __init__(self, initial_delay=0.5, min_delay=0.0, max_delay=30.0, initial_concurrency=2,
+                 max_concurrency=16, target_latency=1.0, delay_step=0.05, backoff_floor=0.25,
+                 connect_timeout=3, read_timeout=8, max_read_timeout=30, alpha=0.2):
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.delay_step = delay_step
+        self.backoff_floor = backoff_floor
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_read_timeout = max_read_timeout
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    def host_state(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostState(self.initial_delay, self.initial_concurrency)
+        return state
+
+    def is_new_host(self, host):
+        with self.lock:
+            return host not in self.hosts
+
+    def try_acquire(self, host):
+        """尝试占用host的一个请求名额，成功返回0，否则返回建议等待的秒数"""
+        now = time.monotonic()
+        with self.lock:
+            state = self.host_state(host)
+            if state.in_flight >= int(state.concurrency):
+                # 并发已满，等待大约一个响应时间后重试
+                return max(state.delay, min(state.latency or 0.1, 1.0))
+            if now < state.next_slot:
+                return state.next_slot - now
+            state.in_flight += 1
+            state.next_slot = now + state.delay
+            return 0.0
+
+    def acquire(self, host):
+        """阻塞直到占用host的一个请求名额（线程版本）"""
+        while True:
+            wait = self.try_acquire(host)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def release(self, host, status=None, latency=None, timed_out=False, retry_after=None):
+        """请求结束，根据结果调整host的并发数和间隔"""
+        with self.lock:
+            state = self.host_state(host)
+            state.in_flight = max(0, state.in_flight - 1)
+
+            if latency is not None:
+                previous = state.latency
+                state.latency = latency if previous is None else (1 - self.alpha) * previous + self.alpha * latency
+
+            overloaded = timed_out or status in (429, 503)
+            slow = latency is not None and state.latency > self.target_latency and latency > 2 * self.target_latency
+            if overloaded or slow:
+                state.errors += overloaded
+                state.concurrency = max(1.0, state.concurrency / 2)
+                state.delay = min(self.max_delay, max(state.delay * 2, self.backoff_floor))
+                if retry_after:
+                    state.next_slot = max(state.next_slot, time.monotonic() + min(retry_after, self.max_delay * 10))
+            elif status is not None and status < 400:
+                state.concurrency = min(self.max_concurrency, state.concurrency + 1 / state.concurrency)
+                state.delay = max(self.min_delay, state.delay - self.delay_step)
+
+    def timeout(self, host):
+        """(连接超时, 读取超时)，响应慢的主机读取超时相应放宽，避免反复超时"""
+        with self.lock:
+            state = self.hosts.get(host)
+            latency = state.latency if state and state.latency else 0.0
+        return self.connect_timeout, min(self.max_read_timeout, max(self.read_timeout, latency * 4))
+
+    def snapshot(self):
+        """各主机当前的并发数、间隔和平均响应时间"""
+        with self.lock:
+            return {
+                host: {
+                    "concurrency": int(state.concurrency),
+                    "delay": round(state.delay, 3),
+                    "in_flight": state.in_flight,
+                    "latency": round(state.latency, 3) if state.latency is not None else None,
+                    "errors": state.errors,
+                }
+                for host, state in self.hosts.items()
+            }
+
+
+def parse_retry_after(value):
+    """解析Retry-After头（秒数形式），无法解析时返回None"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
@@ -1,6 +1,6 @@
 # 搜索模块基本在这里实现
 
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, NotFoundError
 
 # Initialize Elasticsearch client
 es = Elasticsearch([{"host": "localhost", "port": 9200, "scheme": "http"}])
@@ -26,155 +26,104 @@ def search_url(query):
     return response
 
 
-def search_exact(query, identity, college):
-    """使用 'term' 查询进行精确匹配搜索，并将 identity 和 college 添加为加权因子"""
-    response = es.search(
-        index=index_name,
-        body={
-            "query": {
-                "bool": {
-                    "must": [
-                        {"term": {"title": query}},
-                        {"term": {"content": query}},
-                        {"term": {"anchors.anchor_text": query}},
-                    ],
-                    "should": [
-                        {
-                            "multi_match": {
-                                "query": identity,
-                                "fields": [
-                                    "title^7",
-                                    "content^3",
-                                    "anchors.anchor_text^2",
-                                ],
-                                "boost": 0.5,
-                            }
-                        },
-                        {
-                            "multi_match": {
-                                "query": college,
-                                "fields": [
-                                    "title^7",
-                                    "content^3",
-                                    "anchors.anchor_text^2",
-                                ],
-                                "boost": 0.5,
-                            }
+# PageRank加分：rank_feature查询按saturation函数把pagerank字段映射到(0, 1)，乘以boost后加到文本得分上，
+# 不改变匹配的文档集合；没有pagerank值的文档（如增量更新新加入、还未计算的页面）不加分
+pagerank_boost = 2.0
+pagerank_clause = {"rank_feature": {"field": "pagerank", "saturation": {"pivot": 1.0}, "boost": pagerank_boost}}
+
+
+def boost_clauses(identity, college):
+    """identity 和 college 作为加权因子的 should 子句"""
+    return [
+        {
+            "multi_match": {
+                "query": boost_text,
+                "fields": [
+                    "title^7",
+                    "content^3",
+                    "anchor_text^2",
+                ],
+                "boost": 0.5,
+            }
+        }
+        for boost_text in (identity, college)
+    ]
+
+
+def exact_query(query, identity, college):
+    """'term' 精确匹配查询，identity 和 college 作为加权因子
+
+    标题和正文必须包含查询词；入链锚文本包含查询词时只加分，没有入链的页面也能出现在精确查询的结果中
+    """
+    return {
+        "bool": {
+            "must": [
+                {"term": {"title": query}},
+                {"term": {"content": query}},
+            ],
+            "should": [{"term": {"anchor_text": query}}] + boost_clauses(identity, college) + [pagerank_clause],
+            "minimum_should_match": 0,
+        }
+    }
+
+
+def phrase_query(query, identity, college):
+    """'multi_match' 查询，identity 和 college 作为加权因子"""
+    return {
+        "bool": {
+            "must": [  # 必须匹配查询词
+                {
+                    "multi_match": {
+                        "query": query,
+                        "fields": [
+                            "title^7",
+                            "content^3",
+                            "anchor_text^2",
+                        ],
+                        "boost": 5.0,  # 查询词的权重
+                    }
+                }
+            ],
+            # 可选匹配 identity 和 college，提高分数；再加上页面静态质量分
+            "should": boost_clauses(identity, college) + [pagerank_clause],
+            "minimum_should_match": 0,
+        }
+    }
+
+
+def wildcard_query(query_text, identity, college):
+    """标题 'wildcard' 通配符查询，identity 和 college 作为加权因子"""
+    return {
+        "bool": {
+            "must": [
+                {
+                    "wildcard": {
+                        "title": {
+                            "value": query_text,
+                            "boost": 5.0,
                         }
-                    ],
-                    "minimum_should_match": 0,
+                    }
                 }
-            },
-            "size": 1000,
-        },
-    )
-    return response
+            ],
+            "should": boost_clauses(identity, college),
+            "minimum_should_match": 0,
+        }
+    }
 
 
-def search_phrase(query, identity, college):
-    """使用 'multi_match' 查询，并将 identity 和 college 添加为加权因子"""
-    response = es.search(
-        index=index_name,
-        body={
-            "query": {
-                "bool": {
-                    "must": [  # 必须匹配 string1
-                        {
-                            "multi_match": {
-                                "query": query,  # 字符串1
-                                "fields": [
-                                    "title^7",
-                                    "content^3",
-                                    "anchors.anchor_text^2",
-                                ],
-                                "boost": 5.0,  # 字符串1的权重
-                            }
-                        }
-                    ],
-                    "should": [  # 可选匹配 string2，提高分数
-                        {
-                            "multi_match": {
-                                "query": identity,  # 字符串2
-                                "fields": [
-                                    "title^7",
-                                    "content^3",
-                                    "anchors.anchor_text^2",
-                                ],
-                                "boost": 0.5,  # 字符串2的权重
-                            }
-                        },
-                        {
-                            "multi_match": {
-                                "query": college,  # 字符串3
-                                "fields": [
-                                    "title^7",
-                                    "content^3",
-                                    "anchors.anchor_text^2",
-                                ],
-                                "boost": 0.5,  # 字符串3的权重
-                            }
-                        }
-                    ],
-                    "minimum_should_match": 0, 
-                }
-            },
-            "size": 1000,
-        },
-    )
+def search_exact(query, identity, college):
+    """使用 'term' 查询进行精确匹配搜索，并将 identity 和 college 添加为加权因子"""
+    return es.search(index=index_name, body={"query": exact_query(query, identity, college), "size": 1000})
 
-    return response
 
+def search_phrase(query, identity, college):
+    """使用 'multi_match' 查询，并将 identity 和 college 添加为加权因子"""
+    return es.search(index=index_name, body={"query": phrase_query(query, identity, college), "size": 1000})
 
 
 def search_wildcard(query_text, identity, college):
     """使用 'wildcard' 查询进行通配符匹配，并将 identity 和 college 添加为加权因子"""
-    response = es.search(
-        index=index_name,
-        body={
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "wildcard": {
-                                "title": {
-                                    "value": query_text,
-                                    "boost": 5.0,  
-                                }
-                            }
-                        }
-                    ],
-                    "should": [
-                        {
-                            "multi_match": {
-                                "query": identity,
-                                "fields": [
-                                    "title^7",
-                                    "content^3",
-                                    "anchors.anchor_text^2",
-                                ],
-                                "boost": 0.5,
-                            }
-                        },
-                        {
-                            "multi_match": {
-                                "query": college,
-                                "fields": [
-                                    "title^7",
-                                    "content^3",
-                                    "anchors.anchor_text^2",
-                                ],
-                                "boost": 0.5,
-                            }
-                        }
-                    ],
-                    "minimum_should_match": 0,
-                },
-            },
-            "size": 1000,
-        },
-    )
-    return response
-
+    return es.search(index=index_name, body={"query": wildcard_query(query_text, identity, college), "size": 1000})
 
 
 def merge_results(results_list):
@@ -226,8 +175,61 @@ def load_attachments(csv_path='D:\\SearchEngine\\filepages.csv'):
 # 在模块初始化时加载附件数据
 load_attachments()
 
+attachment_index_name = "attachments"
+
+
+def search_attachments_index(query, identity, college):
+    """在附件全文索引（AttachmentPipeline生成）中搜索文件名和正文"""
+    should = []
+    for boost_text in (identity, college):
+        if boost_text:
+            should.append({
+                "multi_match": {
+                    "query": boost_text,
+                    "fields": ["filename^3", "content"],
+                    "boost": 0.5,
+                }
+            })
+    response = es.search(
+        index=attachment_index_name,
+        body={
+            "query": {
+                "bool": {
+                    "must": [
+                        {"multi_match": {"query": query, "fields": ["filename^3", "content"]}}
+                    ],
+                    "should": should,
+                }
+            },
+            "_source": ["url", "filename"],
+            "highlight": {
+                "fields": {"content": {"fragment_size": 150, "number_of_fragments": 1}}
+            },
+            "size": 100,
+        },
+    )
+    results = []
+    for hit in response["hits"]["hits"]:
+        fragments = hit.get("highlight", {}).get("content")
+        results.append({
+            'url': hit["_source"]["url"],
+            'title': f"[附件] {hit['_source']['filename']}",
+            'weight': hit["_score"],
+            'snippet': fragments[0] + "..." if fragments else None,
+        })
+    return results
+
+
 def search_attachments(query, identity, college):
-    """搜索附件元数据"""
+    """搜索附件：优先使用附件全文索引，索引不存在或不可用时按文件名匹配附件元数据"""
+    # 直接搜索，索引不存在时ES返回404，不再每次搜索前单独检查索引是否存在
+    try:
+        return search_attachments_index(query, identity, college)
+    except NotFoundError:
+        pass
+    except Exception as e:
+        print(f"Error searching attachment index: {str(e)}")
+
     keywords = query.split()
     results = []
     
@@ -264,20 +266,33 @@ def all_search(query, identity, college):
         snippet = content_snippet if content_snippet else title[:200] + "..."
         combined_results.append((url, title, snippet))
     
-    # 附件结果处理（保持原逻辑）
+    # 附件结果：有全文索引时使用正文中的高亮片段作为摘要
     attachment_results = search_attachments(query, identity, college)
     for result in attachment_results:
         combined_results.append((
             result['url'],
             result['title'],
-            "这是一个附件"  # 附件标识
+            result.get('snippet') or "这是一个附件"  # 附件标识
         ))
     
     return combined_results
 
 
-def search_and_rank(query, identity=None, college=None):
-    """处理查询并按 Elasticsearch 得分排序的主搜索函数，返回(url, title, snippet)三元组"""
+def named_query(query, name):
+    """给 bool 查询命名，命中结果的 matched_queries 中会列出文档匹配的查询词"""
+    query["bool"]["_name"] = name
+    return query
+
+
+# 搜索结果只需要这些字段生成(url, title, snippet)，不返回出链和入链锚文本
+result_source_fields = ["url", "title", "content"]
+
+
+def search_and_rank(query, identity=None, college=None, size=1000):
+    """处理查询并按 Elasticsearch 得分排序的主搜索函数，返回得分最高的 size 个(url, title, snippet)三元组
+
+    精确查询（term）没有结果时才使用短语查询和通配符查询，两者在同一次请求中完成
+    """
     print(f"Original query: {query}")
     
     # 如果是URL查询
@@ -294,38 +309,45 @@ def search_and_rank(query, identity=None, college=None):
             return []
     
     # 分割查询词
-    query_parts = query.split(" ")
-    
-    # 执行精确查询
-    exact_results = []
-    for part in query_parts:
-        if "*" not in part and "?" not in part:
-            exact_response = search_exact(part, identity, college)
-            if exact_response["hits"]["hits"]:
-                exact_results.append(exact_response)
-    
-    # 如果精确查询有结果，直接返回
-    if exact_results:
-        merged_exact_results = merge_results(exact_results)
-        return [extract_result(hit) for hit in merged_exact_results]
-    
-    # 执行多种查询
-    results_list = []
+    query_parts = [part for part in query.split(" ") if part]
+    exact_clauses = []
+    fallback_clauses = []
     for part in query_parts:
         if "*" in part or "?" in part:
-            wildcard_response = search_wildcard(part, identity, college)
-            if wildcard_response["hits"]["hits"]:
-                results_list.append(wildcard_response)
+            fallback_clauses.append(named_query(wildcard_query(part, identity, college), f"wildcard:{part}"))
         else:
-            phrase_response = search_phrase(part, identity, college)
-            if phrase_response["hits"]["hits"]:
-                results_list.append(phrase_response)
-    
-    # 合并结果并按 ES 得分排序
-    merged_results = merge_results(results_list) if results_list else []
-    
-    # 提取结果生成三元组
-    return [extract_result(hit) for hit in merged_results]
+            exact_clauses.append(named_query(exact_query(part, identity, college), f"exact:{part}"))
+            fallback_clauses.append(named_query(phrase_query(part, identity, college), f"phrase:{part}"))
+
+    # 精确查询和后备查询（短语/通配符）放在一个 _msearch 请求中；
+    # 每一层的各个查询词用 dis_max 合并，文档得分取其匹配的查询词中的最高分，与 merge_results 的去重方式相同，
+    # 由 ES 直接返回合并后得分最高的 size 个结果
+    tiers = [("exact", exact_clauses), ("fallback", fallback_clauses)]
+    searches = []
+    for _, clauses in tiers:
+        if clauses:
+            searches.append({"index": index_name})
+            searches.append({
+                "query": {"dis_max": {"queries": clauses, "tie_breaker": 0}},
+                "_source": result_source_fields,
+                "size": size,
+            })
+    if not searches:
+        return []
+    responses = iter(es.msearch(body=searches)["responses"])
+
+    # 精确查询有结果时只返回精确查询的结果
+    for tier, clauses in tiers:
+        if not clauses:
+            continue
+        response = next(responses)
+        if "error" in response:
+            print(f"Error in {tier} search: {response['error']}")
+            continue
+        hits = response["hits"]["hits"]
+        if hits:
+            return [extract_result(hit) for hit in hits]
+    return []
 
 
 def extract_result(hit):
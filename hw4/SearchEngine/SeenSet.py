@@ -0,0 +1,153 @@
+import hashlib
+import math
+import threading
+from array import array
+from bisect import bisect_left
+
+
+def url_fingerprint(url):
+    """计算URL的64位指纹"""
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class FingerprintSet:
+    """精确的64位指纹集合
+
+    主体是有序的array('Q')（每个URL 8字节），新指纹先放入小缓冲集合，
+    缓冲区超过阈值后整体归并进有序数组，查找时二分。
+    """
+
+    def __init__(self, merge_threshold=4096):
+        self.merge_threshold = merge_threshold
+        self.sorted_fps = array("Q")
+        self.buffer = set()
+
+    def __contains__(self, fp):
+        if fp in self.buffer:
+            return True
+        i = bisect_left(self.sorted_fps, fp)
+        return i < len(self.sorted_fps) and self.sorted_fps[i] == fp
+
+    def add(self, fp):
+        """加入指纹，返回是否为新指纹"""
+        if fp in self:
+            return False
+        self.buffer.add(fp)
+        # 阈值随数组增长，使归并的均摊代价保持为常数
+        if len(self.buffer) >= max(self.merge_threshold, len(self.sorted_fps) // 8):
+            self.merge()
+        return True
+
+    def merge(self):
+        """将缓冲区归并进有序数组（两段有序序列拼接后timsort为线性时间）"""
+        merged = self.sorted_fps + array("Q", sorted(self.buffer))
+        self.sorted_fps = array("Q", sorted(merged))
+        self.buffer = set()
+
+    def __len__(self):
+        return len(self.sorted_fps) + len(self.buffer)
+
+
+class BloomFilter:
+    """固定容量的布隆过滤器，用指纹的高低32位做双重哈希"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def positions(self, fp):
+        h1 = fp & 0xFFFFFFFF
+        h2 = (fp >> 32) | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, fp):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self.positions(fp))
+
+    def add(self, fp):
+        """加入指纹，返回是否为新指纹（可能因误判返回False）"""
+        is_new = False
+        for p in self.positions(fp):
+            mask = 1 << (p & 7)
+            if not self.bits[p >> 3] & mask:
+                self.bits[p >> 3] |= mask
+                is_new = True
+        if is_new:
+            self.count += 1
+        return is_new
+
+
+class ScalableBloomFilter:
+    """可扩容的布隆过滤器：写满后追加容量更大、误判率更低的过滤器，总误判率不超过error_rate"""
+
+    def __init__(self, initial_capacity=100000, error_rate=0.001, growth=2, tightening=0.5):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.filters = []
+        self.add_filter()
+
+    def add_filter(self):
+        n = len(self.filters)
+        capacity = self.initial_capacity * self.growth ** n
+        # 各层误判率构成等比数列，求和后不超过error_rate
+        error = self.error_rate * (1 - self.tightening) * self.tightening ** n
+        self.filters.append(BloomFilter(capacity, error))
+
+    def __contains__(self, fp):
+        return any(fp in f for f in self.filters)
+
+    def add(self, fp):
+        if fp in self:
+            return False
+        if self.filters[-1].count >= self.filters[-1].capacity:
+            self.add_filter()
+        self.filters[-1].add(fp)
+        return True
+
+    def __len__(self):
+        return sum(f.count for f in self.filters)
+
+
+SEEN_SET_BACKENDS = {
+    "fingerprint": FingerprintSet,
+    "bloom": ScalableBloomFilter,
+}
+
+
+class ShardedSeenSet:
+    """分片的URL去重集合，每个分片有独立的锁，避免所有查询争用同一把锁
+
+    backend可选"fingerprint"（精确，每URL约8字节）或"bloom"（按error_rate误判，更省内存），
+    其余关键字参数传给对应后端。
+    """
+
+    def __init__(self, backend="fingerprint", num_shards=16, **backend_kwargs):
+        backend_cls = SEEN_SET_BACKENDS[backend]
+        self.num_shards = num_shards
+        self.shards = [backend_cls(**backend_kwargs) for _ in range(num_shards)]
+        self.locks = [threading.Lock() for _ in range(num_shards)]
+
+    def shard_of(self, fp):
+        # 用高位选分片，低位留给布隆过滤器计算位置
+        return (fp >> 48) % self.num_shards
+
+    def add(self, url):
+        """加入URL，返回是否为首次出现"""
+        fp = url_fingerprint(url)
+        i = self.shard_of(fp)
+        with self.locks[i]:
+            return self.shards[i].add(fp)
+
+    def __contains__(self, url):
+        fp = url_fingerprint(url)
+        i = self.shard_of(fp)
+        with self.locks[i]:
+            return fp in self.shards[i]
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
@@ -0,0 +1,167 @@
+import io
+import threading
+import time
+import xml.etree.ElementTree as ET
+import zlib
+from queue import Queue
+from urllib.parse import urlparse, urljoin
+
+import requests
+
+from RateControl import parse_retry_after
+
+
+def robots_sitemaps(robots_txt, base_url):
+    """从robots.txt内容中取出Sitemap声明的URL"""
+    sitemaps = []
+    for line in robots_txt.splitlines():
+        key, sep, value = line.partition(":")
+        if sep and key.strip().lower() == "sitemap" and value.strip():
+            sitemaps.append(urljoin(base_url, value.strip()))
+    return sitemaps
+
+
+# sitemap协议规定解压后不超过50MB
+MAX_SITEMAP_BYTES = 50 * 1024 * 1024
+
+
+def gunzip_limited(data, limit=MAX_SITEMAP_BYTES):
+    """解压gzip数据，最多解压出limit字节，超过时抛出ValueError，避免压缩炸弹占满内存"""
+    decomp = zlib.decompressobj(wbits=31)
+    data = decomp.decompress(data, limit + 1)
+    if len(data) > limit:
+        raise ValueError(f"解压后超过{limit}字节")
+    if not decomp.eof:
+        raise EOFError("gzip数据不完整")
+    return data
+
+
+def parse_sitemap(data):
+    """解析sitemap，返回(子sitemap列表, 页面URL列表)；支持gzip压缩和sitemapindex"""
+    if data[:2] == b"\x1f\x8b":
+        data = gunzip_limited(data)
+    sitemaps, urls = [], []
+    # 逐个元素解析，不在内存中保留整棵树
+    for _, elem in ET.iterparse(io.BytesIO(data), events=("end",)):
+        tag = elem.tag.rsplit("}", 1)[-1]
+        if tag == "sitemap" or tag == "url":
+            loc = next((child.text for child in elem if child.tag.rsplit("}", 1)[-1] == "loc"), None)
+            if loc and loc.strip():
+                (sitemaps if tag == "sitemap" else urls).append(loc.strip())
+            elem.clear()
+    return sitemaps, urls
+
+
+class SitemapSeeder:
+    """后台线程：主机第一次被访问时读取其robots.txt中声明的sitemap，把其中的页面URL加入待爬取队列
+
+    on_urls(urls)由调用方提供（如WebCrawler.enqueue_links），在后台线程中调用。
+    rate_limiter（RateControl.AdaptiveHostLimiter）不为None时robots.txt和sitemap的请求与页面请求共用按主机的限速；
+    is_allowed(url)不为None时只读取通过检查的子sitemap（robots.txt和sitemapindex中的URL可以指向任意主机）。
+    """
+
+    def __init__(self, session, on_urls, headers=None, max_urls_per_host=50000, max_sitemaps=50,
+                 timeout=(3, 15), logger=None, rate_limiter=None, is_allowed=None):
+        self.session = session
+        self.on_urls = on_urls
+        self.rate_limiter = rate_limiter
+        self.is_allowed = is_allowed
+        self.headers = headers
+        self.max_urls_per_host = max_urls_per_host
+        self.max_sitemaps = max_sitemaps
+        self.timeout = timeout
+        self.logger = logger
+        self.queue = Queue()
+        self.seen_hosts = set()
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.thread = threading.Thread(target=self.run, name="SitemapSeeder", daemon=True)
+        self.thread.start()
+
+    def add_host(self, url):
+        """登记url所在的主机，每个主机只处理一次"""
+        parsed = urlparse(url)
+        host = f"{parsed.scheme}://{parsed.netloc}"
+        with self.lock:
+            if host in self.seen_hosts:
+                return
+            self.seen_hosts.add(host)
+            self.pending += 1
+        self.queue.put(host)
+
+    def busy(self):
+        """是否还有主机的sitemap未处理完"""
+        with self.lock:
+            return self.pending > 0
+
+    def run(self):
+        while True:
+            host = self.queue.get()
+            if host is None:
+                break
+            try:
+                self.seed_host(host)
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"读取sitemap失败: {host} - {str(e)}")
+            finally:
+                with self.lock:
+                    self.pending -= 1
+
+    def fetch(self, url):
+        if self.rate_limiter is None:
+            response = self.session.get(url, headers=self.headers, timeout=self.timeout)
+            return response.content if response.status_code == 200 else None
+        host = urlparse(url).netloc.lower()
+        self.rate_limiter.acquire(host)
+        start = time.perf_counter()
+        try:
+            # 非流式请求，返回时响应体已下载完，下载时间计入该主机的负载
+            response = self.session.get(url, headers=self.headers, timeout=self.timeout)
+        except requests.exceptions.Timeout:
+            self.rate_limiter.release(host, timed_out=True)
+            raise
+        except Exception:
+            self.rate_limiter.release(host)
+            raise
+        self.rate_limiter.release(
+            host, response.status_code, time.perf_counter() - start,
+            retry_after=parse_retry_after(response.headers.get("Retry-After")),
+        )
+        return response.content if response.status_code == 200 else None
+
+    def allowed(self, url):
+        return self.is_allowed is None or self.is_allowed(url)
+
+    def seed_host(self, host):
+        robots = self.fetch(f"{host}/robots.txt")
+        if not robots:
+            return
+        to_fetch = [url for url in robots_sitemaps(robots.decode("utf-8", errors="replace"), host + "/")
+                    if self.allowed(url)]
+        fetched = set()
+        total = 0
+        while to_fetch and len(fetched) < self.max_sitemaps and total < self.max_urls_per_host:
+            sitemap_url = to_fetch.pop(0)
+            if sitemap_url in fetched:
+                continue
+            fetched.add(sitemap_url)
+            data = self.fetch(sitemap_url)
+            if not data:
+                continue
+            try:
+                sitemaps, urls = parse_sitemap(data)
+            except (ET.ParseError, OSError, EOFError, ValueError, zlib.error) as e:
+                if self.logger:
+                    self.logger.warning(f"sitemap解析失败: {sitemap_url} - {str(e)}")
+                continue
+            to_fetch.extend(url for url in sitemaps if self.allowed(url))
+            urls = urls[:self.max_urls_per_host - total]
+            if urls:
+                total += len(urls)
+                self.on_urls(urls)
+        if self.logger and total:
+            self.logger.info(f"从 {host} 的sitemap获得 {total} 个URL")
+
+    def close(self):
+        self.queue.put(None)
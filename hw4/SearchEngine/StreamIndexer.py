@@ -0,0 +1,304 @@
+# 爬取与索引的流式衔接：持续读取爬虫追加写入的webpages.csv（或webpages.jsonl），
+# 新页面经有界队列交给解析进程池，按数量或时间凑成小批量写入ES，页面爬下来几秒后即可被搜索到。
+# 已写入ES的清单字节偏移保存在偏移文件中，崩溃或中断后从该位置继续；文档_id由URL决定，重复写入不会产生重复文档。
+
+import csv
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from queue import Queue, Empty, Full
+
+from elasticsearch import helpers
+
+import Index
+
+
+class ManifestTailer:
+    """从指定字节偏移开始读取清单中新追加的完整行，返回(该行结束处的偏移, 记录dict)"""
+
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.offset = offset
+        self.header = None
+        self.jsonl = path.endswith(".jsonl")
+
+    def read_header(self, file):
+        file.seek(0)
+        line = file.readline()
+        if not line.endswith(b"\n"):
+            return None
+        return next(csv.reader([line.decode("utf-8-sig").rstrip("\r\n")]))
+
+    def poll(self, max_rows=10000):
+        """读取新追加的行，最后一行不完整（写线程还没写完）时留到下次"""
+        if not os.path.exists(self.path):
+            return []
+        if os.path.getsize(self.path) < self.offset:
+            # 清单被重新生成
+            self.offset = 0
+        rows = []
+        with open(self.path, "rb") as file:
+            if not self.jsonl and self.header is None:
+                self.header = self.read_header(file)
+                if self.header is None:
+                    return []
+                if self.offset == 0:
+                    self.offset = file.tell()
+            file.seek(self.offset)
+            while len(rows) < max_rows:
+                line = file.readline()
+                if not line.endswith(b"\n"):
+                    break
+                self.offset += len(line)
+                text = line.decode("utf-8").rstrip("\r\n")
+                if not text:
+                    continue
+                if self.jsonl:
+                    row = json.loads(text)
+                else:
+                    row = dict(zip(self.header, next(csv.reader([text]))))
+                rows.append((self.offset, row))
+        return rows
+
+
+class StreamIndexer:
+    """持续把爬虫新保存的页面解析并写入索引
+
+    读线程轮询清单，把新记录放入有界队列（队列满时暂停读取）；主循环从队列中凑批，
+    记录数达到batch_size或距第一条记录超过flush_interval秒时解析并写入一批。
+    写入成功后才推进偏移并原子地写入offset_file；页面文件暂时读不到或ES暂时不可用（429、5xx、连接错误）时
+    按指数退避在后续批次中重试，最多尝试max_attempts次。
+    link_features_interval不为0时每隔这么多秒重新计算一次入链锚文本和PageRank。
+    """
+
+    def __init__(self, manifest_path, offset_file, batch_size=200, flush_interval=2.0, queue_size=2000,
+                 poll_interval=1.0, processes=None, max_attempts=5, retry_backoff=1.0, link_features_interval=0):
+        self.manifest_path = manifest_path
+        self.offset_file = offset_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.processes = processes or os.cpu_count() or 1
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.link_features_interval = link_features_interval
+        self.queue = Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.pending = deque()  # 按清单顺序排列的[结束偏移, 是否已处理]，用于计算可提交的偏移
+        self.retries = []  # (可以重试的时间, 记录)
+        self.indexed = 0
+        self.skipped = 0
+        self.lag_total = 0.0
+        self.committed = self.load_offset()
+        self.tailer = ManifestTailer(manifest_path, self.committed)
+
+    def load_offset(self):
+        if not os.path.exists(self.offset_file):
+            return 0
+        with open(self.offset_file, "r", encoding="utf-8") as file:
+            state = json.load(file)
+        if state.get("manifest") != os.path.abspath(self.manifest_path):
+            return 0
+        return state.get("offset", 0)
+
+    def save_offset(self):
+        """原子地写入偏移：先写临时文件并fsync，再替换"""
+        tmp_path = self.offset_file + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({
+                "manifest": os.path.abspath(self.manifest_path),
+                "offset": self.committed,
+                "updated": datetime.now().isoformat(),
+            }, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.offset_file)
+
+    def ensure_index(self):
+        """别名不存在时创建索引"""
+        if not Index.es.indices.exists_alias(name=Index.index_name):
+            new_index = Index.create_index(bulk_load=False)
+            Index.swap_alias(new_index)
+
+    def read_loop(self):
+        """读线程：轮询清单，新记录放入有界队列"""
+        while not self.stop_event.is_set():
+            try:
+                rows = self.tailer.poll()
+            except (OSError, ValueError) as e:
+                print(f"Failed to read manifest: {e}")
+                rows = []
+            for offset, row in rows:
+                entry = [offset, False]
+                item = (entry, row, 0)
+                while not self.stop_event.is_set():
+                    try:
+                        self.queue.put(item, timeout=1)
+                        break
+                    except Full:
+                        continue
+            if not rows:
+                self.stop_event.wait(self.poll_interval)
+
+    def next_batch(self):
+        """凑一批记录：已到重试时间的记录和队列中的新记录，直到数量或时间达到阈值"""
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size and not self.stop_event.is_set():
+            now = time.monotonic()
+            ready = [item for ready_at, item in self.retries if ready_at <= now]
+            if ready:
+                self.retries = [(ready_at, item) for ready_at, item in self.retries if ready_at > now]
+                batch.extend(ready)
+                if deadline is None:
+                    deadline = now + self.flush_interval
+            timeout = 1.0 if deadline is None else deadline - now
+            if timeout <= 0:
+                break
+            try:
+                entry, row, attempts = self.queue.get(timeout=min(timeout, 1.0))
+            except Empty:
+                if batch and deadline is None:
+                    deadline = time.monotonic()
+                continue
+            if attempts == 0:
+                self.pending.append(entry)
+            batch.append((entry, row, attempts))
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return batch
+
+    def process_batch(self, pool, batch):
+        """解析并写入一批记录"""
+        futures = [
+            pool.submit(Index.parse_page, (row["URL"], row["Filename"], None))
+            for _, row, _ in batch
+        ]
+        actions = {}
+        entries = {}
+        for (entry, row, attempts), future in zip(batch, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                self.retry_later(entry, row, attempts, e)
+                continue
+            url, content_hash, (title, content, anchors), _ = result
+            doc_id = Index.url_id(url)
+            # 同一批中同一URL只保留最后一条
+            if doc_id in entries:
+                entries[doc_id][0][1] = True
+            entries[doc_id] = (entry, row, attempts)
+            actions[doc_id] = {
+                "_op_type": "update",
+                "_index": Index.index_name,
+                "_id": doc_id,
+                "doc": {
+                    "url": url,
+                    "content_hash": content_hash,
+                    "title": title,
+                    "content": content,
+                    "outlinks": anchors,
+                },
+                "doc_as_upsert": True,
+            }
+            crawl_time = row.get("CrawlTime")
+            if crawl_time:
+                try:
+                    self.lag_total += (datetime.now() - datetime.fromisoformat(crawl_time)).total_seconds()
+                except ValueError:
+                    pass
+
+        done = set()
+        try:
+            for ok, item in helpers.streaming_bulk(
+                Index.es, list(actions.values()), chunk_size=self.batch_size, raise_on_error=False,
+                raise_on_exception=False, max_retries=3, request_timeout=120,
+            ):
+                op_result = next(iter(item.values()))
+                doc_id = op_result["_id"]
+                done.add(doc_id)
+                entry, row, attempts = entries[doc_id]
+                if ok:
+                    entry[1] = True
+                    self.indexed += 1
+                elif op_result.get("status") in Index.RETRY_STATUS:
+                    # 在后续批次中重新解析和写入
+                    self.retry_later(entry, row, attempts, op_result.get("error"))
+                else:
+                    print(f"Failed to index {doc_id}: {op_result.get('error')}")
+                    entry[1] = True
+                    self.skipped += 1
+        except Exception as e:
+            # 连接失败等没有逐条结果的错误，还没有结果的记录都稍后重试
+            print(f"Bulk request failed: {e}")
+            for doc_id, (entry, row, attempts) in entries.items():
+                if doc_id not in done:
+                    self.retry_later(entry, row, attempts, e)
+
+    def retry_later(self, entry, row, attempts, error):
+        """失败的记录按指数退避在后续批次中重试，尝试max_attempts次后放弃（推进偏移，不再阻塞后面的记录）"""
+        if attempts + 1 >= self.max_attempts:
+            print(f"Giving up on {row['URL']}: {error}")
+            entry[1] = True
+            self.skipped += 1
+            return
+        delay = min(self.retry_backoff * 2 ** attempts, 60)
+        self.retries.append((time.monotonic() + delay, (entry, row, attempts + 1)))
+
+    def commit(self):
+        """推进偏移到最前面一段已处理完的记录之后"""
+        advanced = False
+        while self.pending and self.pending[0][1]:
+            self.committed = self.pending.popleft()[0]
+            advanced = True
+        if advanced:
+            self.save_offset()
+
+    def run(self):
+        """运行直到stop被调用（或Ctrl+C）"""
+        self.ensure_index()
+        print(f"Streaming {self.manifest_path} into {Index.index_name} from offset {self.committed}...")
+        reader = threading.Thread(target=self.read_loop, name="ManifestTailer", daemon=True)
+        reader.start()
+        last_link_update = time.monotonic()
+        with ProcessPoolExecutor(max_workers=self.processes, initializer=Index.init_parse_worker,
+                                 initargs=(None,)) as pool:
+            try:
+                while not self.stop_event.is_set():
+                    batch = self.next_batch()
+                    if batch:
+                        start = time.perf_counter()
+                        self.process_batch(pool, batch)
+                        self.commit()
+                        elapsed = time.perf_counter() - start
+                        lag = self.lag_total / max(self.indexed, 1)
+                        print(f"Indexed {self.indexed} documents ({self.skipped} skipped) | "
+                              f"batch: {len(batch) / max(elapsed, 1e-9):.1f} docs/s | "
+                              f"avg crawl-to-index lag: {lag:.1f}s | offset: {self.committed}")
+                    if self.link_features_interval and time.monotonic() - last_link_update > self.link_features_interval:
+                        Index.update_link_features(Index.index_name)
+                        last_link_update = time.monotonic()
+            except KeyboardInterrupt:
+                print("\nStopping...")
+            finally:
+                self.stop_event.set()
+                reader.join()
+                self.commit()
+        print(f"Stopped at offset {self.committed}, {self.indexed} documents indexed.")
+
+    def stop(self):
+        self.stop_event.set()
+
+
+if __name__ == "__main__":
+    # 与爬虫同时运行，爬虫使用JSONL格式清单时把路径改为webpages.jsonl即可
+    manifest_path = "D:\\SearchEngine\\webpages.csv"
+    offset_file = "D:\\SearchEngine\\stream_index_offset.json"
+
+    indexer = StreamIndexer(manifest_path, offset_file, batch_size=200, flush_interval=2.0,
+                            link_features_interval=3600)
+    indexer.run()
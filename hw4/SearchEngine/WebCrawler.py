@@ -1,66 +1,219 @@
 import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urlparse
 import time
 import os
-import csv
 import uuid
 from datetime import datetime
 import re
+import hashlib
 import threading
 from queue import Queue, Empty
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
 import logging
+import atexit
+from logging.handlers import QueueHandler, QueueListener
+
+from CrawlState import CrawlStateStore
+from CrawlManifest import ManifestWriter
+from PageStore import PageStore, read_page_bytes, page_exists
+from SeenSet import ShardedSeenSet
+from LinkExtractor import parse_links, is_allowed_domain
+from CrawlMetrics import CrawlMetrics, mount_timing_adapter
+from Frontier import FIFOFrontier, PriorityFrontier
+from RateControl import AdaptiveHostLimiter, parse_retry_after
+from Sitemaps import SitemapSeeder
+from ContentSniffer import BodyCollector, may_be_html, content_length
+
+# 请求头
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+}
+
+
+def timed_parse_links(html, base_url, allowed_domains):
+    """在解析进程中提取链接，同时返回解析耗时（不含排队时间）"""
+    start = time.perf_counter()
+    links = parse_links(html, base_url, allowed_domains)
+    return links, time.perf_counter() - start
 
 class WebCrawler:
-    def __init__(self, start_url, max_pages, save_dir, max_workers=5):
+    def __init__(self, start_url, max_pages, save_dir, max_workers=5, state_db=None, resume=False,
+                 seen_urls=None, recrawl=False, manifest_format="csv", page_store=None,
+                 parse_processes=0, parse_queue_size=1000, metrics_port=None, metrics_snapshot=None,
+                 frontier=None, allowed_domains=None, crawl_delay=0.5, max_host_concurrency=16,
+                 seed_sitemaps=False, max_page_bytes=10 * 1024 * 1024, oversize_policy="truncate"):
         self.start_url = start_url
         self.max_pages = max_pages
-        self.visited_urls = set()
-        self.pending_urls_set = set()
-        self.to_visit_queue = Queue()
-        self.to_visit_queue.put(start_url)
-        self.pending_urls_set.add(start_url)
+        # 已发现URL的去重集合（包括已爬取和待爬取），可传入其他后端，如ShardedSeenSet("bloom")
+        self.seen_urls = seen_urls if seen_urls is not None else ShardedSeenSet()
+        # 待爬取队列，可传入PriorityFrontier("opic")等按分数排序的队列，默认先进先出
+        self.to_visit_queue = frontier if frontier is not None else FIFOFrontier()
         self.save_dir = os.path.normpath(save_dir)
         self.session = requests.Session()
-        self.crawl_delay = 0.5
+        self.crawl_delay = crawl_delay
+        # 页面大小上限，超过时oversize_policy为"truncate"截断，为"skip"放弃
+        self.max_page_bytes = max_page_bytes
+        self.oversize_policy = oversize_policy
+        # 每个主机的并发数和请求间隔按响应时间、429/503和超时自适应调整，crawl_delay为初始间隔
+        self.rate_limiter = AdaptiveHostLimiter(
+            initial_delay=crawl_delay, min_delay=min(crawl_delay, 0.1), max_concurrency=max_host_concurrency
+        )
         self.crawled_count = 0
+        self.unchanged_count = 0
         self.max_workers = max_workers
         self.lock = threading.Lock()
         self.stop_event = threading.Event()
+        # 分段页面存储（可选PageStore），为None时每个页面保存为单独的.html文件
+        self.page_store = page_store
+        # 允许爬取的域名（包括其子域名），基准测试时为本地服务器的主机名
+        self.allowed_domains = tuple(allowed_domains) if allowed_domains else ("nankai.edu.cn",)
+        # 链接解析进程数，为0时在抓取线程中直接解析
+        self.parse_processes = parse_processes
+        self.parse_queue_size = parse_queue_size
+        self.parse_pending = 0
+        self.parsing_urls = set()  # 已交给解析阶段、链接还没有加入队列的URL
+        # 运行指标，metrics_port不为None时启动/metrics服务，metrics_snapshot为JSON快照文件路径
+        self.metrics = CrawlMetrics()
+        self.metrics_port = metrics_port
+        self.metrics_snapshot = metrics_snapshot
+        mount_timing_adapter(self.session, self.metrics, pool_maxsize=max(10, max_workers))
         
         # 创建存储目录
         os.makedirs(self.save_dir, exist_ok=True)
         
-        # CSV文件路径
-        self.csv_file = os.path.join(os.path.dirname(self.save_dir), "webpages.csv")
+        # CSV文件路径（manifest_format为"jsonl"时为webpages.jsonl）
+        self.manifest_format = manifest_format
+        self.csv_file = os.path.join(os.path.dirname(self.save_dir), f"webpages.{manifest_format}")
+        
+        # 配置日志
+        self.configure_logging()
         
         # 初始化CSV文件
         self.init_csv()
         
-        # 配置日志
-        self.configure_logging()
+        # 爬取状态存储（可选），用于断点续爬
+        self.state = CrawlStateStore(state_db) if state_db else None
+        self.init_frontier(resume, recrawl)
+        self.register_gauges()
+        
+        # 从各主机robots.txt声明的sitemap中补充待爬取URL（可选）
+        self.sitemap_seeder = SitemapSeeder(
+            self.session, self.enqueue_sitemap_urls, HEADERS, logger=self.logger,
+            rate_limiter=self.rate_limiter, is_allowed=self.is_valid_domain,
+        ) if seed_sitemaps else None
         
         self.logger.info(f"爬虫初始化完成 - 起始URL: {start_url}")
 
     def configure_logging(self):
-        """配置日志记录"""
+        """配置日志记录：工作线程只把日志记录放入队列，由监听线程写文件，避免争用文件句柄"""
         log_file = os.path.join(os.path.dirname(self.save_dir), "crawler.log")
-        logging.basicConfig(
-            filename=log_file,
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s'
-        )
+        file_handler = logging.FileHandler(log_file, encoding="utf-8")
+        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(threadName)s - %(message)s'))
+        log_queue = Queue()
+        self.log_listener = QueueListener(log_queue, file_handler)
+        self.log_listener.start()
+        # 退出前把队列中剩余的日志写完
+        atexit.register(self.log_listener.stop)
+        
         self.logger = logging.getLogger("WebCrawler")
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+        self.logger.addHandler(QueueHandler(log_queue))
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
 
-    def init_csv(self):
-        """初始化CSV文件"""
-        file_exists = os.path.exists(self.csv_file)
+    def register_gauges(self):
+        """注册队列深度等按需读取的指标"""
+        self.metrics.register_gauge("frontier_queue_depth", self.to_visit_queue.qsize)
+        self.metrics.register_gauge("parse_pending", lambda: self.parse_pending)
+        self.metrics.register_gauge("parse_queue_depth", lambda: self.parse_queue.qsize() if self.parse_processes else 0)
+        self.metrics.register_gauge("manifest_queue_depth", self.manifest.queue.qsize)
+        self.metrics.register_gauge("seen_urls", lambda: len(self.seen_urls))
+
+    def start_metrics(self):
+        """按配置启动指标HTTP服务和JSON快照线程"""
+        if self.metrics_port is not None:
+            self.metrics.start_http_server(self.metrics_port)
+            self.logger.info(f"指标服务: http://127.0.0.1:{self.metrics_port}/metrics")
+        if self.metrics_snapshot:
+            self.metrics.start_snapshot_writer(self.metrics_snapshot)
+
+    def init_frontier(self, resume, recrawl=False):
+        """初始化待爬取队列
+
+        resume为True时从状态存储中恢复；recrawl为True时开始新一轮增量重爬，
+        以起始URL和所有保存过的页面作为种子，页面未变化时不再重复保存。
+        """
+        if recrawl and self.state:
+            self.state.reset_frontier()
+            seeds = [self.start_url] + self.state.known_pages()
+            for url in seeds:
+                self.seed_url(url)
+            self.logger.info(f"开始增量重爬，种子URL数: {self.to_visit_queue.qsize()}")
+            return
+
+        if resume and self.state:
+            visited, pending, done = self.state.load()
+            if visited or pending:
+                # 已爬取和已处理的URL只加入去重集合，不再入队
+                for url in visited:
+                    self.seen_urls.add(url)
+                for url in done:
+                    self.seen_urls.add(url)
+                self.crawled_count = len(visited)
+                for url in pending:
+                    if self.seen_urls.add(url):
+                        self.to_visit_queue.put(url)
+                self.logger.info(f"从 {self.state.db_path} 恢复: 已爬取 {len(visited)}，待爬取 {len(pending)}")
+                return
         
-        with open(self.csv_file, mode="a", newline="", encoding="utf-8") as file:
-            writer = csv.writer(file)
-            if not file_exists:
-                writer.writerow(["URL", "Filename", "CrawlTime"])
+        self.seed_url(self.start_url)
+
+    def seed_url(self, url):
+        """把种子URL加入待爬取队列"""
+        if self.seen_urls.add(url):
+            self.to_visit_queue.put(url)
+            if self.state:
+                self.state.add_pending(url)
+
+    def maybe_checkpoint(self):
+        """定期将CSV落盘并保存爬取进度，由监控循环调用"""
+        if self.state and self.state.checkpoint_due():
+            if self.page_store:
+                self.page_store.flush(sync=True)
+            self.manifest.checkpoint()
+            self.state.checkpoint()
+
+    def save_state(self):
+        """将爬取进度写入状态存储"""
+        # 先保证页面和CSV记录已落盘，状态中标记为已爬取的页面都能在CSV中找到
+        if self.page_store:
+            self.page_store.flush(sync=True)
+        self.manifest.checkpoint()
+        if self.state:
+            self.state.checkpoint()
+            self.logger.info(f"爬取进度已保存至: {self.state.db_path}")
+
+    def close(self):
+        """关闭CSV写线程、页面存储和指标服务"""
+        if self.sitemap_seeder:
+            self.sitemap_seeder.close()
+        self.metrics.stop()
+        self.manifest.close()
+        if self.page_store:
+            self.page_store.close()
+
+    def init_csv(self):
+        """初始化CSV文件，记录由单独的写线程批量写入
+
+        使用分段存储时每批记录写入前先刷新存储，清单中出现的页面引用都已经可以读取
+        """
+        self.manifest = ManifestWriter(
+            self.csv_file, ["URL", "Filename", "CrawlTime"], fmt=self.manifest_format, logger=self.logger,
+            before_write=self.page_store.flush if self.page_store else None,
+        )
     
     def crawl(self):
         """主爬取方法 - 使用多线程"""
@@ -72,6 +225,8 @@ class WebCrawler:
         start_time = datetime.now()
         print(f"开始爬取 - {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
         
+        self.start_metrics()
+        self.start_parse_stage()
         try:
             # 使用线程池执行爬取任务
             with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
@@ -84,9 +239,10 @@ class WebCrawler:
                 # 监控爬取进度
                 while not self.stop_event.is_set():
                     print(f"\r已爬取: {self.crawled_count} | 待爬取: {self.to_visit_queue.qsize()}", end="")
+                    self.maybe_checkpoint()
                     
                     # 检查是否达到终止条件
-                    if self.crawled_count >= self.max_pages or (self.to_visit_queue.empty() and self.crawled_count > 0):
+                    if self.should_stop():
                         self.stop_event.set()
                         break
                     
@@ -100,6 +256,20 @@ class WebCrawler:
             print("\n用户中断爬取，正在停止...")
             self.stop_event.set()
         
+        self.stop_parse_stage()
+        self.save_state()
+        self.close()
+        self.report_summary(start_time)
+
+    def should_stop(self):
+        """是否达到终止条件（解析阶段还有页面时可能继续产生新链接）"""
+        return self.crawled_count >= self.max_pages or (
+            self.to_visit_queue.empty() and self.parse_pending == 0 and self.crawled_count > 0
+            and not self.seeding()
+        )
+
+    def report_summary(self, start_time):
+        """输出爬取统计信息"""
         end_time = datetime.now()
         elapsed_time = (end_time - start_time).total_seconds()
         
@@ -110,165 +280,379 @@ class WebCrawler:
         print(f"\n爬取完成! 总共爬取页面: {self.crawled_count}")
         print(f"耗时: {elapsed_time:.2f}秒")
         print(f"平均速度: {self.crawled_count/elapsed_time:.2f}页/秒")
+        if self.unchanged_count:
+            self.logger.info(f"未变化页面: {self.unchanged_count}")
+            print(f"未变化页面: {self.unchanged_count}")
         print(f"CSV文件位置: {self.csv_file}")
 
     def worker(self):
         """工作线程函数，处理单个URL"""
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-        }
-        
         while not self.stop_event.is_set():
             try:
                 # 获取URL（设置超时避免永久阻塞）
                 current_url = self.to_visit_queue.get(timeout=5)
                 
-                # 检查是否已访问
-                with self.lock:
-                    if current_url in self.visited_urls:
-                        self.to_visit_queue.task_done()
-                        continue
-                
                 # 域名检查
                 if not self.is_valid_domain(current_url):
                     self.logger.info(f"跳过非目标域名URL: {current_url}")
+                    self.to_visit_queue.done(current_url)
                     self.to_visit_queue.task_done()
                     continue
                 
                 self.logger.info(f"处理URL: {current_url}")
+                host = urlparse(current_url).netloc.lower()
                 
                 try:
-                    # 添加请求延时
-                    time.sleep(self.crawl_delay)
+                    if self.sitemap_seeder:
+                        self.sitemap_seeder.add_host(current_url)
+                    page_meta = self.get_page_meta(current_url)
                     
-                    response = self.session.get(
-                        current_url, 
-                        headers=headers, 
-                        timeout=(3, 8),
-                        allow_redirects=True
-                    )
-                    
-                    if response.status_code == 200:
-                        # 检测内容类型
-                        content_type = response.headers.get('Content-Type', '')
-                        if 'text/html' not in content_type:
-                            self.logger.info(f"跳过非HTML内容: {content_type} - {current_url}")
-                            self.to_visit_queue.task_done()
-                            continue
-                        
-                        # 处理编码
-                        encoding = response.encoding
-                        if not encoding or encoding.lower() == 'iso-8859-1':
-                            encoding = 'utf-8'
-                        
+                    # 按主机自适应限速：等待该主机的请求名额，拿到名额后到请求结束之间出错都会释放
+                    self.rate_limiter.acquire(host)
+                    start = time.perf_counter()
+                    try:
+                        # 流式请求：先看响应头和开头的字节，再决定是否下载整个响应体
+                        response = self.session.get(
+                            current_url, 
+                            headers=self.request_headers(page_meta), 
+                            timeout=self.rate_limiter.timeout(host),
+                            allow_redirects=True,
+                            stream=True
+                        )
+                        # elapsed为发出请求到解析完响应头的时间，其余为下载响应体的时间
+                        ttfb = response.elapsed.total_seconds()
+                        self.metrics.observe("ttfb", ttfb)
+                        self.metrics.record_request(host, error=response.status_code >= 400)
+
                         try:
-                            html_content = response.content.decode(encoding, errors="replace")
-                        except (UnicodeDecodeError, LookupError):
-                            html_content = response.content.decode('utf-8', errors="replace")
-                        
-                        # 添加到已访问集合
-                        with self.lock:
-                            if current_url not in self.visited_urls:
-                                self.visited_urls.add(current_url)
-                                self.crawled_count += 1
-                        
-                        # 保存页面
-                        self.save_page(html_content, current_url)
-                        
-                        # 提取链接（移除总URL数检查）
-                        new_links_count = self.extract_links(html_content, current_url)
-                        self.logger.info(f"从 {current_url} 发现 {new_links_count} 个新链接")
-                        if new_links_count == 0:
-                            self.logger.warning(f"在 {current_url} 上未找到有效链接，可能是解析问题")
+                            raw_content = None
+                            collector = self.open_body(current_url, response.status_code, response.headers)
+                            if collector:
+                                for chunk in response.iter_content(chunk_size=65536):
+                                    if not collector.feed(chunk):
+                                        break
+                                raw_content = self.close_body(current_url, collector)
+                        finally:
+                            # 未读完的响应直接关闭连接，不再下载剩余部分
+                            response.close()
+                    except requests.exceptions.Timeout:
+                        self.rate_limiter.release(host, timed_out=True)
+                        raise
+                    except Exception:
+                        self.rate_limiter.release(host)
+                        raise
+                    # 响应体读完后才释放请求名额，下载响应体的时间也计入该主机的并发
+                    self.rate_limiter.release(
+                        host, response.status_code, ttfb, retry_after=parse_retry_after(response.headers.get("Retry-After"))
+                    )
+                    self.metrics.observe("download", max(0.0, time.perf_counter() - start - ttfb))
                     
-                    else:
-                        self.logger.warning(f"HTTP错误 {response.status_code}: {current_url}")
+                    self.handle_response(
+                        current_url, response.status_code, response.headers,
+                        raw_content, response.encoding, page_meta
+                    )
                     
                 except requests.exceptions.Timeout:
                     self.logger.warning(f"请求超时: {current_url}")
+                    self.record_fetch_error(host, "timeouts")
                 except requests.exceptions.TooManyRedirects:
                     self.logger.warning(f"重定向过多: {current_url}")
+                    self.record_fetch_error(host, "redirect_errors")
                 except requests.exceptions.RequestException as e:
                     self.logger.error(f"请求异常: {current_url} - {str(e)}")
+                    self.record_fetch_error(host, "request_errors")
                 except Exception as e:
                     self.logger.error(f"处理 {current_url} 时出错: {str(e)}")
                 
                 finally:
                     # 标记任务完成
+                    self.finish_url(current_url)
                     self.to_visit_queue.task_done()
+                    if self.state:
+                        self.state.mark_done(current_url)
             
             except Empty:  # 正确捕获Empty异常
-                # 队列为空，检查是否应该退出
-                if self.stop_event.is_set() or self.to_visit_queue.empty():
+                # 队列为空，检查是否应该退出（解析阶段或sitemap还可能补充URL）
+                if self.stop_event.is_set() or self.should_stop():
                     break
                 else:
                     time.sleep(1)  # 等待新的URL
             except Exception as e:
                 self.logger.error(f"工作线程异常: {str(e)}")
 
+    def finish_url(self, url):
+        """抓取结束：链接已交给解析阶段时由解析完成后释放，否则在这里释放待爬取队列为该URL保留的记录"""
+        with self.lock:
+            if url in self.parsing_urls:
+                return
+        self.to_visit_queue.done(url)
+
+    def parse_finished(self, url):
+        with self.lock:
+            self.parse_pending -= 1
+            self.parsing_urls.discard(url)
+        self.to_visit_queue.done(url)
+
+    def seeding(self):
+        """sitemap是否还在补充URL"""
+        return self.sitemap_seeder is not None and self.sitemap_seeder.busy()
+
+    def enqueue_sitemap_urls(self, urls):
+        """sitemap中的URL去掉fragment并检查域名后加入待爬取队列"""
+        links = []
+        for url in urls:
+            try:
+                url = urlparse(url)._replace(fragment="").geturl()
+            except ValueError:
+                continue
+            if self.is_valid_domain(url):
+                links.append(url)
+        # sitemap中的URL没有父页面，按种子页面的出链计分，不分走种子页面的现金
+        self.metrics.inc("sitemap_urls", self.enqueue_links(links, prior=self.to_visit_queue.link_prior(None)))
+
+    def record_fetch_error(self, host, kind):
+        """记录请求失败（超时、连接错误等）"""
+        self.metrics.inc(kind)
+        self.metrics.record_request(host, error=True)
+
+    def get_page_meta(self, url):
+        """查询页面上次保存时的ETag、Last-Modified、摘要和文件名"""
+        if not self.state:
+            return None
+        page_meta = self.state.get_page(url)
+        # 保存的文件已丢失时按新页面处理
+        if page_meta and not page_exists(page_meta["filename"]):
+            return None
+        return page_meta
+
+    def request_headers(self, page_meta):
+        """构造请求头，有上次的验证器时发送条件请求"""
+        headers = dict(HEADERS)
+        if page_meta:
+            if page_meta["etag"]:
+                headers["If-None-Match"] = page_meta["etag"]
+            if page_meta["last_modified"]:
+                headers["If-Modified-Since"] = page_meta["last_modified"]
+        return headers
+
+    def open_body(self, current_url, status_code, resp_headers):
+        """根据响应头决定是否下载响应体，需要下载时返回BodyCollector"""
+        if status_code != 200:
+            return None
+        content_type = resp_headers.get('Content-Type', '')
+        if not may_be_html(content_type):
+            self.logger.info(f"跳过非HTML内容: {content_type} - {current_url}")
+            self.metrics.inc("non_html_skipped")
+            return None
+        length = content_length(resp_headers)
+        if length is not None and length > self.max_page_bytes and self.oversize_policy == "skip":
+            self.logger.info(f"跳过过大的页面({length}字节): {current_url}")
+            self.metrics.inc("oversize_skipped")
+            return None
+        return BodyCollector(content_type, self.max_page_bytes, self.oversize_policy)
+
+    def close_body(self, current_url, collector):
+        """取出下载的页面内容，因内容不是HTML或超过大小上限被放弃时返回None"""
+        raw_content = collector.finish()
+        if collector.reason == "non_html":
+            self.logger.info(f"内容不是HTML，已中止下载: {collector.content_type} - {current_url}")
+            self.metrics.inc("non_html_aborted")
+        elif collector.reason == "too_large":
+            self.logger.info(f"页面超过 {self.max_page_bytes} 字节，已中止下载: {current_url}")
+            self.metrics.inc("oversize_skipped")
+        elif collector.truncated:
+            self.logger.info(f"页面超过 {self.max_page_bytes} 字节，已截断: {current_url}")
+            self.metrics.inc("oversize_truncated")
+        return raw_content
+
+    def handle_response(self, current_url, status_code, resp_headers, raw_content, encoding, page_meta=None):
+        """处理HTTP响应：检查状态码，解码后交给handle_page
+
+        raw_content为None表示下载时已判断为非HTML内容或页面过大而放弃。
+        """
+        if status_code == 304 and page_meta:
+            self.handle_unchanged_page(current_url, page_meta, resp_headers)
+            return
+        
+        if status_code != 200:
+            self.logger.warning(f"HTTP错误 {status_code}: {current_url}")
+            self.metrics.inc("http_errors")
+            return
+        
+        if raw_content is None:
+            return
+        
+        # 内容摘要未变化时不再保存
+        digest = hashlib.sha1(raw_content).hexdigest()
+        if page_meta and page_meta["digest"] == digest:
+            self.handle_unchanged_page(current_url, page_meta, resp_headers)
+            return
+        
+        # 处理编码
+        if not encoding or encoding.lower() == 'iso-8859-1':
+            encoding = 'utf-8'
+        
+        try:
+            html_content = raw_content.decode(encoding, errors="replace")
+        except (UnicodeDecodeError, LookupError):
+            html_content = raw_content.decode('utf-8', errors="replace")
+        
+        validators = {
+            "etag": resp_headers.get("ETag"),
+            "last_modified": resp_headers.get("Last-Modified"),
+            "digest": digest,
+        }
+        self.handle_page(html_content, current_url, page_meta, validators)
+
+    def handle_unchanged_page(self, current_url, page_meta, resp_headers):
+        """页面未变化：不重新保存，从已保存的文件中提取链接"""
+        with self.lock:
+            self.crawled_count += 1
+            self.unchanged_count += 1
+        self.metrics.inc("pages_crawled")
+        self.metrics.inc("pages_unchanged")
+        if self.state:
+            self.state.mark_visited(current_url)
+            self.state.record_page(
+                current_url,
+                resp_headers.get("ETag") or page_meta["etag"],
+                resp_headers.get("Last-Modified") or page_meta["last_modified"],
+                page_meta["digest"],
+                page_meta["filename"],
+            )
+        
+        self.logger.info(f"页面未变化: {current_url}")
+        html_content = read_page_bytes(page_meta["filename"]).decode("utf-8", errors="replace")
+        self.schedule_link_extraction(html_content, current_url)
+
+    def handle_page(self, html_content, current_url, page_meta=None, validators=None):
+        """记录已访问、保存页面并提取链接"""
+        # 入队前已经过去重，每个URL只会被处理一次
+        with self.lock:
+            self.crawled_count += 1
+        self.metrics.inc("pages_crawled")
+        if self.state:
+            self.state.mark_visited(current_url)
+        
+        # 保存页面，页面已保存为单独文件时覆盖原文件
+        old_filepath = page_meta["filename"] if page_meta and not self.page_store else None
+        with self.metrics.timer("save"):
+            filepath = self.save_page(html_content, current_url, old_filepath)
+        if self.state and filepath and validators:
+            self.state.record_page(
+                current_url, validators["etag"], validators["last_modified"], validators["digest"], filepath
+            )
+        
+        # 提取链接（移除总URL数检查）
+        self.schedule_link_extraction(html_content, current_url)
+
+    def start_parse_stage(self):
+        """启动解析阶段：抓取线程把页面放入有界队列，由分发线程提交给进程池提取链接"""
+        if not self.parse_processes:
+            return
+        self.parse_queue = Queue(maxsize=self.parse_queue_size)
+        self.parse_pool = ProcessPoolExecutor(max_workers=self.parse_processes)
+        # 限制同时提交给进程池的页面数，未提交的页面留在有界队列中形成反压
+        self.parse_slots = threading.BoundedSemaphore(self.parse_processes * 2)
+        self.parse_thread = threading.Thread(target=self.parse_dispatcher, name="ParseDispatcher", daemon=True)
+        self.parse_thread.start()
+
+    def stop_parse_stage(self):
+        """等待队列中的页面解析完毕并关闭进程池"""
+        if not self.parse_processes:
+            return
+        self.parse_queue.put(None)
+        self.parse_thread.join()
+        self.parse_pool.shutdown(wait=True)
+
+    def parse_dispatcher(self):
+        """分发线程：从解析队列取页面提交给进程池"""
+        while True:
+            item = self.parse_queue.get()
+            if item is None:
+                break
+            html_content, url = item
+            self.parse_slots.acquire()
+            try:
+                future = self.parse_pool.submit(timed_parse_links, html_content, url, self.allowed_domains)
+            except Exception as e:
+                self.logger.error(f"提交解析任务失败: {url} - {str(e)}")
+                self.parse_slots.release()
+                self.parse_finished(url)
+                continue
+            future.add_done_callback(partial(self.on_links_parsed, url))
+
+    def on_links_parsed(self, url, future):
+        """进程池解析完成的回调：把新链接加入待爬取队列"""
+        self.parse_slots.release()
+        try:
+            links, elapsed = future.result()
+            self.metrics.observe("parse", elapsed)
+            self.report_links(url, self.enqueue_links(links, url))
+        except Exception as e:
+            self.logger.error(f"提取链接时出错: {str(e)}")
+        finally:
+            self.parse_finished(url)
+
+    def schedule_link_extraction(self, html_content, url):
+        """提取页面链接：启用解析进程池时放入有界队列（队列满时阻塞抓取线程），否则直接在当前线程提取"""
+        if self.parse_processes:
+            with self.lock:
+                self.parse_pending += 1
+                self.parsing_urls.add(url)
+            self.parse_queue.put((html_content, url))
+        else:
+            self.report_links(url, self.extract_links(html_content, url))
+
+    def report_links(self, url, new_links_count):
+        self.logger.info(f"从 {url} 发现 {new_links_count} 个新链接")
+        if new_links_count == 0:
+            self.logger.warning(f"在 {url} 上未找到有效链接，可能是解析问题")
+
     def is_valid_domain(self, url):
         """检查URL是否在目标域名内"""
-        try:
-            parsed_url = urlparse(url)
-            domain = parsed_url.netloc.lower()
-            
-            # 允许所有南开大学的子域名
-            return domain.endswith("nankai.edu.cn") or domain == "nankai.edu.cn"
-        except Exception:
-            return False
+        # 允许所有南开大学的子域名
+        return is_allowed_domain(url, self.allowed_domains)
 
     def extract_links(self, html, base_url):
         """从HTML中提取有效链接"""
-        new_links_count = 0
         try:
-            soup = BeautifulSoup(html, "lxml")
-            base_parsed = urlparse(base_url)
-            
             self.logger.debug(f"开始从 {base_url} 提取链接")
-            
-            for link in soup.find_all("a", href=True):
-                # 检查是否已达到最大页面数
-                if self.crawled_count >= self.max_pages or self.stop_event.is_set():
-                    self.logger.info(f"已达到最大页面数 {self.max_pages}，停止提取链接")
-                    break
-                
-                href = link.get("href", "").strip()
-                
-                # 过滤无效链接
-                if not href or href.startswith(('javascript:', 'mailto:', 'tel:', '#', 'data:')):
-                    continue
-                
-                # 处理相对路径
-                try:
-                    absolute_url = urljoin(base_url, href)
-                    parsed_url = urlparse(absolute_url)
-                    
-                    # 规范化URL
-                    normalized_url = parsed_url._replace(fragment="").geturl()
-                    
-                    # 域名检查
-                    if not self.is_valid_domain(normalized_url):
-                        continue
-                    
-                    # 线程安全的添加新URL
-                    with self.lock:
-                        if (normalized_url not in self.visited_urls and 
-                            normalized_url not in self.pending_urls_set):
-                            self.to_visit_queue.put(normalized_url)
-                            self.pending_urls_set.add(normalized_url)
-                            new_links_count += 1
-                            self.logger.debug(f"发现新链接: {normalized_url}")
-                        
-                except ValueError:
-                    continue
-                    
+            # 按href逐个扫描，不构建完整的DOM树
+            with self.metrics.timer("parse"):
+                links = parse_links(html, base_url, self.allowed_domains)
+            new_links_count = self.enqueue_links(links, base_url)
             self.logger.info(f"成功从 {base_url} 提取 {new_links_count} 个链接")
             return new_links_count
             
         except Exception as e:
             self.logger.error(f"提取链接时出错: {str(e)}")
             return 0
+
+    def enqueue_links(self, links, base_url=None, prior=None):
+        """将链接去重后加入待爬取队列，返回新链接数
+
+        全部链接（包括已见过的）都会交给待爬取队列，用于估计链接重要性。
+        prior不为None时链接不是从本地爬取的base_url中提取的（sitemap等），按prior设置初始分数，不参与链接重要性估计。
+        """
+        new_links_count = 0
+        for normalized_url in links:
+            # 检查是否已达到最大页面数
+            if self.crawled_count >= self.max_pages or self.stop_event.is_set():
+                self.logger.info(f"已达到最大页面数 {self.max_pages}，停止提取链接")
+                break
+            
+            # 去重集合按分片加锁，这里不再持有全局锁
+            if self.seen_urls.add(normalized_url):
+                self.to_visit_queue.put(normalized_url, parent=base_url, prior=prior)
+                if self.state:
+                    self.state.add_pending(normalized_url)
+                new_links_count += 1
+                self.logger.debug(f"发现新链接: {normalized_url}")
+        if base_url is not None and prior is None:
+            self.to_visit_queue.observe_links(base_url, links)
+        self.metrics.inc("links_discovered", new_links_count)
+        return new_links_count
     
     def generate_filename(self, url):
         """生成安全的文件名"""
@@ -284,22 +668,29 @@ class WebCrawler:
         unique_id = uuid.uuid4().hex[:6]
         return f"{path}_{unique_id}.html"
 
-    def save_page(self, html, url):
-        """保存HTML页面并记录到CSV"""
+    def save_page(self, html, url, filepath=None):
+        """保存HTML页面并记录到CSV，返回保存路径（使用分段存储时为segment#offset:length引用）"""
         try:
+            if self.page_store:
+                # 追加到分段存储，CSV中的Filename记录分段引用
+                filepath = self.page_store.put(url, html)
+                self.write_to_csv(url, filepath)
+                return filepath
+            
             # 生成唯一文件名
-            filename = self.generate_filename(url)
-            filepath = os.path.join(self.save_dir, filename)
+            if filepath is None:
+                filepath = os.path.join(self.save_dir, self.generate_filename(url))
+            filename = os.path.basename(filepath)
             
             # 写入文件
             with open(filepath, "w", encoding="utf-8") as file:
                 file.write(html)
             
-            # 记录到CSV
-            with self.lock:
-                self.write_to_csv(url, filepath)
+            # 记录到CSV（由写线程批量写入，不需要加锁）
+            self.write_to_csv(url, filepath)
             
             self.logger.info(f"已保存: {filename}")
+            return filepath
             
         except OSError as e:
             self.logger.error(f"文件保存错误: {str(e)}")
@@ -307,13 +698,8 @@ class WebCrawler:
             self.logger.error(f"保存页面时出错: {str(e)}")
 
     def write_to_csv(self, url, filepath):
-        """将记录写入CSV文件"""
-        try:
-            with open(self.csv_file, mode="a", newline="", encoding="utf-8") as file:
-                writer = csv.writer(file)
-                writer.writerow([url, filepath, datetime.now().isoformat()])
-        except Exception as e:
-            self.logger.error(f"写入CSV时出错: {str(e)}")
+        """将记录放入CSV写线程的队列"""
+        self.manifest.write([url, filepath, datetime.now().isoformat()])
 
 
 if __name__ == "__main__":
@@ -322,6 +708,15 @@ if __name__ == "__main__":
     max_pages = 101000  
     save_dir = "d:/SearchEngine/PagesData"  # 使用原始字符串
     max_workers = 10  # 设置工作线程数
+    state_db = "d:/SearchEngine/crawl_state.db"  # 爬取状态，用于断点续爬
+    page_store_dir = None  # 设为目录（如"d:/SearchEngine/PageStore"）时页面写入分段压缩存储
+    parse_processes = 4  # 链接解析进程数
+    recrawl = False  # 设为True时对已爬取的网站做增量重爬
+    metrics_port = 9108  # 指标服务端口，http://127.0.0.1:9108/metrics
+    metrics_snapshot = "d:/SearchEngine/crawl_metrics.json"  # 定期写出的JSON指标快照
+    # 待爬取队列按OPIC链接重要性排序并按主机轮转，也可用PriorityFrontier("depth")按广度优先
+    frontier = PriorityFrontier("opic")
+    seed_sitemaps = True  # 从robots.txt声明的sitemap补充待爬取URL
     
     # 添加版权声明
     print("=" * 70)
@@ -330,13 +725,19 @@ if __name__ == "__main__":
     print(f"工作线程数: {max_workers}")
     print("=" * 70)
     
-    crawler = WebCrawler(start_url, max_pages, save_dir, max_workers)
+    page_store = PageStore(page_store_dir) if page_store_dir else None
+    crawler = WebCrawler(start_url, max_pages, save_dir, max_workers, state_db=state_db,
+                         resume=not recrawl, recrawl=recrawl, page_store=page_store,
+                         parse_processes=parse_processes, metrics_port=metrics_port,
+                         metrics_snapshot=metrics_snapshot, frontier=frontier,
+                         seed_sitemaps=seed_sitemaps)
     
     try:
         crawler.crawl()
     except KeyboardInterrupt:
         print("\n用户中断爬取，正在保存进度...")
     finally:
+        # crawl()结束前已保存进度并关闭页面存储，这里只输出统计
         print(f"已爬取页面数: {crawler.crawled_count}")
         print(f"待爬取URL数: {crawler.to_visit_queue.qsize()}")
         print(f"CSV文件位置: {crawler.csv_file}")